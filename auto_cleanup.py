@@ -6,13 +6,16 @@ cleanliness and avoid cluttering the chat history.
 """
 
 import os
+import json
 import logging
+import threading
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Tuple
 
 try:
-    from telegram import Bot
-    from telegram.error import TelegramError, BadRequest, Unauthorized
+    from telegram.error import BadRequest, InvalidToken
 except ImportError:
     import subprocess
     import sys
@@ -24,15 +27,16 @@ except ImportError:
         # Install the specific version
         subprocess.check_call([sys.executable, "-m", "pip", "install", "python-telegram-bot==13.7"])
         # Now import again
-        from telegram import Bot
-        from telegram.error import TelegramError, BadRequest, Unauthorized
+        from telegram.error import BadRequest, InvalidToken
         logging.info("Successfully installed and imported python-telegram-bot v13.7")
     except Exception as e:
         logging.error(f"Failed to install python-telegram-bot: {e}")
         raise
 
-from database import get_data, get_all_chat_ids
-from config import TELEGRAM_TOKEN, CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP
+from send_queue import QueuedBot, submit
+import message_ledger
+import cleanup_planner
+from config import TELEGRAM_TOKEN, CLEANUP_CHAT_WORKERS, CLEANUP_BATCH, CLEANUP_CHECKPOINT_FILE
 
 # Set up logging
 logging.basicConfig(
@@ -46,91 +50,211 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def clean_old_messages(bot_token, default_days_old=7):
+# A run cleans CLEANUP_CHAT_WORKERS chats at a time; their deletions share
+# the outbound queue's rate limits in the 'maintenance' class. After every
+# batch the run's progress is written to CLEANUP_CHECKPOINT_FILE: per chat,
+# the day bucket being cleaned and the highest message ID deleted from it.
+# A run that finds the file resumes from there and merges its counters; a
+# run that completes removes it.
+_checkpoint_lock = threading.Lock()
+_bulk_delete = True  # Cleared if the API server doesn't know deleteMessages
+_slice_lock = threading.Lock()  # Held by the scheduled slice that is running
+_bots = {}  # Token -> QueuedBot, for runs not given the running bot
+_bots_lock = threading.Lock()
+
+def _get_bot(bot_token: str) -> QueuedBot:
+    """Get the cached bot for a token, creating it on first use"""
+    with _bots_lock:
+        bot = _bots.get(bot_token)
+        if bot is None:
+            bot = _bots[bot_token] = QueuedBot(token=bot_token)
+        return bot
+
+def _load_checkpoint() -> Dict:
+    """Get the progress of an interrupted run, or a fresh checkpoint"""
+    try:
+        with open(CLEANUP_CHECKPOINT_FILE, 'r', encoding='utf-8') as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return {'started': time.time(), 'chats': {}}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable cleanup checkpoint: {e}")
+        return {'started': time.time(), 'chats': {}}
+    logger.info(f"Resuming the cleanup run started {datetime.fromtimestamp(checkpoint['started'])}")
+    return checkpoint
+
+def _save_checkpoint(checkpoint: Dict) -> None:
+    """Atomically write the checkpoint (caller holds _checkpoint_lock)"""
+    with open(CLEANUP_CHECKPOINT_FILE + ".tmp", 'w', encoding='utf-8') as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(CLEANUP_CHECKPOINT_FILE + ".tmp", CLEANUP_CHECKPOINT_FILE)
+
+def _delete_batch(bot, chat_id: int, message_ids: List[int]) -> Tuple[int, int, int]:
+    """Delete a batch of messages, returning (deleted, failed, API calls)
+    
+    deleteMessages skips messages it can't delete, so a bulk call counts
+    its whole batch as deleted unless the call itself is rejected.
+    """
+    global _bulk_delete
+    if _bulk_delete and len(message_ids) > 1:
+        try:
+            submit(bot.raw('delete_messages'), 'delete', 'maintenance', chat_id=chat_id, message_ids=message_ids).result()
+            return len(message_ids), 0, 1
+        except InvalidToken:
+            # What python-telegram-bot raises for a 404: the server predates deleteMessages
+            logger.warning("deleteMessages is not available, deleting messages one at a time")
+            _bulk_delete = False
+        except BadRequest as e:
+            logger.debug(f"Couldn't delete {len(message_ids)} messages in chat {chat_id}: {e}")
+            return 0, len(message_ids), 1
+    
+    delete = bot.raw('delete_message')
+    futures = [submit(delete, 'delete', 'maintenance', chat_id=chat_id, message_id=message_id) for message_id in message_ids]
+    deleted = 0
+    for message_id, future in zip(message_ids, futures):
+        try:
+            future.result()
+            deleted += 1
+        except BadRequest as e:
+            # Message may already be deleted or too old
+            logger.debug(f"Couldn't delete message {message_id} in chat {chat_id}: {e}")
+    return deleted, len(message_ids) - deleted, len(message_ids)
+
+def _take_budget(budget: Dict, calls: int) -> bool:
+    """Reserve API calls from a run's budget, returning whether they fit"""
+    with _checkpoint_lock:
+        if budget['calls'] is None:
+            return True
+        if budget['calls'] < calls:
+            budget['exhausted'] = True
+            return False
+        budget['calls'] -= calls
+        return True
+
+def _clean_chat(bot, chat_id: int, days: List[str], checkpoint: Dict, budget: Dict) -> Dict:
+    """Delete the messages of a chat's expired day buckets, checkpointing after every batch
+    
+    Stops early, leaving the rest for a later run, once the run's call budget is spent.
+    """
+    with _checkpoint_lock:
+        progress = checkpoint['chats'].setdefault(str(chat_id), {
+            'deleted': 0, 'failed': 0, 'calls': 0, 'seconds': 0.0, 'day': None, 'last_id': 0,
+        })
+    started = time.monotonic()
+    try:
+        for day in days:
+            message_ids = sorted(message_id for message_id, timestamp in message_ledger.load_bucket(chat_id, day))
+            if progress['day'] == day:
+                message_ids = [message_id for message_id in message_ids if message_id > progress['last_id']]
+            
+            for start in range(0, len(message_ids), CLEANUP_BATCH):
+                batch = message_ids[start:start + CLEANUP_BATCH]
+                if not _take_budget(budget, 1 if _bulk_delete and len(batch) > 1 else len(batch)):
+                    return progress
+                deleted, failed, calls = _delete_batch(bot, chat_id, batch)
+                with _checkpoint_lock:
+                    progress['deleted'] += deleted
+                    progress['failed'] += failed
+                    progress['calls'] += calls
+                    progress['day'] = day
+                    progress['last_id'] = batch[-1]
+                    _save_checkpoint(checkpoint)
+            
+            # Deleted or not, these messages are done with
+            message_ledger.drop_bucket(chat_id, day)
+    finally:
+        with _checkpoint_lock:
+            progress['seconds'] += time.monotonic() - started
+    return progress
+
+def clean_old_messages(bot_token, default_days_old=7, max_calls=None, plan=None, bot=None) -> Dict[str, Dict]:
     """
     Clean up old bot messages from group chats
     
     Args:
         bot_token (str): The Telegram bot token
         default_days_old (int): Default number of days for chats without settings
+        max_calls (int): API calls this run may make; the rest is left for the next run
+        plan (dict): A plan from cleanup_planner.plan_cleanup, made here if not given
+        bot (QueuedBot): The running bot to delete with; a cached one for bot_token if not given
+    
+    Returns:
+        dict: Counters per cleaned chat ID (deleted, failed, calls, seconds)
     """
-    bot = Bot(token=bot_token)
-    data = get_data()
-    chat_ids = get_all_chat_ids()
+    if bot is None:
+        bot = _get_bot(bot_token)
+    checkpoint = _load_checkpoint()
+    budget = {'calls': max_calls, 'exhausted': False}
     
     logger.info(f"Starting automatic cleanup with default setting of {default_days_old} days")
     
-    # Only clean group chats
-    group_count = 0
-    message_count = 0
-    failed_count = 0
-    skipped_count = 0
+    if plan is None:
+        plan = cleanup_planner.plan_cleanup(default_days_old)
+    group_count = plan['groups']
+    skipped_count = plan['skipped']
+    work = {chat_id: chat_plan['days'] for chat_id, chat_plan in plan['chats'].items()}
+    
+    logger.info(
+        f"Cleaning {len(work)} of {group_count} groups, {CLEANUP_CHAT_WORKERS} at a time: "
+        f"{plan['messages']} messages in about {plan['calls']} calls"
+        + (f", at most {max_calls} this run" if max_calls is not None else "")
+    )
     
-    for chat_id_str in chat_ids:
+    interrupted = 0
+    with ThreadPoolExecutor(max_workers=CLEANUP_CHAT_WORKERS, thread_name_prefix="cleanup") as executor:
+        futures = {executor.submit(_clean_chat, bot, chat_id, days, checkpoint, budget): chat_id for chat_id, days in work.items()}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                # Its checkpoint stays, so the next run picks the chat up again
+                logger.error(f"Error cleaning chat {futures[future]}: {e}")
+                interrupted += 1
+    
+    # Per-chat throughput and errors, including any earlier interrupted runs
+    report = checkpoint['chats']
+    for chat_id, progress in report.items():
+        rate = progress['deleted'] / progress['seconds'] if progress['seconds'] else 0.0
+        logger.info(
+            f"Chat {chat_id}: {progress['deleted']} deleted, {progress['failed']} failed, "
+            f"{progress['calls']} calls in {progress['seconds']:.1f}s ({rate:.1f} messages/s)"
+        )
+    message_count = sum(progress['deleted'] for progress in report.values())
+    failed_count = sum(progress['failed'] for progress in report.values())
+    
+    if interrupted:
+        logger.warning(f"{interrupted} chats were interrupted; the next run resumes them")
+    elif budget['exhausted']:
+        logger.info("Call budget spent; the next run continues from the checkpoint")
+    else:
         try:
-            chat_id = int(chat_id_str)
-            chat_data = data.get(chat_id_str, {})
-            
-            # Skip non-group chats
-            chat_type = chat_data.get('type')
-            if chat_type not in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]:
-                continue
-            
-            # Check chat settings for auto-clean preference
-            settings = chat_data.get('settings', {})
-            auto_clean_enabled = settings.get('auto_clean', True)
-            
-            # Skip chats where auto_clean is disabled
-            if not auto_clean_enabled:
-                logger.info(f"Skipping chat {chat_id} - auto-clean disabled in settings")
-                skipped_count += 1
-                continue
-            
-            # Get the auto_clean_days setting or use default
-            days_old = settings.get('auto_clean_days', default_days_old)
-            
-            # Calculate cutoff date for this specific chat
-            cutoff_time = datetime.now() - timedelta(days=days_old)
-            cutoff_timestamp = cutoff_time.timestamp()
-            
-            group_count += 1
-            logger.info(f"Cleaning chat {chat_id} with {days_old} days threshold")
-            
-            # Check if we have message records for this chat
-            if 'bot_messages' in chat_data:
-                # List of message IDs that were successfully cleaned
-                cleaned_messages = []
-                
-                for msg_id, msg_data in chat_data['bot_messages'].items():
-                    # Check if message is older than the cutoff date
-                    msg_time = msg_data.get('timestamp', 0)
-                    if msg_time < cutoff_timestamp:
-                        try:
-                            # Try to delete the message
-                            bot.delete_message(chat_id=chat_id, message_id=int(msg_id))
-                            cleaned_messages.append(msg_id)
-                            message_count += 1
-                            
-                            # Add a small delay to avoid hitting rate limits
-                            time.sleep(0.1)
-                        except (BadRequest, TelegramError) as e:
-                            # Message may already be deleted or too old
-                            cleaned_messages.append(msg_id)
-                            logger.debug(f"Couldn't delete message {msg_id} in chat {chat_id}: {e}")
-                            failed_count += 1
-                
-                # Remove deleted messages from the record
-                for msg_id in cleaned_messages:
-                    chat_data['bot_messages'].pop(msg_id, None)
-                
-                # Log the cleanup
-                if cleaned_messages:
-                    logger.info(f"Cleaned up {len(cleaned_messages)} messages in chat {chat_id}")
-        
-        except Exception as e:
-            logger.error(f"Error cleaning chat {chat_id_str}: {e}")
+            os.remove(CLEANUP_CHECKPOINT_FILE)
+        except FileNotFoundError:
+            pass
     
     logger.info(f"Auto-cleanup complete. Processed {group_count} groups, cleaned {message_count} messages, {failed_count} failed, {skipped_count} skipped")
+    return report
+
+def run_cleanup_slice(bot_token, default_days_old=7, bot=None) -> None:
+    """Run one scheduled slice: today's remaining cleanup work spread over the slices left"""
+    if not _slice_lock.acquire(blocking=False):
+        logger.info("Previous cleanup slice still running, skipping this one")
+        return
+    try:
+        plan = cleanup_planner.plan_cleanup(default_days_old)
+        budget = cleanup_planner.slice_budget(plan)
+        if not budget:
+            logger.debug("No messages due for cleanup")
+            return
+        logger.info(
+            f"Cleanup slice: {budget} of {plan['calls']} calls due, "
+            f"{cleanup_planner.slices_left()} slices left today"
+        )
+        clean_old_messages(bot_token, default_days_old, max_calls=budget, plan=plan, bot=bot)
+    finally:
+        _slice_lock.release()
 
 def main():
     """Run the cleanup process"""
@@ -4,15 +4,19 @@ import os
 import signal
 import sys
 import subprocess
+import threading
 from datetime import datetime
+from queue import Queue
 
 # Ensure we have the right python-telegram-bot version
 try:
     from telegram.ext import (
         Updater,
+        JobQueue,
         CommandHandler,
         MessageHandler,
         CallbackQueryHandler,
+        ChatMemberHandler,
         Filters,
         CallbackContext
     )
@@ -30,9 +34,11 @@ except ImportError:
         # Now import again
         from telegram.ext import (
             Updater,
+            JobQueue,
             CommandHandler,
             MessageHandler,
             CallbackQueryHandler,
+            ChatMemberHandler,
             Filters,
             CallbackContext
         )
@@ -43,7 +49,10 @@ except ImportError:
     except Exception as e:
         logging.error(f"Failed to install python-telegram-bot: {e}")
         raise
-from config import TELEGRAM_TOKEN, COMMANDS, DEVELOPER_COMMANDS, REMINDER_CHECK_INTERVAL
+from telegram.utils.request import Request
+from config import (TELEGRAM_TOKEN, COMMANDS, DEVELOPER_COMMANDS, REMINDER_CHECK_INTERVAL, ARCHIVE_INTERVAL,
+                    SEND_WORKERS, UPDATE_WORKERS, REMINDER_DIGEST_WINDOW, REMINDER_DIGEST_MAX,
+                    REMINDER_CATCHUP_BURST, REMINDER_CATCHUP_RATE, REMINDER_STALE_AFTER)
 from handlers import (
     start_handler,
     help_handler,
@@ -68,12 +77,26 @@ from handlers import (
     broadcast_handler,
     groupcast_handler,
     delete_broadcast_handler,
+    pause_broadcast_handler,
+    resume_broadcast_handler,
+    cancel_broadcast_handler,
+    jobs_handler,
     adddev_handler,
     stats_handler,
     maintenance_handler,
-    debug_handler
+    debug_handler,
+    my_chat_member_handler,
+    chat_migration_handler
 )
-from database import initialize_database, save_data
+from database import initialize_database, flush, get_task, mark_reminded, archive_tasks
+from keyboards import get_reminder_digest_keyboard
+import reminder_scheduler
+import send_queue
+import update_pool
+import broadcast_jobs
+import chat_registry
+import outbox
+import message_ledger
 
 # Set up more detailed logging
 logging.basicConfig(
@@ -95,7 +118,8 @@ def signal_handler(sig, frame):
     logger.info("Received shutdown signal, saving data and exiting gracefully...")
     # Perform any necessary cleanup
     try:
-        save_data()
+        # Force out anything still waiting for the next flush window
+        flush()
         logger.info("Data saved successfully")
     except Exception as e:
         logger.error(f"Error saving data during shutdown: {e}")
@@ -107,44 +131,190 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
+# The single pending run of check_reminders and the time it is due
+_reminder_job = None
+_reminder_job_due = None
+_reminder_job_lock = threading.Lock()
+
+def arm_reminder_job(job_queue, due_time):
+    """Make sure check_reminders runs by due_time, replacing a later pending run"""
+    global _reminder_job, _reminder_job_due
+    if due_time is None:
+        return
+    # Sleep until the next reminder, but never longer than the check interval
+    due_time = min(due_time, time.time() + REMINDER_CHECK_INTERVAL)
+    with _reminder_job_lock:
+        if _reminder_job is not None and _reminder_job_due <= due_time:
+            return
+        if _reminder_job is not None:
+            _reminder_job.schedule_removal()
+        _reminder_job = job_queue.run_once(check_reminders, max(0, due_time - time.time()))
+        _reminder_job_due = due_time
+
 def check_reminders(context: CallbackContext):
-    """Check for due reminders and send notifications"""
-    from database import get_data
-    data = get_data()
+    """Send notifications for the reminders that are due"""
+    global _reminder_job
+    with _reminder_job_lock:
+        _reminder_job = None
+    
     current_time = time.time()
     
-    reminders_to_send = []
+    # Only the reminders that came due are popped off the scheduler, plus the
+    # ones about to come due in the same chats so they share a digest
+    reminders_to_send = take_due_reminders(current_time, REMINDER_DIGEST_WINDOW)
+    
+    # Queue one message per chat (per REMINDER_DIGEST_MAX tasks); the outbound
+    # queue paces them and reports failures
+    for chat_id, tasks in reminders_to_send.items():
+        for start in range(0, len(tasks), REMINDER_DIGEST_MAX):
+            send_reminders(context.bot, chat_id, tasks[start:start + REMINDER_DIGEST_MAX])
     
-    # Scan all users and groups for due reminders
-    for chat_id, chat_data in data.items():
-        if 'tasks' not in chat_data:
+    arm_reminder_job(context.job_queue, reminder_scheduler.next_due() or current_time + REMINDER_CHECK_INTERVAL)
+    
+
+# Reminders taken for sending whose delivery Telegram hasn't confirmed yet, as
+# (chat ID, task ID) -> the task's reminder time when it was sent. Once
+# Telegram confirmed, the task is marked reminded only if its reminder is
+# still that time. A task rescheduled meanwhile gets its new reminder sent
+# after the old one is final, so two reminders of a task are never in flight.
+_unconfirmed_reminders = {}
+_unconfirmed_lock = threading.Lock()
+
+def take_due_reminders(now, window=0):
+    """Pop the due reminders off the scheduler and claim the ones still to send, as chat ID -> tasks"""
+    reminders = {}
+    for chat_id, task_id in reminder_scheduler.pop_due(now, window):
+        task = get_task(chat_id, task_id)
+        if task is None or not task.get('active', True) or task.get('reminded', False):
             continue
-            
-        for task_id, task in enumerate(chat_data['tasks']):
-            if not task.get('active', True):
-                continue
-                
-            reminder = task.get('reminder')
-            if reminder and reminder <= current_time and not task.get('reminded', False):
-                reminders_to_send.append((chat_id, task_id, task))
-                # Mark as reminded to avoid duplicate reminders
-                task['reminded'] = True
+        if not chat_registry.is_alive(chat_id):
+            # Left unsent; chat_registry.mark_alive reschedules it if the chat comes back
+            continue
+        with _unconfirmed_lock:
+            in_flight = (chat_id, task_id) in _unconfirmed_reminders
+            if in_flight:
+                rescheduled = _unconfirmed_reminders[(chat_id, task_id)] != task.get('reminder')
+            else:
+                _unconfirmed_reminders[(chat_id, task_id)] = task.get('reminder')
+        if in_flight:
+            if rescheduled:
+                # An older reminder of the task is still unconfirmed; try again later
+                reminder_scheduler.schedule(chat_id, task_id, now + REMINDER_CHECK_INTERVAL)
+            continue
+        reminders.setdefault(chat_id, []).append(task)
+    return reminders
+
+def send_reminders(bot, chat_id, tasks, missed=False):
+    """Queue a reminder message for one task, or a digest with buttons for several
     
-    # Send reminders
-    for chat_id, task_id, task in reminders_to_send:
-        try:
-            context.bot.send_message(
-                chat_id=int(chat_id),
-                text=f"⏰ *Reminder*: {task['text']}",
-                parse_mode="Markdown"
-            )
-            logger.debug(f"Sent reminder for task {task_id} to chat {chat_id}")
-        except Exception as e:
-            logger.error(f"Failed to send reminder: {e}")
+    Missed reminders, which came due long before they could be sent, always
+    get the digest form so their buttons are there to act on them.
+    """
+    if missed:
+        text = f"🕒 *Missed reminders* ({len(tasks)}) while I was offline:\n\n" + "\n".join(
+            f"{i+1}. {task['text']}" for i, task in enumerate(tasks)
+        )
+        reply_markup = InlineKeyboardMarkup(get_reminder_digest_keyboard(tasks))
+    elif len(tasks) == 1:
+        text = f"⏰ *Reminder*: {tasks[0]['text']}"
+        reply_markup = None
+    else:
+        text = f"⏰ *Reminders* ({len(tasks)} due)\n\n" + "\n".join(
+            f"{i+1}. {task['text']}" for i, task in enumerate(tasks)
+        )
+        reply_markup = InlineKeyboardMarkup(get_reminder_digest_keyboard(tasks))
+    # The outbox keeps the message through network outages and reports back
+    # to reminder_delivered once Telegram confirmed or rejected it
+    outbox.send(
+        'send_message',
+        priority='reminder',
+        purpose='reminder',
+        data={
+            'chat_id': str(chat_id),
+            'task_ids': [task['id'] for task in tasks],
+            'reminders': [task.get('reminder') for task in tasks],
+        },
+        chat_id=int(chat_id),
+        text=text,
+        parse_mode="Markdown",
+        reply_markup=reply_markup
+    )
+
+def reminder_delivered(entry, error):
+    """Mark the tasks of a reminder message as reminded once its send is final"""
+    chat_id = entry.data['chat_id']
+    if error is not None:
+        logger.error(f"Failed to send reminder to {chat_id}: {error}")
+    # Reminders for a chat the bot can no longer reach stay unreminded;
+    # chat_registry.mark_alive reschedules them if the chat comes back
+    sent = _sent_reminders(entry)
+    if error is None or chat_registry.is_alive(chat_id):
+        for task_id, reminder_time in sent:
+            # A task rescheduled since keeps its new reminder
+            mark_reminded(chat_id, task_id, reminder_time)
+    with _unconfirmed_lock:
+        for task_id in entry.data['task_ids']:
+            _unconfirmed_reminders.pop((chat_id, task_id), None)
+
+def _sent_reminders(entry):
+    """Get the (task ID, reminder time) pairs of a reminder message
+    
+    Entries queued before reminder times were recorded give None, which
+    marks the task reminded whatever its reminder is now.
+    """
+    task_ids = entry.data['task_ids']
+    return list(zip(task_ids, entry.data.get('reminders') or [None] * len(task_ids)))
+
+def claim_outbox_reminders():
+    """Claim the reminders still in the outbox from a previous run so they are not taken again"""
+    with _unconfirmed_lock:
+        for entry in outbox.pending('reminder'):
+            for task_id, reminder_time in _sent_reminders(entry):
+                if reminder_time is None:
+                    task = get_task(entry.data['chat_id'], task_id)
+                    reminder_time = task.get('reminder') if task is not None else None
+                _unconfirmed_reminders[(entry.data['chat_id'], task_id)] = reminder_time
+
+def start_reminder_catchup(bot):
+    """Take the reminders that came due while the bot was down and deliver them in the background
+    
+    Chats are served oldest reminder first: REMINDER_CATCHUP_BURST of them
+    right away, then REMINDER_CATCHUP_RATE per second, so a restart after an
+    outage doesn't flood the outbound queue ahead of live traffic.
+    """
+    now = time.time()
+    overdue = take_due_reminders(now)  # Chat ID -> tasks, earliest first
+    if not overdue:
+        return
     
-    # Save changes to data
-    if reminders_to_send:
-        save_data(data)
+    logger.info(f"Catching up on {sum(len(tasks) for tasks in overdue.values())} overdue reminders in {len(overdue)} chats")
+    thread = threading.Thread(target=_catch_up_reminders, args=(bot, overdue, now), name="reminder-catchup", daemon=True)
+    thread.start()
+
+def _catch_up_reminders(bot, overdue, now):
+    """Send the overdue reminders of each chat, paced by a token bucket"""
+    bucket = send_queue.TokenBucket(REMINDER_CATCHUP_RATE, REMINDER_CATCHUP_BURST)
+    for chat_id, tasks in overdue.items():
+        wait = bucket.wait_time(time.monotonic())
+        while wait > 0:
+            time.sleep(wait)
+            wait = bucket.wait_time(time.monotonic())
+        bucket.take()
+        
+        # Reminders that are long overdue are collected into one missed digest
+        recent = [task for task in tasks if now - float(task['reminder']) < REMINDER_STALE_AFTER]
+        missed = [task for task in tasks if now - float(task['reminder']) >= REMINDER_STALE_AFTER]
+        for batch, is_missed in ((missed, True), (recent, False)):
+            for start in range(0, len(batch), REMINDER_DIGEST_MAX):
+                send_reminders(bot, chat_id, batch[start:start + REMINDER_DIGEST_MAX], missed=is_missed)
+    logger.info(f"Reminder catch-up finished for {len(overdue)} chats")
+
+def archive_tasks_job(context: CallbackContext):
+    """Move deleted and long-completed tasks into the per-chat archives"""
+    try:
+        archive_tasks()
+    except Exception as e:
+        logger.error(f"Error in task archive job: {e}")
 
 def setup_commands(updater):
     """Set up the bot commands that appear in the menu"""
@@ -179,9 +349,20 @@ def create_bot():
         raise ValueError("TELEGRAM_TOKEN environment variable is not set")
     
     # Initialize the bot and database
-    updater = Updater(token=TELEGRAM_TOKEN, use_context=True)
-    dispatcher = updater.dispatcher
+    # Every send, edit and delete goes through the rate-limited outbound queue,
+    # and updates are handled on a per-chat ordered worker pool
+    request = Request(con_pool_size=SEND_WORKERS + UPDATE_WORKERS + 8)
+    bot = send_queue.QueuedBot(TELEGRAM_TOKEN, request=request)
+    job_queue = JobQueue()
+    dispatcher = update_pool.PooledDispatcher(bot, Queue(), job_queue=job_queue, exception_event=threading.Event(), use_context=True)
+    job_queue.set_dispatcher(dispatcher)
+    updater = Updater(dispatcher=dispatcher, workers=None)
     initialize_database()
+    # Send errors and successes keep the chat liveness registry current
+    send_queue.set_result_listener(chat_registry.record_result)
+    # Every message sent to a group is recorded for cleanup
+    send_queue.set_sent_listener(message_ledger.record_sent)
+    broadcast_jobs.init(updater.bot, dispatcher.bot_data.setdefault('broadcasts', {}))
     
     try:
         # Try to use the improved command registration from commands.py
@@ -214,6 +395,10 @@ def create_bot():
             'broadcast': broadcast_handler,
             'groupcast': groupcast_handler,
             'delbroadcast': delete_broadcast_handler,
+            'pausebroadcast': pause_broadcast_handler,
+            'resumebroadcast': resume_broadcast_handler,
+            'cancelbroadcast': cancel_broadcast_handler,
+            'jobs': jobs_handler,
             'adddev': adddev_handler,
             'devstats': stats_handler,
             'maintenance': maintenance_handler,
@@ -250,6 +435,10 @@ def create_bot():
         dispatcher.add_handler(CommandHandler("broadcast", broadcast_handler))
         dispatcher.add_handler(CommandHandler("groupcast", groupcast_handler))
         dispatcher.add_handler(CommandHandler("delbroadcast", delete_broadcast_handler))
+        dispatcher.add_handler(CommandHandler("pausebroadcast", pause_broadcast_handler))
+        dispatcher.add_handler(CommandHandler("resumebroadcast", resume_broadcast_handler))
+        dispatcher.add_handler(CommandHandler("cancelbroadcast", cancel_broadcast_handler))
+        dispatcher.add_handler(CommandHandler("jobs", jobs_handler))
         dispatcher.add_handler(CommandHandler("adddev", adddev_handler))
         dispatcher.add_handler(CommandHandler("devstats", stats_handler))
         dispatcher.add_handler(CommandHandler("maintenance", maintenance_handler))
@@ -304,10 +493,7 @@ def create_bot():
                         parse_mode="Markdown"
                     )
                     
-                    # Wait a moment before sending a second message with quick tips
-                    import time
-                    time.sleep(1)
-                    
+                    # The outbound queue spaces out the second message with quick tips
                     context.bot.send_message(
                         chat_id=chat_id,
                         text=(
@@ -325,15 +511,32 @@ def create_bot():
     # Add handler for new members
     dispatcher.add_handler(MessageHandler(Filters.status_update.new_chat_members, new_chat_members_handler))
     
+    # Track chats the bot was removed from, and groups upgraded to supergroups
+    dispatcher.add_handler(ChatMemberHandler(my_chat_member_handler, ChatMemberHandler.MY_CHAT_MEMBER))
+    dispatcher.add_handler(MessageHandler(Filters.status_update.migrate, chat_migration_handler))
+    
     # Add general message handler (always needed)
     dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, text_message_handler))
     
     # Add error handler (always needed)
     dispatcher.add_error_handler(error_handler)
     
-    # Schedule the reminder check job
+    # Reminders still in the outbox from the last run are resent first, those
+    # missed during downtime go out through the paced catch-up, and the
+    # reminder job only sees what comes due from now on
+    outbox.register('reminder', reminder_delivered)
+    outbox.init(updater.bot)
+    claim_outbox_reminders()
+    start_reminder_catchup(updater.bot)
+    
+    # Schedule the reminder job for the earliest pending reminder and move it
+    # forward whenever an earlier one is set
     job_queue = updater.job_queue
-    job_queue.run_repeating(check_reminders, interval=REMINDER_CHECK_INTERVAL, first=10)
+    reminder_scheduler.set_listener(lambda due_time: arm_reminder_job(job_queue, due_time))
+    arm_reminder_job(job_queue, time.time() + 10)
+    
+    # Keep the hot task lists from growing without bound
+    job_queue.run_repeating(archive_tasks_job, interval=ARCHIVE_INTERVAL, first=300)
     
     # Setup commands in the bot menu
     setup_commands(updater)
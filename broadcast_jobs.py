@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import as_completed
+from datetime import datetime
+from typing import Dict, List, Optional
+from telegram import ParseMode
+import send_queue
+import chat_registry
+from config import BROADCAST_DIR, BROADCAST_BATCH
+
+logger = logging.getLogger(__name__)
+
+# Broadcasts are checkpointed under BROADCAST_DIR as <id>.json (message,
+# recipients, status) plus an append-only <id>.log. Each batch is logged as
+# attempted before it is sent and every result is logged after, so a restart
+# resumes after the last attempted batch. A chat attempted without a logged
+# result is counted as failed rather than sent twice.
+_jobs = {}  # Broadcast ID -> BroadcastJob
+_lock = threading.RLock()
+_bot = None
+_ledger = None  # bot_data['broadcasts'], which the deletion flows read
+
+class BroadcastJob:
+    """A broadcast to a fixed list of chats"""
+    
+    def __init__(self, broadcast_id: str, message: str, recipients: List[int], sender_id: int,
+                 status_chat_id: int = None, status_message_id: int = None, created: str = None,
+                 status: str = 'running'):
+        self.id = broadcast_id
+        self.message = message
+        self.recipients = recipients
+        self.sender_id = sender_id
+        self.status_chat_id = status_chat_id
+        self.status_message_id = status_message_id
+        self.created = created or datetime.now().isoformat()
+        self.status = status  # running, paused, cancelled or done
+        self.cursor = 0  # Recipients before this position have been attempted
+        self.sent = {}  # Chat ID -> message ID
+        self.failed = {}  # Chat ID -> error
+        self.thread = None
+    
+    def header(self) -> Dict:
+        return {
+            'id': self.id,
+            'message': self.message,
+            'recipients': self.recipients,
+            'sender_id': self.sender_id,
+            'status_chat_id': self.status_chat_id,
+            'status_message_id': self.status_message_id,
+            'created': self.created,
+            'status': self.status,
+        }
+    
+    def ledger_entry(self) -> Dict:
+        """Get the bot_data['broadcasts'] entry used to view and delete the broadcast"""
+        return {
+            'message': self.message,
+            'sent_messages': [{'chat_id': chat_id, 'message_id': message_id} for chat_id, message_id in self.sent.items()],
+            'timestamp': self.created,
+            'sender_id': self.sender_id,
+        }
+
+def _header_path(broadcast_id: str) -> str:
+    return os.path.join(BROADCAST_DIR, f"{broadcast_id}.json")
+
+def _log_path(broadcast_id: str) -> str:
+    return os.path.join(BROADCAST_DIR, f"{broadcast_id}.log")
+
+def _write_header(job: BroadcastJob) -> None:
+    """Atomically rewrite a job's header file"""
+    os.makedirs(BROADCAST_DIR, exist_ok=True)
+    path = _header_path(job.id)
+    with open(path + ".tmp", 'w', encoding='utf-8') as file:
+        json.dump(job.header(), file, ensure_ascii=False)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+def _append_log(job: BroadcastJob, records: List[Dict]) -> None:
+    """Durably append checkpoint records to a job's log"""
+    lines = [json.dumps(record, separators=(',', ':')) for record in records]
+    with open(_log_path(job.id), 'a', encoding='utf-8') as file:
+        file.write("\n".join(lines) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+def _load(broadcast_id: str) -> Optional[BroadcastJob]:
+    """Rebuild a job from its header and checkpoint log"""
+    try:
+        with open(_header_path(broadcast_id), 'r', encoding='utf-8') as file:
+            header = json.load(file)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not load broadcast {broadcast_id}: {e}")
+        return None
+    job = BroadcastJob(
+        header['id'], header['message'], header['recipients'], header.get('sender_id'),
+        header.get('status_chat_id'), header.get('status_message_id'), header.get('created'),
+        header.get('status', 'running'),
+    )
+    
+    in_doubt = set()
+    if os.path.exists(_log_path(broadcast_id)):
+        with open(_log_path(broadcast_id), 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line from a crash
+                if 'a' in record:
+                    in_doubt.update(job.recipients[job.cursor:job.cursor + record['a']])
+                    job.cursor += record['a']
+                elif 's' in record:
+                    job.sent[record['s']] = record['m']
+                    in_doubt.discard(record['s'])
+                elif 'f' in record:
+                    job.failed[record['f']] = record.get('e', '')
+                    in_doubt.discard(record['f'])
+    for chat_id in in_doubt:
+        job.failed[chat_id] = 'interrupted'
+    return job
+
+def format_status(job: BroadcastJob) -> str:
+    """Get the progress text shown in the broadcast's status message"""
+    counts = f"Sent: {len(job.sent)}\nFailed: {len(job.failed)}"
+    if job.status == 'running':
+        return (f"📣 Broadcasting message to {len(job.recipients)} chats...\n{counts}\n\n"
+                f"Broadcast ID: `{job.id}`\n"
+                f"Use /pausebroadcast {job.id} or /cancelbroadcast {job.id} to stop it.")
+    if job.status == 'paused':
+        return (f"⏸️ Broadcast paused after {job.cursor} of {len(job.recipients)} chats.\n{counts}\n\n"
+                f"Use /resumebroadcast {job.id} to continue.")
+    if job.status == 'cancelled':
+        return (f"⏹️ Broadcast cancelled after {job.cursor} of {len(job.recipients)} chats.\n{counts}\n\n"
+                f"Use /delbroadcast {job.id} to delete what was sent.")
+    return (f"📣 Broadcast complete!\n{counts}\n\n"
+            f"Broadcast ID: `{job.id}`\n"
+            f"Use /delbroadcast {job.id} to delete this announcement from all chats.")
+
+def _report(job: BroadcastJob) -> None:
+    """Edit the broadcast's status message with its current progress"""
+    if job.status_chat_id is None or job.status_message_id is None:
+        return
+    try:
+        _bot.edit_message_text(
+            text=format_status(job),
+            chat_id=job.status_chat_id,
+            message_id=job.status_message_id,
+            parse_mode=ParseMode.MARKDOWN
+        )
+    except Exception as e:
+        logger.debug(f"Could not update status of broadcast {job.id}: {e}")
+
+def _run(job: BroadcastJob) -> None:
+    """Send the remaining batches of a job until it finishes, is paused or is cancelled"""
+    while True:
+        _send_batches(job)
+        with _lock:
+            if _jobs.get(job.id) is not job:
+                return  # Forgotten
+            _write_header(job)
+            # set_status doesn't start a thread while this one is alive, so a
+            # resume that came in while we were stopping is ours to carry on
+            if job.status == 'running':
+                continue
+            job.thread = None
+        break
+    _report(job)
+    logger.info(f"Broadcast {job.id} {job.status}: {len(job.sent)} sent, {len(job.failed)} failed")
+
+def _send_batches(job: BroadcastJob) -> None:
+    """Send batches while the job is running, pausing it if sending fails"""
+    send = _bot.raw('send_message')
+    text = f"📣 *Announcement*\n\n{job.message}"
+    try:
+        while True:
+            with _lock:
+                if job.status == 'running' and job.cursor >= len(job.recipients):
+                    job.status = 'done'
+                if job.status != 'running':
+                    return
+                batch = job.recipients[job.cursor:job.cursor + BROADCAST_BATCH]
+                _append_log(job, [{'a': len(batch)}])
+                job.cursor += len(batch)
+            
+            # Chats found dead since the broadcast started are not tried
+            records = []
+            for chat_id in batch:
+                if not chat_registry.is_alive(chat_id):
+                    job.failed[chat_id] = 'unreachable'
+                    records.append({'f': chat_id, 'e': 'unreachable'})
+            futures = {
+                send_queue.submit(send, priority='broadcast', chat_id=chat_id, text=text, parse_mode=ParseMode.MARKDOWN): chat_id
+                for chat_id in batch if chat_id not in job.failed
+            }
+            for future in as_completed(futures):
+                chat_id = futures[future]
+                try:
+                    message_id = future.result().message_id
+                    job.sent[chat_id] = message_id
+                    records.append({'s': chat_id, 'm': message_id})
+                    entry = _ledger.get(job.id) if _ledger is not None else None
+                    if entry is not None:
+                        entry['sent_messages'].append({'chat_id': chat_id, 'message_id': message_id})
+                except Exception as e:
+                    logger.error(f"Failed to send broadcast to {chat_id}: {e}")
+                    job.failed[chat_id] = str(e)
+                    records.append({'f': chat_id, 'e': str(e)})
+            with _lock:
+                if _jobs.get(job.id) is not job:
+                    return  # Forgotten mid-batch
+                _append_log(job, records)
+            _report(job)
+    except Exception as e:
+        logger.error(f"Broadcast {job.id} stopped: {e}")
+        with _lock:
+            job.status = 'paused'
+
+def _start_thread(job: BroadcastJob) -> None:
+    """Run a job in the background unless it is already running (caller holds _lock)"""
+    if job.thread is not None and job.thread.is_alive():
+        return
+    job.thread = threading.Thread(target=_run, args=(job,), name=f"broadcast-{job.id}", daemon=True)
+    job.thread.start()
+
+def init(bot, ledger: Dict) -> None:
+    """Load persisted broadcasts into the ledger and resume the ones still running"""
+    global _bot, _ledger
+    _bot = bot
+    _ledger = ledger
+    if not os.path.isdir(BROADCAST_DIR):
+        return
+    resumed = 0
+    with _lock:
+        for file_name in sorted(os.listdir(BROADCAST_DIR)):
+            if not file_name.endswith('.json'):
+                continue
+            job = _load(file_name[:-len('.json')])
+            if job is None:
+                continue
+            _jobs[job.id] = job
+            ledger[job.id] = job.ledger_entry()
+            if job.status == 'running':
+                _start_thread(job)
+                resumed += 1
+    logger.info(f"Loaded {len(_jobs)} broadcasts, resumed {resumed}")
+
+def start(broadcast_id: str, message: str, recipients: List[int], sender_id: int,
+          status_chat_id: int = None, status_message_id: int = None) -> BroadcastJob:
+    """Persist a new broadcast and start sending it in the background"""
+    job = BroadcastJob(broadcast_id, message, recipients, sender_id, status_chat_id, status_message_id)
+    with _lock:
+        _write_header(job)
+        _jobs[job.id] = job
+        if _ledger is not None:
+            _ledger[job.id] = job.ledger_entry()
+        _start_thread(job)
+    return job
+
+def get_job(broadcast_id: str) -> Optional[BroadcastJob]:
+    """Get a broadcast job by ID"""
+    return _jobs.get(broadcast_id)
+
+def unfinished_jobs() -> List[BroadcastJob]:
+    """Get the jobs that are running or paused"""
+    return [job for job in _jobs.values() if job.status in ('running', 'paused')]
+
+def set_status(broadcast_id: str, status: str) -> Optional[BroadcastJob]:
+    """Pause, resume or cancel a job, returning it or None if it does not exist or already ended"""
+    with _lock:
+        job = _jobs.get(broadcast_id)
+        if job is None or job.status in ('cancelled', 'done'):
+            return None
+        job.status = status
+        _write_header(job)
+        if status == 'running':
+            _start_thread(job)
+    # A running job reports the change itself when its current batch ends
+    if job.thread is None or not job.thread.is_alive():
+        _report(job)
+    return job
+
+def forget(broadcast_id: str) -> Optional[BroadcastJob]:
+    """Stop a broadcast and delete its checkpoint files, returning its job if it had one
+    
+    A batch already in flight is still sent, but no longer recorded in the
+    ledger entry; join the job to have all of it in the job's `sent`.
+    """
+    with _lock:
+        job = _jobs.pop(broadcast_id, None)
+        if job is not None:
+            job.status = 'cancelled'
+        for path in (_header_path(broadcast_id), _log_path(broadcast_id)):
+            if os.path.exists(path):
+                os.remove(path)
+    return job
+
+def join(job: BroadcastJob) -> None:
+    """Wait until a stopped job has sent its batch in flight"""
+    thread = job.thread
+    if thread is not None and thread is not threading.current_thread():
+        thread.join()
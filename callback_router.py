@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from telegram import Update
+from telegram.ext import CallbackContext
+
+logger = logging.getLogger(__name__)
+
+# Button callback data is either a bare name ("list_tasks") or a name and a
+# payload ("done:<task_id>"). Exact routes are keyed by the whole data and
+# prefix routes by the name before the first ':', so dispatching is two dict
+# lookups however many routes there are. A prefix route's payload is split
+# into one argument per declared type, the last argument taking the rest.
+_exact = {}  # Callback data -> Route
+_prefixed = {}  # Name -> Route
+_lock = threading.Lock()  # Guards the timing counters
+
+class OutdatedButton(ValueError):
+    """Raised by an argument type for data from buttons that predate its format; the message is shown to the user"""
+
+class Route:
+    """A callback handler and its timing counters"""
+    
+    def __init__(self, pattern: str, handler: Callable, types: Tuple[Callable, ...]):
+        self.pattern = pattern
+        self.handler = handler
+        self.types = types
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+    
+    def decode(self, payload: str) -> List[Any]:
+        """Split a payload into the handler's arguments, raising ValueError if it doesn't fit"""
+        parts = payload.split(':', len(self.types) - 1)
+        if len(parts) != len(self.types):
+            raise ValueError(f"{self.pattern} expects {len(self.types)} arguments, got {len(parts)}")
+        return [arg_type(part) for arg_type, part in zip(self.types, parts)]
+
+def route(pattern: str, *types: Callable) -> Callable:
+    """Register the decorated function as the handler of callback data matching pattern
+    
+    A pattern ending in ':' is a prefix; its handler is called with
+    (update, context, *args), decoding the payload with `types` (str if none
+    are given). Any other pattern must match the data exactly and its handler
+    gets (update, context).
+    """
+    def decorator(handler: Callable) -> Callable:
+        if pattern.endswith(':'):
+            name = pattern[:-1]
+            if name in _prefixed:
+                raise ValueError(f"Duplicate callback route: {pattern}")
+            _prefixed[name] = Route(pattern, handler, types or (str,))
+        else:
+            if pattern in _exact:
+                raise ValueError(f"Duplicate callback route: {pattern}")
+            _exact[pattern] = Route(pattern, handler, ())
+        return handler
+    return decorator
+
+def resolve(data: str) -> Tuple[Optional[Route], List[Any]]:
+    """Find the route of callback data and decode its arguments, or (None, [])"""
+    matched = _exact.get(data)
+    if matched is not None:
+        return matched, []
+    name, separator, payload = data.partition(':')
+    matched = _prefixed.get(name) if separator else None
+    if matched is None:
+        return None, []
+    return matched, matched.decode(payload)
+
+def dispatch(update: Update, context: CallbackContext) -> bool:
+    """Run the handler of a callback query, returning whether one matched"""
+    data = update.callback_query.data or ''
+    try:
+        matched, args = resolve(data)
+    except OutdatedButton as e:
+        # Running it could act on the wrong item, so ask for a fresh keyboard instead
+        logger.info(f"Outdated callback data {data!r}")
+        update.callback_query.edit_message_text(str(e))
+        return False
+    except ValueError as e:
+        logger.warning(f"Malformed callback data {data!r}: {e}")
+        return False
+    if matched is None:
+        logger.warning(f"No handler for callback data {data!r}")
+        return False
+    
+    started = time.perf_counter()
+    failed = False
+    try:
+        matched.handler(update, context, *args)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            matched.calls += 1
+            matched.errors += failed
+            matched.total_time += elapsed
+            matched.max_time = max(matched.max_time, elapsed)
+    return True
+
+def stats() -> List[Dict[str, Any]]:
+    """Get the counters of every route that was used, the most time-consuming first"""
+    with _lock:
+        used = [
+            {
+                'pattern': registered.pattern,
+                'calls': registered.calls,
+                'errors': registered.errors,
+                'avg_time': registered.total_time / registered.calls,
+                'max_time': registered.max_time,
+                'total_time': registered.total_time,
+            }
+            for registered in list(_exact.values()) + list(_prefixed.values()) if registered.calls
+        ]
+    return sorted(used, key=lambda counters: -counters['total_time'])
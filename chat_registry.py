@@ -0,0 +1,79 @@
+import logging
+from typing import Dict, Iterable, List, Optional
+from telegram.error import BadRequest, ChatMigrated, Unauthorized
+from database import get_data, chat_transaction, mark_dirty, migrate_chat, iso_now
+import reminder_scheduler
+import message_ledger
+
+logger = logging.getLogger(__name__)
+
+# A chat's liveness lives in its data as 'liveness': {'state', 'since', ...}.
+# Chats without one are alive. 'dead' chats (bot blocked, kicked, chat gone)
+# and 'migrated' ones (group upgraded to a supergroup, 'to' holds the new ID)
+# are skipped by broadcasts, reminders and cleanup.
+LIVENESS_KEY = 'liveness'
+
+# BadRequest messages that mean the chat itself is unreachable, not just the call
+_DEAD_CHAT_ERRORS = ('chat not found', 'bot was kicked', 'bot is not a member', 'group chat was deactivated')
+
+def _liveness(chat_id) -> Optional[Dict]:
+    chat_data = get_data().get(str(chat_id))
+    return chat_data.get(LIVENESS_KEY) if chat_data is not None else None
+
+def is_alive(chat_id) -> bool:
+    """Check whether a chat can still be sent to"""
+    return _liveness(chat_id) is None
+
+def filter_alive(chat_ids: Iterable) -> List:
+    """Keep only the chats that can still be sent to"""
+    return [chat_id for chat_id in chat_ids if is_alive(chat_id)]
+
+def mark_dead(chat_id, reason: str) -> None:
+    """Stop bulk sends to a chat"""
+    if str(chat_id) not in get_data() or not is_alive(chat_id):
+        return
+    with chat_transaction(chat_id) as chat_data:
+        chat_data[LIVENESS_KEY] = {'state': 'dead', 'reason': reason, 'since': iso_now()}
+        mark_dirty(chat_id, key=LIVENESS_KEY)
+    logger.info(f"Marked chat {chat_id} as dead: {reason}")
+
+def mark_alive(chat_id) -> None:
+    """Resume bulk sends to a dead chat (migrated chats stay migrated)"""
+    liveness = _liveness(chat_id)
+    if liveness is None or liveness.get('state') != 'dead':
+        return
+    with chat_transaction(chat_id) as chat_data:
+        chat_data.pop(LIVENESS_KEY, None)
+        mark_dirty(chat_id, key=LIVENESS_KEY)
+        # Reminders skipped while the chat was dead are still unsent; reschedule them
+        reminder_scheduler.sync_chat(chat_id, chat_data.get('tasks', []))
+    logger.info(f"Chat {chat_id} is reachable again")
+
+def mark_migrated(old_chat_id, new_chat_id) -> None:
+    """Move a chat to the ID of the supergroup it was upgraded to"""
+    if migrate_chat(old_chat_id, new_chat_id):
+        # The old group is read-only now, so its messages can't be cleaned up
+        message_ledger.forget_chat(old_chat_id)
+        mark_alive(new_chat_id)
+
+def record_result(chat_id, error: Optional[Exception]) -> None:
+    """Update a chat's liveness from the outcome of an API call to it"""
+    if chat_id is None:
+        return
+    if error is None:
+        mark_alive(chat_id)
+    elif isinstance(error, ChatMigrated):
+        mark_migrated(chat_id, error.new_chat_id)
+    elif isinstance(error, Unauthorized):
+        mark_dead(chat_id, str(error))
+    elif isinstance(error, BadRequest) and any(text in str(error).lower() for text in _DEAD_CHAT_ERRORS):
+        mark_dead(chat_id, str(error))
+
+def stats() -> Dict[str, int]:
+    """Count dead and migrated chats"""
+    counts = {'dead': 0, 'migrated': 0}
+    for chat_data in list(get_data().values()):
+        state = (chat_data.get(LIVENESS_KEY) or {}).get('state')
+        if state in counts:
+            counts[state] += 1
+    return counts
@@ -0,0 +1,87 @@
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+from database import get_data, get_all_chat_ids
+import chat_registry
+import message_ledger
+from config import (CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP, CLEANUP_BATCH, CLEANUP_CALL_RATE, CLEANUP_SLICE_INTERVAL,
+                    CLEANUP_SLICE_MIN_CALLS)
+
+logger = logging.getLogger(__name__)
+
+# Instead of one daily burst, cleanup runs in slices every
+# CLEANUP_SLICE_INTERVAL. Each slice plans the work that is due (messages in
+# expired ledger buckets, and the deleteMessages calls they take) and gets an
+# even share of it over the slices left until UTC midnight, so a heavy day
+# means bigger slices rather than a longer burst. Time estimates assume
+# cleanup gets CLEANUP_CALL_RATE calls per second of the outbound budget.
+
+def plan_cleanup(default_days_old: int = 7, now: float = None) -> Dict[str, Any]:
+    """Work out which group messages are due for deletion and roughly how long deleting them takes
+    
+    Returns a dict with 'chats' (chat ID -> 'days', 'messages', 'calls',
+    'seconds'), totals of the same counters, and how many 'groups' were
+    checked and 'skipped'.
+    """
+    now = time.time() if now is None else now
+    data = get_data()
+    plan = {'chats': {}, 'groups': 0, 'skipped': 0, 'messages': 0, 'calls': 0, 'seconds': 0.0}
+    
+    for chat_id_str in get_all_chat_ids():
+        try:
+            chat_id = int(chat_id_str)
+            chat_data = data.get(chat_id_str, {})
+            
+            # Skip non-group chats and chats the bot can no longer reach
+            if chat_data.get('type') not in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]:
+                continue
+            if not chat_registry.is_alive(chat_id):
+                plan['skipped'] += 1
+                continue
+            
+            # Skip chats where auto_clean is disabled
+            settings = chat_data.get('settings', {})
+            if not settings.get('auto_clean', True):
+                plan['skipped'] += 1
+                continue
+            
+            plan['groups'] += 1
+            
+            # Only the day buckets entirely past this chat's threshold are read
+            days_old = settings.get('auto_clean_days', default_days_old)
+            days = message_ledger.expired_buckets(chat_id, days_old, now)
+            if not days:
+                continue
+            # Each day is deleted in its own batches
+            day_sizes = [len(message_ledger.load_bucket(chat_id, day)) for day in days]
+            messages = sum(day_sizes)
+            calls = sum(math.ceil(size / CLEANUP_BATCH) for size in day_sizes)
+            plan['chats'][chat_id] = {
+                'days': days,
+                'messages': messages,
+                'calls': calls,
+                'seconds': calls / CLEANUP_CALL_RATE,
+            }
+            plan['messages'] += messages
+            plan['calls'] += calls
+            plan['seconds'] += calls / CLEANUP_CALL_RATE
+        
+        except Exception as e:
+            logger.error(f"Error planning cleanup of chat {chat_id_str}: {e}")
+    
+    return plan
+
+def slices_left(now: float = None) -> int:
+    """Count the cleanup slices left today (UTC), including the current one"""
+    now = time.time() if now is None else now
+    today = datetime.fromtimestamp(now, timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    midnight = (today + timedelta(days=1)).timestamp()
+    return max(1, math.ceil((midnight - now) / CLEANUP_SLICE_INTERVAL))
+
+def slice_budget(plan: Dict[str, Any], now: float = None) -> int:
+    """Get the number of API calls the current slice may spend on a plan"""
+    if not plan['calls']:
+        return 0
+    return min(plan['calls'], max(CLEANUP_SLICE_MIN_CALLS, math.ceil(plan['calls'] / slices_left(now))))
@@ -87,6 +87,22 @@ DEVELOPER_COMMANDS = {
         'description': 'Delete a broadcast from all chats',
         'help': 'Delete a previously sent broadcast message from all chats\nUsage: /delbroadcast BROADCAST_ID\n\nUse without an ID to see recent broadcasts.'
     },
+    'pausebroadcast': {
+        'description': 'Pause a running broadcast',
+        'help': 'Stop a broadcast after its current batch; it can be resumed later\nUsage: /pausebroadcast BROADCAST_ID'
+    },
+    'resumebroadcast': {
+        'description': 'Resume a paused broadcast',
+        'help': 'Continue a paused broadcast with the chats it has not reached yet\nUsage: /resumebroadcast BROADCAST_ID'
+    },
+    'cancelbroadcast': {
+        'description': 'Cancel a broadcast',
+        'help': 'Stop a broadcast for good; messages already sent stay until /delbroadcast\nUsage: /cancelbroadcast BROADCAST_ID'
+    },
+    'jobs': {
+        'description': 'Show background job status',
+        'help': 'List recent background jobs and unfinished broadcasts, or show one job\nUsage: /jobs [JOB_ID]'
+    },
     'adddev': {
         'description': 'Add a new developer by ID',
         'help': 'Grant developer access to another user\nUsage: /adddev USER_ID'
@@ -144,12 +144,116 @@ GROUP_WELCOME_MESSAGE = (
     "💡 *Pro Tip:* Use @mentions in tasks to assign responsibilities to specific team members!"
 )
 
+# Storage backend: "json" (files below) or "sqlite" (SQLITE_FILE).
+# Switching to "sqlite" imports the existing JSON data on first start.
+STORAGE_BACKEND = "json"
+SQLITE_FILE = "todo_data.db"
+
 # File path for storing data
 DATA_FILE = "todo_data.json"
 
-# Reminder check interval (in seconds)
+# Sharded storage: one JSON file per chat under DATA_DIR, so a mutation only
+# rewrites its own chat. An existing DATA_FILE is migrated on first start.
+SHARDED_STORAGE = True
+DATA_DIR = "todo_data"
+SHARD_LOAD_WORKERS = 8  # Threads used to read shards at startup
+
+# Deleted tasks, and tasks completed more than ARCHIVE_DONE_AFTER_DAYS ago, are
+# moved out of the hot store into an append-only file per chat under ARCHIVE_DIR
+ARCHIVE_DIR = "todo_archive"
+ARCHIVE_DONE_AFTER_DAYS = 30
+ARCHIVE_INTERVAL = 6 * 60 * 60  # Seconds between archive runs
+
+# Broadcasts are checkpointed under BROADCAST_DIR so they resume after a restart
+BROADCAST_DIR = "todo_broadcasts"
+BROADCAST_BATCH = 50  # Sends in flight per broadcast, and the most a crash can leave unconfirmed
+
+# Reminders that fail because Telegram is unreachable are kept under OUTBOX_DIR
+# and retried with backoff (in seconds) until they are OUTBOX_MAX_AGE old
+OUTBOX_DIR = "todo_outbox"
+OUTBOX_RETRY_MIN = 5
+OUTBOX_RETRY_MAX = 5 * 60
+OUTBOX_MAX_AGE = 24 * 60 * 60
+
+# Messages the bot sends to groups are recorded under LEDGER_DIR in day buckets
+# for auto cleanup; /clean deletes the ones still inside Telegram's delete window
+LEDGER_DIR = "todo_ledger"
+MESSAGE_DELETE_WINDOW = 48 * 60 * 60
+
+# Auto cleanup works on CLEANUP_CHAT_WORKERS chats at once, deleting up to
+# CLEANUP_BATCH messages per call, and checkpoints its progress so an
+# interrupted run resumes where it stopped
+CLEANUP_CHAT_WORKERS = 4
+CLEANUP_BATCH = 100  # The most deleteMessages accepts
+CLEANUP_CHECKPOINT_FILE = "todo_cleanup.json"
+# Cleanup runs in slices every CLEANUP_SLICE_INTERVAL seconds, each taking an
+# even share of the calls due today (at least CLEANUP_SLICE_MIN_CALLS). Dry
+# runs estimate durations assuming CLEANUP_CALL_RATE calls per second.
+CLEANUP_SLICE_INTERVAL = 30 * 60
+CLEANUP_SLICE_MIN_CALLS = 20
+CLEANUP_CALL_RATE = 10
+
+# Free text in buttons (callback_data is capped at 64 bytes) is kept in
+# PAYLOAD_STORE_FILE and the buttons carry a short key; a key stops working
+# PAYLOAD_TTL seconds after it was last put in a button
+PAYLOAD_STORE_FILE = "todo_payloads.jsonl"
+PAYLOAD_STORE_MAX = 20000
+PAYLOAD_TTL = 14 * 24 * 60 * 60
+
+# Background jobs for long developer operations
+JOB_RUNNER_WORKERS = 2
+JOB_STATUS_EDIT_INTERVAL = 3  # Minimum seconds between progress edits of a status message
+JOB_HISTORY_SIZE = 50  # Finished jobs kept for /jobs
+
+# Incoming updates are handled by a worker pool: in order within a chat, in
+# parallel across chats
+UPDATE_WORKERS = 8
+UPDATE_DRAIN_TIMEOUT = 10  # Seconds shutdown waits for queued updates
+
+# Write-ahead log settings
+# When enabled, mutations are appended to WAL_FILE as compact records instead of
+# rewriting DATA_FILE; a background compactor folds the log into a fresh snapshot.
+WAL_ENABLED = True
+WAL_FILE = "todo_data.wal"
+WAL_COMPACT_BYTES = 4 * 1024 * 1024  # Compact once the log grows past 4 MB
+WAL_COMPACT_SECONDS = 15 * 60  # ... or once the oldest record is 15 minutes old
+WAL_COMPACT_CHECK_INTERVAL = 30  # Seconds between compactor checks
+
+# Dirty chats are persisted by a background flusher at most once per window.
+# Set to 0 to persist synchronously on every mutation.
+FLUSH_INTERVAL_MS = 1000
+
+# Reminders are delivered as they come due; this caps how long the reminder
+# job sleeps between runs (in seconds)
 REMINDER_CHECK_INTERVAL = 60
 
+# Reminders of one chat coming due within REMINDER_DIGEST_WINDOW seconds of
+# each other are sent together as one digest message of at most
+# REMINDER_DIGEST_MAX tasks
+REMINDER_DIGEST_WINDOW = 60
+REMINDER_DIGEST_MAX = 10
+
+# Reminders that came due while the bot was down are sent on startup to
+# REMINDER_CATCHUP_BURST chats at once, then REMINDER_CATCHUP_RATE chats per
+# second. Those overdue by REMINDER_STALE_AFTER seconds or more are listed in a
+# "missed reminders" digest instead.
+REMINDER_CATCHUP_BURST = 20
+REMINDER_CATCHUP_RATE = 2
+REMINDER_STALE_AFTER = 60 * 60
+
+# Outbound queue: every send, edit and delete goes through token buckets for
+# Telegram's global and per-chat limits (messages per second)
+SEND_WORKERS = 8  # Threads making API calls concurrently
+SEND_GLOBAL_RATE = 30
+SEND_GLOBAL_BURST = 30
+SEND_CHAT_RATE = 1  # Private chats
+SEND_GROUP_RATE = 20 / 60  # Groups and channels allow about 20 messages a minute
+SEND_CHAT_BURST = 3
+SEND_MAX_RETRIES = 3  # Times a call is retried after a RetryAfter (flood control) error
+# Global tokens each traffic class must leave unused, keeping headroom for the
+# classes above it (interactive > reminder > broadcast > maintenance)
+SEND_CLASS_RESERVE = {'interactive': 0, 'reminder': 2, 'broadcast': 6, 'maintenance': 8}
+
 # Chat type constants
 CHAT_TYPE_USER = "private"
 CHAT_TYPE_GROUP = "group"
@@ -1,40 +1,733 @@
+import atexit
+import copy
+import heapq
 import json
 import logging
 import os
-from typing import Dict, List, Any
-from config import DATA_FILE
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Iterable, Optional
+import sqlite_store
+import reminder_scheduler
+import task_archive
+from task_index import ChatIndex
+from task_search import SearchIndex
+from config import (
+    ARCHIVE_DONE_AFTER_DAYS,
+    STORAGE_BACKEND,
+    SQLITE_FILE,
+    DATA_FILE,
+    SHARDED_STORAGE,
+    DATA_DIR,
+    SHARD_LOAD_WORKERS,
+    WAL_ENABLED,
+    WAL_FILE,
+    WAL_COMPACT_BYTES,
+    WAL_COMPACT_SECONDS,
+    WAL_COMPACT_CHECK_INTERVAL,
+    FLUSH_INTERVAL_MS
+)
 
 logger = logging.getLogger(__name__)
 
 # In-memory data storage
 _data = {}
 
+# Guards the chat map, the dirty set, the counters and the write-ahead log.
+# A chat's own data and index are guarded by its chat lock instead, taken
+# before _lock whenever both are needed; nothing waits for a chat lock while
+# holding _lock.
+_lock = threading.RLock()
+_chat_locks = {}  # Chat ID -> RLock
+
+# Per-thread state of the chat locks held: how many (depth), whether a
+# synchronous flush was deferred until they are released, and the chats
+# marked dirty inside the innermost chat_transaction
+_local = threading.local()
+
+# Chats changed since the last flush: chat ID -> {'chat': bool, 'keys': set, 'tasks': set}
+_dirty = {}
+
+# Chats whose shard is older than the write-ahead log (sharded layout only)
+_unsnapshotted = set()
+
+# Write-ahead log state
+_wal_handle = None  # Open append handle for WAL_FILE
+_wal_first_record_time = None  # When the oldest uncompacted record was written
+_flusher_thread = None
+_last_compaction_check = 0.0
+
+# Serializes flushes and snapshots so an older batch never lands after a newer one
+_flush_lock = threading.RLock()
+
+# Per-chat task lookups, built on first use: chat ID -> ChatIndex
+_indexes = {}
+
+# Search indexes over archived tasks, built on a chat's first archive search and
+# dropped whenever that chat archives more: chat ID -> (SearchIndex, task ID -> task)
+_archive_search = {}
+
+# Task IDs are TASK_ID_PREFIX and a base36 counter, carried in callback data.
+# The prefix tells them apart from the list positions that buttons made before
+# tasks had IDs carry, which would otherwise act on whichever task got that ID.
+TASK_ID_PREFIX = "t"
+_ID_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+# Global counters behind get_stats(), kept current by the mutation functions
+_STAT_KEYS = ('total_chats', 'total_users', 'total_groups', 'total_tasks', 'active_tasks', 'completed_tasks')
+_counters = dict.fromkeys(_STAT_KEYS, 0)
+# Each chat's contribution to _counters, so a single chat can be recounted
+_chat_counts = {}
+_loaded = False  # Whether this process loaded the data (and so has live counters)
+_read_only = False  # Whether it loaded them with load_database_readonly, so never writes them back
+
 def initialize_database() -> None:
-    """Initialize the database by loading data from the JSON file if it exists"""
-    global _data
+    """Initialize the database by loading the snapshot and replaying the write-ahead log"""
+    global _data, _loaded
+    _loaded = True
+    if STORAGE_BACKEND == 'sqlite':
+        _initialize_sqlite()
+        _assign_missing_task_ids()
+        recount_stats()
+        reminder_scheduler.rebuild(_data)
+        if FLUSH_INTERVAL_MS > 0:
+            _start_flusher()
+        return
+    
+    _data = _load_json_data()
+
+    if WAL_ENABLED:
+        _replay_wal_files()
+        _open_wal()
+    
+    _assign_missing_task_ids()
+    recount_stats()
+    reminder_scheduler.rebuild(_data)
+    
+    if WAL_ENABLED or FLUSH_INTERVAL_MS > 0:
+        _start_flusher()
+
+def load_database_readonly() -> None:
+    """Load the snapshot and replay the write-ahead log for reading only, e.g. in a tool next to the running bot
+    
+    Nothing is migrated, no log is opened, no flusher or exit flush is set
+    up, and changes made afterwards are discarded instead of persisted, so
+    the bot's own files are left alone.
+    """
+    global _data, _read_only
+    _read_only = True
+    _data = {}
+    if STORAGE_BACKEND == 'sqlite' and os.path.exists(SQLITE_FILE):
+        sqlite_store.open_store(SQLITE_FILE, readonly=True)
+        try:
+            _data = sqlite_store.load_all()
+        finally:
+            sqlite_store.close_store()
+    if not _data:
+        # The JSON backend, or JSON data the bot has not imported into SQLite yet
+        _data = _load_json_data(migrate=False)
+        if WAL_ENABLED:
+            _replay_wal_files()
+
+def _load_json_data(migrate: bool = True) -> Dict:
+    """Load chats from the JSON layout (shards or the single DATA_FILE)"""
     try:
-        if os.path.exists(DATA_FILE):
+        if SHARDED_STORAGE and not os.path.isdir(DATA_DIR) and os.path.exists(DATA_FILE) and migrate:
+            _migrate_to_shards()
+        if SHARDED_STORAGE and (os.path.isdir(DATA_DIR) or not os.path.exists(DATA_FILE)):
+            return _load_shards()
+        elif os.path.exists(DATA_FILE):
             with open(DATA_FILE, 'r', encoding='utf-8') as file:
-                _data = json.load(file)
-                logger.info(f"Loaded data for {len(_data)} chats from {DATA_FILE}")
+                data = json.load(file)
+                logger.info(f"Loaded data for {len(data)} chats from {DATA_FILE}")
+                return data
         else:
-            _data = {}
             logger.info(f"No existing data file found. Starting with empty database.")
+            return {}
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
+        return {}
+
+def _replay_wal_files() -> None:
+    """Replay the write-ahead log into _data"""
+    # A rotated log is left behind if we crashed in the middle of a compaction
+    replayed = _replay_wal(WAL_FILE + ".old") + _replay_wal(WAL_FILE)
+    if replayed:
+        logger.info(f"Replayed {replayed} write-ahead log records")
+
+def _initialize_sqlite() -> None:
+    """Open the SQLite store, importing the JSON data the first time it is used"""
+    global _data
+    try:
+        sqlite_store.open_store(SQLITE_FILE)
+        if sqlite_store.is_empty():
+            _data = _load_json_data()
+            if WAL_ENABLED:
+                _replay_wal_files()
+            if _data:
+                # The JSON files are left in place; they are no longer written to
+                sqlite_store.import_data(_data)
+        _data = sqlite_store.load_all()
+        _unsnapshotted.clear()
+    except Exception as e:
+        logger.error(f"Error initializing SQLite database: {e}")
         _data = {}
 
 def save_data(data=None) -> bool:
-    """Save the current data to the JSON file"""
+    """Save the current data to the JSON file (or the dirty shards)"""
+    if _read_only:
+        return _discard_dirty()
+    if data is None and STORAGE_BACKEND == 'sqlite':
+        # Every row is current once the dirty chats are written
+        return flush()
+    if data is None and WAL_ENABLED and _wal_handle is not None:
+        # Writing a full snapshot is exactly what a compaction does
+        return compact_wal()
+    
     try:
-        with open(DATA_FILE, 'w', encoding='utf-8') as file:
-            json.dump(data if data is not None else _data, file, ensure_ascii=False, indent=2)
-        logger.debug("Data saved successfully")
+        with _flush_lock:
+            if data is not None:
+                files = {DATA_FILE: json.dumps(data, ensure_ascii=False, indent=2)}
+            else:
+                with _lock:
+                    pending = _take_dirty()
+                files = _serialize_snapshot(pending.keys())
+            try:
+                _write_files(files)
+            except Exception:
+                if data is None:
+                    _restore_dirty(pending)
+                raise
+        logger.debug(f"Data saved successfully ({len(files)} files)")
         return True
     except Exception as e:
         logger.error(f"Error saving data: {e}")
         return False
 
+def _serialize_snapshot(chat_ids: Iterable[str]) -> Dict[str, Any]:
+    """Serialize what a snapshot must write as a path -> content map (caller holds _flush_lock, not _lock)
+    
+    The single-file layout always rewrites DATA_FILE in full; the sharded layout
+    only rewrites the given chats, and a None content removes a chat's shard.
+    Each chat is read under its own lock, so the snapshot never sees a chat
+    halfway through a change.
+    """
+    if not SHARDED_STORAGE:
+        chats = {}
+        for chat_id_str in get_all_chat_ids():
+            with _chat_lock(chat_id_str):
+                chats[chat_id_str] = copy.deepcopy(_data[chat_id_str])
+        return {DATA_FILE: json.dumps(chats, ensure_ascii=False, indent=2)}
+    
+    files = {}
+    for chat_id_str in chat_ids:
+        with _chat_lock(chat_id_str):
+            chat_data = _data.get(chat_id_str)
+            files[_shard_path(chat_id_str)] = (
+                json.dumps(chat_data, ensure_ascii=False, indent=2) if chat_data is not None else None
+            )
+    return files
+
+def _write_files(files: Dict[str, Any]) -> None:
+    """Write each serialized file atomically, removing those whose content is None"""
+    if SHARDED_STORAGE:
+        os.makedirs(DATA_DIR, exist_ok=True)
+    for path, serialized in files.items():
+        if serialized is None:
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            _write_snapshot(serialized, path)
+
+def _write_snapshot(serialized: str, path: str = DATA_FILE) -> None:
+    """Atomically replace a data file with the given serialized content"""
+    tmp_file = path + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as file:
+        file.write(serialized)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_file, path)
+
+def _shard_path(chat_id_str: str) -> str:
+    """Get the path of the shard file holding one chat"""
+    return os.path.join(DATA_DIR, f"{chat_id_str}.json")
+
+def _load_shard(file_name: str):
+    """Load a single shard, returning (chat ID, chat data) or None if unreadable"""
+    path = os.path.join(DATA_DIR, file_name)
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return file_name[:-len(".json")], json.load(file)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error loading shard {path}: {e}")
+        return None
+
+def _load_shards() -> Dict:
+    """Load every chat shard from DATA_DIR, reading the files in parallel"""
+    if not os.path.isdir(DATA_DIR):
+        logger.info("No existing data directory found. Starting with empty database.")
+        return {}
+    
+    file_names = [name for name in os.listdir(DATA_DIR) if name.endswith(".json")]
+    with ThreadPoolExecutor(max_workers=max(1, SHARD_LOAD_WORKERS)) as executor:
+        loaded = [result for result in executor.map(_load_shard, file_names) if result is not None]
+    logger.info(f"Loaded data for {len(loaded)} chats from {DATA_DIR}")
+    return dict(loaded)
+
+def _migrate_to_shards() -> None:
+    """One-shot migration of the single DATA_FILE into per-chat shards under DATA_DIR
+    
+    Shards are written to a staging directory that is renamed into place, so an
+    interrupted migration simply runs again on the next start. Write-ahead log
+    records are state-based and stay valid on top of the shards.
+    """
+    with open(DATA_FILE, 'r', encoding='utf-8') as file:
+        legacy_data = json.load(file)
+    
+    staging_dir = DATA_DIR + ".migrating"
+    os.makedirs(staging_dir, exist_ok=True)
+    for chat_id_str, chat_data in legacy_data.items():
+        _write_snapshot(json.dumps(chat_data, ensure_ascii=False, indent=2),
+                        os.path.join(staging_dir, f"{chat_id_str}.json"))
+    os.replace(staging_dir, DATA_DIR)
+    os.replace(DATA_FILE, DATA_FILE + ".migrated")
+    logger.info(f"Migrated {len(legacy_data)} chats from {DATA_FILE} into shards under {DATA_DIR}")
+
+def _open_wal() -> None:
+    """Open the write-ahead log for appending"""
+    global _wal_handle, _wal_first_record_time
+    _wal_handle = open(WAL_FILE, 'a', encoding='utf-8')
+    # Treat leftover records from a previous run as written now
+    _wal_first_record_time = time.time() if _wal_handle.tell() > 0 else None
+
+def _replay_wal(path: str) -> int:
+    """Apply every record in a write-ahead log file to _data, returning the record count"""
+    if not os.path.exists(path):
+        return 0
+    
+    count = 0
+    with open(path, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                _apply_record(json.loads(line))
+                count += 1
+            except (ValueError, KeyError, TypeError) as e:
+                # A torn final line is expected after a crash mid-append
+                logger.warning(f"Skipping unreadable record {line_number} in {path}: {e}")
+    return count
+
+def _apply_record(record: Dict) -> None:
+    """Apply a single write-ahead log record to _data
+    
+    Records describe the resulting state rather than the operation, so replaying
+    a record that is already reflected in the snapshot is harmless.
+    """
+    op = record['op']
+    chat_id_str = record['id']
+    # The shard on disk predates this record until the next compaction
+    _unsnapshotted.add(chat_id_str)
+    
+    if op == 'chat':
+        _data[chat_id_str] = record['data']
+    elif op == 'set':
+        _data.setdefault(chat_id_str, {})[record['key']] = record['value']
+    elif op == 'task':
+        tasks = _data.setdefault(chat_id_str, {}).setdefault('tasks', [])
+        task_index = record['i']
+        if task_index < len(tasks):
+            tasks[task_index] = record['task']
+        elif task_index == len(tasks):
+            tasks.append(record['task'])
+        else:
+            logger.warning(f"Out of order task record for chat {chat_id_str} at index {task_index}")
+    else:
+        raise ValueError(f"Unknown record type: {op}")
+
+def mark_dirty(chat_id, key: str = None, task_index: int = None) -> None:
+    """Mark part of a chat as changed so the next flush persists it
+    
+    With neither key nor task_index the whole chat is rewritten. Callers that
+    mutate chat data in place (jobs, handlers) use this instead of saving.
+    """
+    chat_id_str = str(chat_id)
+    with _lock:
+        entry = _dirty.setdefault(chat_id_str, {'chat': False, 'keys': set(), 'tasks': set()})
+        if key is not None:
+            entry['keys'].add(key)
+        elif task_index is not None:
+            entry['tasks'].add(task_index)
+        else:
+            entry['chat'] = True
+    marked = getattr(_local, 'marked', None)
+    if marked is not None:
+        marked.add(chat_id_str)
+    
+    if FLUSH_INTERVAL_MS <= 0:
+        if getattr(_local, 'depth', 0):
+            # Flushing waits for chat locks, so not while this thread holds one
+            _local.flush_pending = True
+        else:
+            flush()
+
+def _discard_dirty() -> bool:
+    """Forget the changes made since the data was loaded read-only"""
+    with _lock:
+        if _dirty:
+            logger.warning(f"Not persisting changes to {len(_dirty)} chats of a read-only load")
+        _take_dirty()
+    return True
+
+def _take_dirty() -> Dict:
+    """Detach and return the current dirty set (caller holds _lock)"""
+    global _dirty
+    pending = _dirty
+    _dirty = {}
+    return pending
+
+def _restore_dirty(pending: Dict) -> None:
+    """Merge a dirty set back after a failed write"""
+    with _lock:
+        for chat_id_str, entry in pending.items():
+            current = _dirty.setdefault(chat_id_str, {'chat': False, 'keys': set(), 'tasks': set()})
+            current['chat'] = current['chat'] or entry['chat']
+            current['keys'] |= entry['keys']
+            current['tasks'] |= entry['tasks']
+
+def _records_for(chat_id_str: str, entry: Dict) -> List[Dict]:
+    """Build write-ahead log records describing the current state of a dirty chat (caller holds its chat lock)"""
+    chat_data = _data.get(chat_id_str)
+    if chat_data is None:
+        return []
+    if entry['chat']:
+        return [{'op': 'chat', 'id': chat_id_str, 'data': chat_data}]
+    
+    records = [{'op': 'set', 'id': chat_id_str, 'key': key, 'value': chat_data.get(key)}
+               for key in sorted(entry['keys'])]
+    tasks = chat_data.get('tasks', [])
+    for task_index in sorted(entry['tasks']):
+        if task_index < len(tasks):
+            records.append({'op': 'task', 'id': chat_id_str, 'i': task_index, 'task': tasks[task_index]})
+    return records
+
+def flush() -> bool:
+    """Persist every chat marked dirty since the last flush"""
+    global _wal_first_record_time
+    if _read_only:
+        return _discard_dirty()
+    if STORAGE_BACKEND == 'sqlite':
+        return _flush_sqlite()
+    
+    with _flush_lock:
+        with _lock:
+            if not _dirty:
+                return True
+            use_snapshot = not WAL_ENABLED or _wal_handle is None
+        
+        if use_snapshot:
+            return save_data()
+    
+        with _lock:
+            pending = _take_dirty()
+        try:
+            lines = []
+            for chat_id_str, entry in pending.items():
+                with _chat_lock(chat_id_str):
+                    for record in _records_for(chat_id_str, entry):
+                        lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            with _lock:
+                _unsnapshotted.update(pending)
+                if lines:
+                    _wal_handle.write("\n".join(lines) + "\n")
+                    _wal_handle.flush()
+                    if _wal_first_record_time is None:
+                        _wal_first_record_time = time.time()
+            logger.debug(f"Flushed {len(pending)} dirty chats ({len(lines)} records)")
+            return True
+        except Exception as e:
+            logger.error(f"Error appending to write-ahead log: {e}")
+            _restore_dirty(pending)
+            return False
+
+def _flush_sqlite() -> bool:
+    """Write dirty chats to SQLite as row-level upserts"""
+    with _flush_lock:
+        with _lock:
+            pending = _take_dirty()
+        statements = []
+        for chat_id_str, entry in pending.items():
+            with _chat_lock(chat_id_str):
+                chat_data = _data.get(chat_id_str)
+                if chat_data is None:
+                    continue
+                if entry['chat']:
+                    statements.extend(sqlite_store.chat_statements(chat_id_str, chat_data))
+                    continue
+                if entry['keys']:
+                    statements.append(sqlite_store.meta_statement(chat_id_str, chat_data))
+                tasks = chat_data.get('tasks', [])
+                for task_index in sorted(entry['tasks']):
+                    if task_index < len(tasks):
+                        statements.append(sqlite_store.task_statement(chat_id_str, task_index, tasks[task_index]))
+        
+        if not statements:
+            return True
+        try:
+            sqlite_store.execute(statements)
+            logger.debug(f"Flushed {len(pending)} dirty chats ({len(statements)} rows)")
+            return True
+        except Exception as e:
+            logger.error(f"Error writing to SQLite: {e}")
+            _restore_dirty(pending)
+            return False
+
+def compact_wal() -> bool:
+    """Fold the write-ahead log into a fresh snapshot of DATA_FILE (or the touched shards)"""
+    global _unsnapshotted
+    rotated_file = WAL_FILE + ".old"
+    try:
+        with _flush_lock:
+            with _lock:
+                # Everything dirty is captured by the snapshot
+                pending = _take_dirty()
+                touched = _unsnapshotted | set(pending)
+                _unsnapshotted = set()
+            files = _serialize_snapshot(touched)
+            
+            with _lock:
+                # Rotate the log so new records land in a fresh file while we write
+                _wal_handle.close()
+                if os.path.exists(rotated_file):
+                    # A previous compaction died before finishing; keep its records
+                    with open(WAL_FILE, 'r', encoding='utf-8') as src, open(rotated_file, 'a', encoding='utf-8') as dst:
+                        dst.write(src.read())
+                    os.remove(WAL_FILE)
+                else:
+                    os.replace(WAL_FILE, rotated_file)
+                _open_wal()
+        
+            try:
+                _write_files(files)
+            except Exception:
+                _restore_dirty(pending)
+                with _lock:
+                    _unsnapshotted.update(touched)
+                raise
+            os.remove(rotated_file)
+        logger.info(f"Compacted write-ahead log into {len(files)} data files")
+        return True
+    except Exception as e:
+        logger.error(f"Error compacting write-ahead log: {e}")
+        with _lock:
+            if _wal_handle is None or _wal_handle.closed:
+                _open_wal()
+        return False
+
+def _wal_needs_compaction() -> bool:
+    """Check whether the write-ahead log has passed its size or age threshold"""
+    with _lock:
+        if _wal_handle is None or _wal_first_record_time is None:
+            return False
+        if _wal_handle.tell() >= WAL_COMPACT_BYTES:
+            return True
+        return time.time() - _wal_first_record_time >= WAL_COMPACT_SECONDS
+
+def _flusher_loop() -> None:
+    """Background loop that flushes dirty chats and compacts the write-ahead log"""
+    global _last_compaction_check
+    interval = max(FLUSH_INTERVAL_MS, 1) / 1000.0 if FLUSH_INTERVAL_MS > 0 else WAL_COMPACT_CHECK_INTERVAL
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+            if WAL_ENABLED and time.time() - _last_compaction_check >= WAL_COMPACT_CHECK_INTERVAL:
+                _last_compaction_check = time.time()
+                if _wal_needs_compaction():
+                    compact_wal()
+        except Exception as e:
+            logger.error(f"Database flusher error: {e}")
+
+def _start_flusher() -> None:
+    """Start the background flusher thread once"""
+    global _flusher_thread, _last_compaction_check
+    if _flusher_thread is not None and _flusher_thread.is_alive():
+        return
+    _last_compaction_check = time.time()
+    _flusher_thread = threading.Thread(target=_flusher_loop, name="db-flusher", daemon=True)
+    _flusher_thread.start()
+    # The flusher is a daemon thread; don't lose the last window on a normal exit
+    atexit.register(flush)
+
+def _new_task_id(chat_data: Dict) -> str:
+    """Allocate the next task ID of a chat (TASK_ID_PREFIX and a short base36 counter)"""
+    number = chat_data.get('next_task_id', 1)
+    chat_data['next_task_id'] = number + 1
+    
+    digits = ""
+    while True:
+        number, remainder = divmod(number, 36)
+        digits = _ID_ALPHABET[remainder] + digits
+        if number == 0:
+            return TASK_ID_PREFIX + digits
+
+def is_task_id(value: str) -> bool:
+    """Check whether callback data carries a task ID rather than a list position from an older button"""
+    return value.startswith(TASK_ID_PREFIX) and len(value) > len(TASK_ID_PREFIX)
+
+def _assign_task_ids(chat_data: Dict) -> bool:
+    """Give every task of a chat that lacks an ID (or has an unprefixed one) an ID, returning whether any changed"""
+    assigned = False
+    for task in chat_data.get('tasks', []):
+        if not is_task_id(task.get('id') or ''):
+            task['id'] = _new_task_id(chat_data)
+            assigned = True
+    return assigned
+
+def _assign_missing_task_ids() -> None:
+    """Backfill IDs for tasks created before tasks had them"""
+    with _lock:
+        changed = [chat_id_str for chat_id_str, chat_data in _data.items() if _assign_task_ids(chat_data)]
+    for chat_id_str in changed:
+        mark_dirty(chat_id_str)
+    if changed:
+        logger.info(f"Assigned task IDs in {len(changed)} chats")
+
+def _chat_lock(chat_id_str: str) -> threading.RLock:
+    """Get the lock guarding one chat's data and index"""
+    lock = _chat_locks.get(chat_id_str)
+    if lock is None:
+        with _lock:
+            lock = _chat_locks.setdefault(chat_id_str, threading.RLock())
+    return lock
+
+@contextmanager
+def _chat_locked(chat_id):
+    """Hold a chat's lock, running any synchronous flush requested meanwhile once every chat lock is released"""
+    with _chat_lock(str(chat_id)):
+        _local.depth = getattr(_local, 'depth', 0) + 1
+        try:
+            yield
+        finally:
+            _local.depth -= 1
+    if _local.depth == 0 and getattr(_local, 'flush_pending', False):
+        _local.flush_pending = False
+        flush()
+
+@contextmanager
+def chat_transaction(chat_id):
+    """Lock a chat for a read-modify-write of its data: `with chat_transaction(chat_id) as chat:`
+    
+    No other thread reads or writes the chat (through this module) until the
+    block ends, and its changes are persisted together. The block should
+    mark_dirty() what it changed; if it marks nothing, the whole chat is
+    treated as changed and its counters, indexes and reminders are rebuilt.
+    """
+    chat_id_str = str(chat_id)
+    with _chat_locked(chat_id_str):
+        chat_data = get_chat_data(chat_id)
+        outer = getattr(_local, 'marked', None)
+        _local.marked = set()
+        try:
+            yield chat_data
+        finally:
+            marked = _local.marked
+            _local.marked = outer
+            if outer is not None:
+                outer |= marked
+            if chat_id_str not in marked:
+                _chat_replaced(chat_id_str, chat_data)
+
+def _chat_index(chat_id_str: str, chat_data: Dict) -> ChatIndex:
+    """Get the task index of a chat, rebuilding it if the task list was replaced (caller holds its chat lock)"""
+    tasks = chat_data.setdefault('tasks', [])
+    index = _indexes.get(chat_id_str)
+    if index is None or not index.is_current(tasks):
+        index = ChatIndex(tasks)
+        _indexes[chat_id_str] = index
+    return index
+
+def _find_task(chat_id, task_id: str):
+    """Get (position, task) for a task ID, or (None, None) if it does not exist"""
+    chat_id_str = str(chat_id)
+    with _chat_locked(chat_id_str):
+        index = _chat_index(chat_id_str, get_chat_data(chat_id))
+        position = index.position(task_id)
+        if position is None:
+            return None, None
+        return position, index.get(task_id)
+
+def _task_counts(task: Dict):
+    """Get a task's contribution to (active_tasks, completed_tasks)"""
+    active = task.get('active', True)
+    return (
+        1 if active and not task.get('done', False) else 0,
+        1 if active and task.get('done', True) else 0,
+    )
+
+def _count_chat(chat_data: Dict) -> Dict[str, int]:
+    """Count one chat's contribution to the global counters"""
+    chat_type = chat_data.get('type')
+    archive = chat_data.get('archive', {})
+    tasks = chat_data.get('tasks', [])
+    counts = [_task_counts(task) for task in tasks]
+    return {
+        'total_chats': 1,
+        'total_users': 1 if chat_type == 'user' else 0,
+        'total_groups': 1 if chat_type in ['group', 'supergroup'] else 0,
+        'total_tasks': len(tasks) + archive.get('tasks', 0),
+        'active_tasks': sum(active for active, _ in counts),
+        'completed_tasks': sum(completed for _, completed in counts) + archive.get('completed', 0),
+    }
+
+def _adjust_counts(chat_id_str: str, deltas: Dict[str, int]) -> None:
+    """Apply counter deltas for one chat"""
+    with _lock:
+        chat_counts = _chat_counts.setdefault(chat_id_str, dict.fromkeys(_STAT_KEYS, 0))
+        for key, delta in deltas.items():
+            chat_counts[key] += delta
+            _counters[key] += delta
+
+def _task_changed(chat_id, before, task: Dict) -> None:
+    """Update the counters and indexes after a task went from the `before` counts to its current state (caller holds its chat lock)"""
+    index = _indexes.get(str(chat_id))
+    if index is not None:
+        index.refresh(task)
+    after = _task_counts(task)
+    if after != before:
+        _adjust_counts(str(chat_id), {
+            'active_tasks': after[0] - before[0],
+            'completed_tasks': after[1] - before[1],
+        })
+
+def _recount_chat(chat_id_str: str) -> None:
+    """Recount one chat after a change too broad to track task by task"""
+    with _lock:
+        chat_data = _data.get(chat_id_str)
+        new_counts = _count_chat(chat_data) if chat_data is not None else dict.fromkeys(_STAT_KEYS, 0)
+        old_counts = _chat_counts.get(chat_id_str, dict.fromkeys(_STAT_KEYS, 0))
+        _adjust_counts(chat_id_str, {key: new_counts[key] - old_counts[key] for key in _STAT_KEYS})
+
+def recount_stats() -> Dict[str, Any]:
+    """Recount the global counters from scratch, logging any drift from the incremental ones"""
+    global _counters, _chat_counts
+    with _lock:
+        chat_counts = {chat_id_str: _count_chat(chat_data) for chat_id_str, chat_data in _data.items()}
+        counters = dict.fromkeys(_STAT_KEYS, 0)
+        for counts in chat_counts.values():
+            for key in _STAT_KEYS:
+                counters[key] += counts[key]
+        
+        if _chat_counts and counters != _counters:
+            logger.warning(f"Stats counters drifted: {_counters} != recount {counters}")
+        _counters = counters
+        _chat_counts = chat_counts
+        return dict(_counters)
+
 def get_data() -> Dict:
     """Get the current data"""
     return _data
@@ -43,46 +736,58 @@ def get_chat_data(chat_id: int) -> Dict:
     """Get data for a specific chat"""
     chat_id_str = str(chat_id)  # Convert to string for JSON compatibility
     if chat_id_str not in _data:
-        _data[chat_id_str] = {
-            'type': 'user',  # Default to user, will be updated if it's a group
-            'tasks': [],
-            'settings': {
-                'reminder_default': False,
-                'reminder_time': 3600,  # Default reminder time (1 hour)
-                'sort_by': 'date',  # Sort tasks by date by default
-                'theme': 'default',  # UI theme preference
-                'notification_level': 'all',  # Notification settings: all, important, none
-                'time_format': '24h',  # Time format: 12h or 24h
-                'categories': ['Work', 'Personal', 'Shopping', 'Health', 'Other'],  # Default categories
-                'language': 'en',  # User interface language
-                'auto_clean': True,  # Automatically clean old messages
-                'auto_clean_days': 3,  # Days to keep messages before cleaning
-            },
-            'stats': {
-                'tasks_added': 0,
-                'tasks_completed': 0,
-                'last_active': iso_now(),
-                'streaks': {
-                    'current': 0,
-                    'longest': 0,
-                    'last_completion_date': None
+        with _lock:
+            if chat_id_str in _data:
+                return _data[chat_id_str]
+            _data[chat_id_str] = {
+                'type': 'user',  # Default to user, will be updated if it's a group
+                'tasks': [],
+                'settings': {
+                    'reminder_default': False,
+                    'reminder_time': 3600,  # Default reminder time (1 hour)
+                    'sort_by': 'date',  # Sort tasks by date by default
+                    'theme': 'default',  # UI theme preference
+                    'notification_level': 'all',  # Notification settings: all, important, none
+                    'time_format': '24h',  # Time format: 12h or 24h
+                    'categories': ['Work', 'Personal', 'Shopping', 'Health', 'Other'],  # Default categories
+                    'language': 'en',  # User interface language
+                    'auto_clean': True,  # Automatically clean old messages
+                    'auto_clean_days': 3,  # Days to keep messages before cleaning
+                },
+                'stats': {
+                    'tasks_added': 0,
+                    'tasks_completed': 0,
+                    'last_active': iso_now(),
+                    'streaks': {
+                        'current': 0,
+                        'longest': 0,
+                        'last_completion_date': None
+                    }
                 }
             }
-        }
-        save_data()
+            _recount_chat(chat_id_str)
+        mark_dirty(chat_id_str)
     return _data[chat_id_str]
 
+def _chat_replaced(chat_id_str: str, chat_data: Dict) -> None:
+    """Rebuild everything derived from a chat after arbitrary changes to it (caller holds its chat lock)"""
+    with _lock:
+        _data[chat_id_str] = chat_data
+        _assign_task_ids(chat_data)
+        _recount_chat(chat_id_str)
+    _indexes.pop(chat_id_str, None)
+    mark_dirty(chat_id_str)
+    reminder_scheduler.sync_chat(chat_id_str, chat_data.get('tasks', []))
+
 def update_chat_data(chat_id: int, chat_data: Dict) -> None:
     """Update data for a specific chat"""
     chat_id_str = str(chat_id)  # Convert to string for JSON compatibility
-    _data[chat_id_str] = chat_data
-    save_data()
+    with _chat_locked(chat_id_str):
+        _chat_replaced(chat_id_str, chat_data)
 
 def add_task(chat_id: int, task_text: str, due_date=None, reminder=None, priority=None, 
             category=None, assignee=None, notes=None) -> Dict:
     """Add a new task for a chat with enhanced properties"""
-    chat_data = get_chat_data(chat_id)
-    
     # Create new task with advanced properties
     task = {
         'text': task_text,
@@ -105,106 +810,312 @@ def add_task(chat_id: int, task_text: str, due_date=None, reminder=None, priorit
     if assignee:
         task['assignee'] = assignee  # For group task assignment
     
-    chat_data['tasks'].append(task)
-    update_chat_data(chat_id, chat_data)
+    with _chat_locked(chat_id):
+        chat_data = get_chat_data(chat_id)
+        task['id'] = _new_task_id(chat_data)
+        index = _chat_index(str(chat_id), chat_data)
+        chat_data['tasks'].append(task)
+        task_index = len(chat_data['tasks']) - 1
+        index.add(task_index, task)
+        _adjust_counts(str(chat_id), {'total_tasks': 1, 'active_tasks': 1})
+        mark_dirty(chat_id, key='next_task_id')
+        mark_dirty(chat_id, task_index=task_index)
+    if reminder:
+        reminder_scheduler.sync_task(chat_id, task)
     
     return task
 
 def get_tasks(chat_id: int, include_done: bool = False) -> List[Dict]:
     """Get all active tasks for a chat"""
     chat_data = get_chat_data(chat_id)
-    tasks = chat_data.get('tasks', [])
+    with _chat_locked(chat_id):
+        tasks = list(chat_data.get('tasks', []))
     
     if not include_done:
         tasks = [task for task in tasks if task.get('active', True) and not task.get('done', False)]
     
     return tasks
 
-def mark_task_done(chat_id: int, task_index: int) -> bool:
+def _indexed(chat_id, lookup):
+    """Run a lookup against a chat's task index"""
+    with _chat_locked(chat_id):
+        return lookup(_chat_index(str(chat_id), get_chat_data(chat_id)))
+
+def count_open_tasks(chat_id: int) -> int:
+    """Get the number of open (active, not done) tasks of a chat"""
+    return _indexed(chat_id, lambda index: index.open_count())
+
+def get_tasks_due_between(chat_id: int, start: float, end: float) -> List[Dict]:
+    """Get open tasks due in [start, end), in list order"""
+    return _indexed(chat_id, lambda index: index.due_between(start, end))
+
+def get_tasks_by_priority(chat_id: int, priority: str) -> List[Dict]:
+    """Get open tasks with the given priority"""
+    return _indexed(chat_id, lambda index: index.with_priority(priority))
+
+def get_categories(chat_id: int) -> List[str]:
+    """Get the categories used by any task of a chat"""
+    return _indexed(chat_id, lambda index: index.categories())
+
+def get_task(chat_id: int, task_id: str) -> Optional[Dict]:
+    """Get a task by its ID"""
+    return _find_task(chat_id, task_id)[1]
+
+def update_task(chat_id: int, task_id: str, updates: Dict, touch: bool = True) -> Optional[Dict]:
+    """Update fields of a task by its ID, returning the task or None if not found"""
+    with _chat_locked(chat_id):
+        task_index, task = _find_task(chat_id, task_id)
+        if task is None:
+            return None
+    
+        before = _task_counts(task)
+        task.update(updates)
+        if touch:
+            task['updated_at'] = iso_now()
+        _task_changed(chat_id, before, task)
+        mark_dirty(chat_id, task_index=task_index)
+        reminder_scheduler.sync_task(chat_id, task)
+    return task
+
+def mark_task_done(chat_id: int, task_id: str) -> bool:
     """Mark a task as done"""
-    chat_data = get_chat_data(chat_id)
-    tasks = chat_data.get('tasks', [])
+    with _chat_locked(chat_id):
+        task_index, task = _find_task(chat_id, task_id)
     
-    if 0 <= task_index < len(tasks):
-        tasks[task_index]['done'] = True
-        update_chat_data(chat_id, chat_data)
-        return True
+        if task is not None:
+            before = _task_counts(task)
+            task['done'] = True
+            task['completed_at'] = iso_now()
+            _task_changed(chat_id, before, task)
+            mark_dirty(chat_id, task_index=task_index)
+            reminder_scheduler.cancel(chat_id, task_id)
+            return True
     return False
 
-def delete_task(chat_id: int, task_index: int) -> bool:
+def delete_task(chat_id: int, task_id: str) -> bool:
     """Delete a task"""
-    chat_data = get_chat_data(chat_id)
-    tasks = chat_data.get('tasks', [])
+    with _chat_locked(chat_id):
+        task_index, task = _find_task(chat_id, task_id)
     
-    if 0 <= task_index < len(tasks):
-        # Instead of deleting, mark as inactive
-        tasks[task_index]['active'] = False
-        update_chat_data(chat_id, chat_data)
-        return True
+        if task is not None:
+            # Instead of deleting, mark as inactive
+            before = _task_counts(task)
+            task['active'] = False
+            _task_changed(chat_id, before, task)
+            mark_dirty(chat_id, task_index=task_index)
+            reminder_scheduler.cancel(chat_id, task_id)
+            return True
     return False
 
 def clear_tasks(chat_id: int) -> int:
     """Clear all tasks for a chat (mark as inactive)"""
-    chat_data = get_chat_data(chat_id)
-    tasks = chat_data.get('tasks', [])
-    
     count = 0
-    for task in tasks:
-        if task.get('active', True):
-            task['active'] = False
-            count += 1
-    
-    update_chat_data(chat_id, chat_data)
+    with chat_transaction(chat_id) as chat_data:
+        for task in chat_data.get('tasks', []):
+            if task.get('active', True):
+                task['active'] = False
+                count += 1
     return count
 
-def set_reminder(chat_id: int, task_index: int, reminder_time: float) -> bool:
+def set_reminder(chat_id: int, task_id: str, reminder_time: float) -> bool:
     """Set a reminder for a task"""
-    chat_data = get_chat_data(chat_id)
-    tasks = chat_data.get('tasks', [])
+    with _chat_locked(chat_id):
+        task_index, task = _find_task(chat_id, task_id)
     
-    if 0 <= task_index < len(tasks):
-        tasks[task_index]['reminder'] = reminder_time
-        update_chat_data(chat_id, chat_data)
-        return True
+        if task is not None:
+            task['reminder'] = reminder_time
+            # A new reminder time fires again even if an earlier one already did
+            task['reminded'] = False
+            mark_dirty(chat_id, task_index=task_index)
+            reminder_scheduler.sync_task(chat_id, task)
+            return True
     return False
 
+def mark_reminded(chat_id, task_id: str, reminder_time: Optional[float] = None) -> bool:
+    """Mark a task's reminder as sent, unless the task was rescheduled since that reminder was taken
+    
+    reminder_time is the task's reminder when it was sent; None marks it
+    whatever its current reminder is.
+    """
+    with _chat_locked(chat_id):
+        task_index, task = _find_task(chat_id, task_id)
+        if task is None or (reminder_time is not None and task.get('reminder') != reminder_time):
+            return False
+        task['reminded'] = True
+        mark_dirty(chat_id, task_index=task_index)
+        reminder_scheduler.sync_task(chat_id, task)
+    return True
+
+def _is_cold(task: Dict, cutoff: datetime) -> bool:
+    """Check whether a task belongs in the archive: deleted, or completed before cutoff"""
+    if not task.get('active', True):
+        return True
+    if not task.get('done', False):
+        return False
+    completed_at = task.get('completed_at') or task.get('updated_at') or task.get('date_added')
+    try:
+        return datetime.fromisoformat(completed_at) < cutoff
+    except (TypeError, ValueError):
+        return False
+
+def _archive_chat(chat_id_str: str, cutoff: datetime) -> int:
+    """Move the cold tasks of one chat into its archive, returning how many moved"""
+    with _chat_locked(chat_id_str):
+        chat_data = _data.get(chat_id_str)
+        if not chat_data:
+            return 0
+        
+        hot, cold = [], []
+        for task in chat_data.get('tasks', []):
+            (cold if _is_cold(task, cutoff) else hot).append(task)
+        if not cold:
+            return 0
+        
+        # The archive is written first so a crash can only duplicate tasks, never lose them
+        task_archive.append_tasks(chat_id_str, cold)
+        
+        counters = chat_data.setdefault('archive', {'tasks': 0, 'completed': 0, 'deleted': 0})
+        for task in cold:
+            counters['tasks'] += 1
+            if not task.get('active', True):
+                counters['deleted'] += 1
+            else:
+                counters['completed'] += 1
+        
+        chat_data['tasks'] = hot
+        _indexes.pop(chat_id_str, None)
+        _archive_search.pop(chat_id_str, None)
+        _recount_chat(chat_id_str)
+        mark_dirty(chat_id_str)
+    return len(cold)
+
+def archive_tasks(chat_id: int = None, done_after_days: int = ARCHIVE_DONE_AFTER_DAYS) -> int:
+    """Move deleted and long-completed tasks out of the hot store into per-chat archives"""
+    chat_ids = [str(chat_id)] if chat_id is not None else get_all_chat_ids()
+    cutoff = datetime.now() - timedelta(days=done_after_days)
+    
+    archived = 0
+    for chat_id_str in chat_ids:
+        try:
+            archived += _archive_chat(chat_id_str, cutoff)
+        except Exception as e:
+            logger.error(f"Error archiving tasks for chat {chat_id_str}: {e}")
+    
+    if archived:
+        logger.info(f"Archived {archived} tasks from {len(chat_ids)} chats")
+    return archived
+
+def get_archived_tasks(chat_id: int) -> List[Dict]:
+    """Load the archived tasks of a chat (read from disk on every call)"""
+    return task_archive.load_tasks(str(chat_id))
+
+def search_tasks(chat_id: int, query: str) -> List[Dict]:
+    """Get a chat's active tasks matching every term of the query, best match first"""
+    return [task for _, task in _indexed(chat_id, lambda index: index.search(query))]
+
+def search_all_tasks(query: str, limit: int = 20) -> List[tuple]:
+    """Get (chat ID, task) for the best matches across every chat"""
+    results = []
+    for chat_id_str in get_all_chat_ids():
+        with _chat_locked(chat_id_str):
+            matches = _chat_index(chat_id_str, _data[chat_id_str]).search(query)
+        results.extend((score, chat_id_str, task) for score, task in matches)
+    return [(chat_id_str, task) for _, chat_id_str, task in heapq.nlargest(limit, results, key=lambda item: item[0])]
+
+def search_archived_tasks(chat_id: int, query: str) -> List[Dict]:
+    """Get a chat's archived (completed, not deleted) tasks matching every term of the query"""
+    chat_id_str = str(chat_id)
+    with _chat_locked(chat_id_str):
+        cached = _archive_search.get(chat_id_str)
+        if cached is None:
+            search_index, by_id = SearchIndex(), {}
+            for task in task_archive.load_tasks(chat_id_str):
+                if task.get('active', True) and task.get('id') is not None:
+                    search_index.add(task['id'], task)
+                    by_id[task['id']] = task
+            cached = _archive_search[chat_id_str] = (search_index, by_id)
+    search_index, by_id = cached
+    results = sorted(search_index.search(query), key=lambda item: -item[0])
+    return [by_id[task_id] for _, task_id in results]
+
 def update_settings(chat_id: int, settings: Dict) -> None:
     """Update settings for a chat"""
-    chat_data = get_chat_data(chat_id)
-    
-    if 'settings' not in chat_data:
-        chat_data['settings'] = {}
+    with chat_transaction(chat_id) as chat_data:
+        if 'settings' not in chat_data:
+            chat_data['settings'] = {}
     
-    chat_data['settings'].update(settings)
-    update_chat_data(chat_id, chat_data)
+        chat_data['settings'].update(settings)
+        mark_dirty(chat_id, key='settings')
 
 def update_chat_type(chat_id: int, chat_type: str) -> None:
     """Update the type of a chat (user, group, etc.)"""
-    chat_data = get_chat_data(chat_id)
-    chat_data['type'] = chat_type
-    update_chat_data(chat_id, chat_data)
+    with chat_transaction(chat_id) as chat_data:
+        chat_data['type'] = chat_type
+        _recount_chat(str(chat_id))
+        mark_dirty(chat_id, key='type')
+
+def migrate_chat(old_chat_id: int, new_chat_id: int) -> bool:
+    """Move a chat's data to its new ID after a group was upgraded to a supergroup
+    
+    If the new chat already has tasks, the old ones are appended with fresh
+    IDs. The old chat is left with no tasks and a 'liveness' record pointing
+    at the new ID. Returns False if there was nothing to move.
+    """
+    old_str, new_str = str(old_chat_id), str(new_chat_id)
+    if old_str == new_str or old_str not in _data:
+        return False
+    first, second = sorted((old_str, new_str))
+    with _chat_locked(first), _chat_locked(second):
+        old_data = _data[old_str]
+        if old_data.get('liveness', {}).get('state') == 'migrated':
+            return False
+        
+        new_data = _data.get(new_str)
+        if new_data is None or not new_data.get('tasks'):
+            new_data = dict(old_data, type='supergroup')
+        else:
+            for task in old_data.get('tasks', []):
+                task['id'] = _new_task_id(new_data)
+                new_data['tasks'].append(task)
+        new_data.pop('liveness', None)
+        
+        old_data = {
+            'type': old_data.get('type'),
+            'tasks': [],
+            'settings': old_data.get('settings', {}),
+            'liveness': {'state': 'migrated', 'to': new_str, 'since': iso_now()},
+        }
+        _chat_replaced(new_str, new_data)
+        _chat_replaced(old_str, old_data)
+        _archive_search.pop(old_str, None)
+        _archive_search.pop(new_str, None)
+        
+        old_archive, new_archive = task_archive.archive_path(old_str), task_archive.archive_path(new_str)
+        if os.path.exists(old_archive):
+            if os.path.exists(new_archive):
+                logger.warning(f"Chat {new_str} already has an archive; left {old_archive} in place")
+            else:
+                os.replace(old_archive, new_archive)
+    logger.info(f"Migrated chat {old_str} to {new_str}")
+    return True
 
 def get_all_chat_ids() -> List[str]:
     """Get all chat IDs"""
-    return list(_data.keys())
+    with _lock:
+        return list(_data.keys())
 
 def get_stats() -> Dict[str, Any]:
     """Get statistics about the bot usage"""
-    stats = {
-        'total_chats': len(_data),
-        'total_users': sum(1 for chat_id, data in _data.items() if data.get('type') == 'user'),
-        'total_groups': sum(1 for chat_id, data in _data.items() if data.get('type') in ['group', 'supergroup']),
-        'total_tasks': sum(len(data.get('tasks', [])) for data in _data.values()),
-        'active_tasks': sum(
-            sum(1 for task in data.get('tasks', []) if task.get('active', True) and not task.get('done', False))
-            for data in _data.values()
-        ),
-        'completed_tasks': sum(
-            sum(1 for task in data.get('tasks', []) if task.get('done', True) and task.get('active', True))
-            for data in _data.values()
-        )
-    }
-    return stats
+    if _loaded:
+        with _lock:
+            return dict(_counters)
+    
+    if STORAGE_BACKEND == 'sqlite':
+        # The web dashboard can run in its own process without loading the data
+        if not sqlite_store.is_open():
+            sqlite_store.open_store(SQLITE_FILE)
+        return sqlite_store.aggregate_stats()
+    return dict.fromkeys(_STAT_KEYS, 0)
 
 def iso_now() -> str:
     """Get current date and time in ISO format"""
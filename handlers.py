@@ -1,7 +1,10 @@
 import logging
+import threading
 import time
 import random
+from concurrent.futures import as_completed
 from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ParseMode
 from telegram.ext import CallbackContext
 from telegram.error import BadRequest, Unauthorized, TimedOut, NetworkError
@@ -17,12 +20,20 @@ from config import (
     GROUP_WELCOME_MESSAGE, 
     COMMANDS, 
     DEVELOPER_COMMANDS,
-    DEVELOPER_IDS
+    DEVELOPER_IDS,
+    MESSAGE_DELETE_WINDOW
 )
 from database import (
     get_chat_data, 
     add_task, 
     get_tasks, 
+    get_task,
+    is_task_id,
+    count_open_tasks,
+    get_tasks_due_between,
+    get_tasks_by_priority,
+    get_categories,
+    update_task,
     mark_task_done, 
     delete_task, 
     clear_tasks, 
@@ -31,7 +42,12 @@ from database import (
     update_chat_type,
     get_all_chat_ids,
     get_stats,
-    update_chat_data,
+    recount_stats,
+    search_tasks,
+    search_all_tasks,
+    search_archived_tasks,
+    chat_transaction,
+    mark_dirty,
     iso_now
 )
 from utils import (
@@ -44,6 +60,15 @@ from utils import (
     log_command_usage
 )
 
+import send_queue
+import broadcast_jobs
+import job_runner
+import update_pool
+import chat_registry
+import outbox
+import message_ledger
+import callback_router
+import payload_store
 from keyboards import (
     get_task_list_keyboard,
     get_settings_keyboard,
@@ -144,7 +169,6 @@ def add_task_handler(update: Update, context: CallbackContext) -> None:
     
     # Add the task to the database
     task = add_task(chat_id, task_text)
-    task_index = len(get_tasks(chat_id)) - 1  # Get index of newly added task
     
     # Get chat type to personalize the message
     is_group = chat_type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]
@@ -156,7 +180,7 @@ def add_task_handler(update: Update, context: CallbackContext) -> None:
     )
     
     # Set up reminder keyboard for the task
-    keyboard = get_time_selection_keyboard(task_index)
+    keyboard = get_time_selection_keyboard(task['id'])
     
     update.message.reply_text(
         success_message,
@@ -227,9 +251,9 @@ def done_task_handler(update: Update, context: CallbackContext) -> None:
     try:
         # User provided a task index, try to mark it as done
         task_index = int(context.args[0]) - 1  # Convert to 0-based index
+        tasks = get_tasks(chat_id)
         
-        if mark_task_done(chat_id, task_index):
-            tasks = get_tasks(chat_id, include_done=True)
+        if 0 <= task_index < len(tasks) and mark_task_done(chat_id, tasks[task_index]['id']):
             task_text = tasks[task_index]['text']
             
             update.message.reply_text(
@@ -275,7 +299,7 @@ def delete_task_handler(update: Update, context: CallbackContext) -> None:
         
         if 0 <= task_index < len(tasks):
             task_text = tasks[task_index]['text']
-            keyboard = get_confirmation_keyboard(f"delete:{task_index}")
+            keyboard = get_confirmation_keyboard(f"delete:{tasks[task_index]['id']}")
             
             update.message.reply_text(
                 f"Are you sure you want to delete this task?\n\n*{task_text}*",
@@ -344,7 +368,7 @@ def remind_task_handler(update: Update, context: CallbackContext) -> None:
                     current_time = get_current_time()
                     relative_time = reminder_time - current_time
                     
-                    if set_reminder(chat_id, task_index, reminder_time):
+                    if set_reminder(chat_id, tasks[task_index]['id'], reminder_time):
                         task_text = tasks[task_index]['text']
                         
                         # Format relative time for display
@@ -370,7 +394,7 @@ def remind_task_handler(update: Update, context: CallbackContext) -> None:
             else:
                 # Show time selection keyboard
                 task_text = tasks[task_index]['text']
-                keyboard = get_time_selection_keyboard(task_index)
+                keyboard = get_time_selection_keyboard(tasks[task_index]['id'])
                 
                 update.message.reply_text(
                     f"Select when to be reminded about:\n\n*{task_text}*",
@@ -409,160 +433,179 @@ def button_callback_handler(update: Update, context: CallbackContext) -> None:
         update.callback_query.answer("Bot is currently in maintenance mode.")
         return
         
+    # Acknowledge the button press
+    update.callback_query.answer()
+    
+    # Each button's handler is registered below with callback_router.route
+    callback_router.dispatch(update, context)
+
+def _task_id(value: str) -> str:
+    """Decode the task ID of a button, refusing the list positions of buttons made before tasks had IDs"""
+    if not is_task_id(value):
+        raise callback_router.OutdatedButton("🔄 This list is outdated. Please refresh it and try again.")
+    return value
+
+# New handlers for add_task from text messages
+@callback_router.route("add_task:", payload_store.resolve)
+def add_task_callback(update: Update, context: CallbackContext, task_text: Optional[str]) -> None:
+    """Add task directly from message text"""
     query = update.callback_query
-    data = query.data
     chat_id = update.effective_chat.id
     
-    # Import chat types
-    from config import CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP
-    user_id = update.callback_query.from_user.id
+    if task_text is None:
+        query.edit_message_text("⌛ This button has expired. Please send the task again.")
+        return
     
-    # Acknowledge the button press
-    query.answer()
+    # Add the task to the database
+    task = add_task(chat_id, task_text)
     
-    # Process different button actions
-    # New handlers for add_task from text messages
-    if data.startswith("add_task:"):
-        # Add task directly from message text
-        task_text = data.split(":", 1)[1]
-        
-        # Add the task to the database
-        task = add_task(chat_id, task_text)
-        
-        # Update statistics
-        chat_data = get_chat_data(chat_id)
+    # Update statistics
+    with chat_transaction(chat_id) as chat_data:
         if 'stats' in chat_data:
             chat_data['stats']['tasks_added'] = chat_data['stats'].get('tasks_added', 0) + 1
             chat_data['stats']['last_active'] = iso_now()
-            update_chat_data(chat_id, chat_data)
-        
-        # Check if private chat and offer quick actions
-        is_private = update.effective_chat.type == CHAT_TYPE_PRIVATE
-        if is_private:
-            # Provide quick action buttons for the new task
-            keyboard = [
-                [
-                    InlineKeyboardButton("⏰ Add Reminder", callback_data=f"add_reminder:{len(get_tasks(chat_id))-1}"),
-                    InlineKeyboardButton("🔝 Set Priority", callback_data=f"set_priority:{len(get_tasks(chat_id))-1}")
-                ],
-                [
-                    InlineKeyboardButton("🏷️ Add Tag", callback_data=f"add_tag:{len(get_tasks(chat_id))-1}"),
-                    InlineKeyboardButton("📋 View All Tasks", callback_data="list_tasks")
-                ]
-            ]
-            
-            # Reply with confirmation and action buttons
-            query.edit_message_text(
-                f"✅ Task added successfully:\n\n*{task_text}*\n\nWhat would you like to do with this task?",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.MARKDOWN
-            )
-        else:
-            # Standard confirmation for group chats
-            query.edit_message_text(
-                f"✅ Task added successfully:\n\n*{task_text}*\n\nUse /list to view all your tasks.",
-                parse_mode=ParseMode.MARKDOWN
-            )
+        mark_dirty(chat_id, key='stats')
     
-    # New handlers for enhanced private chat functionality
-    elif data == "add_task_help":
-        # Provide help for adding tasks in private chat
+    # Check if private chat and offer quick actions
+    is_private = update.effective_chat.type == CHAT_TYPE_PRIVATE
+    if is_private:
+        # Provide quick action buttons for the new task
+        keyboard = [
+            [
+                InlineKeyboardButton("⏰ Add Reminder", callback_data=f"remind:{task['id']}"),
+                InlineKeyboardButton("🔝 Set Priority", callback_data=f"set_priority:{task['id']}")
+            ],
+            [
+                InlineKeyboardButton("🏷️ Add Tag", callback_data=f"add_tag:{task['id']}"),
+                InlineKeyboardButton("📋 View All Tasks", callback_data="list_tasks")
+            ]
+        ]
+        
+        # Reply with confirmation and action buttons
         query.edit_message_text(
-            "➕ *Adding Tasks*\n\n"
-            "Here are different ways to add tasks:\n\n"
-            "• Simply type your task (e.g., 'Buy milk')\n"
-            "• Use `/add Buy groceries` command\n"
-            "• Add with deadline: `/add Meeting with John tomorrow 2pm`\n"
-            "• Add with priority: `/add Important presentation #high`\n"
-            "• Add with category: `/add Buy gift for mom #shopping`\n\n"
-            "You can also combine these options!",
+            f"✅ Task added successfully:\n\n*{task_text}*\n\nWhat would you like to do with this task?",
+            reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.MARKDOWN
         )
-    
-    elif data == "list_tasks":
-        # Show task list (shortcut for /list command)
-        tasks = get_tasks(chat_id)
-        if tasks:
-            task_text = "📋 *Your Tasks*\n\n" + format_task_list(tasks)
-            keyboard = get_task_list_keyboard(tasks)
-            query.edit_message_text(
-                task_text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.MARKDOWN
-            )
-        else:
-            query.edit_message_text(
-                "📝 You don't have any tasks yet. Use /add to create one!"
-            )
-        
-    elif data.startswith("add_task_reminder:"):
-        # Add task with reminder from message text
-        task_text = data.split(":", 1)[1]
-        
-        # Add the task to the database
-        task = add_task(chat_id, task_text)
-        
-        # Find the task index in the active tasks list
-        tasks = get_tasks(chat_id)
-        task_index = next((i for i, t in enumerate(tasks) if t['text'] == task['text']), 0)
-        
-        # Show time selection for reminder
-        keyboard = get_time_selection_keyboard(task_index)
-        
-        # Check if this is a group chat for friendlier message
-        is_group = update.effective_chat.type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]
-        
+    else:
+        # Standard confirmation for group chats
         query.edit_message_text(
-            f"⏰ Task added! When should I remind {'everyone' if is_group else 'you'} about:\n\n*{task_text}*",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            f"✅ Task added successfully:\n\n*{task_text}*\n\nUse /list to view all your tasks.",
             parse_mode=ParseMode.MARKDOWN
         )
-        
-    elif data.startswith("assign_group:"):
-        # Add a task specifically for the group (everyone)
-        task_text = data.split(":", 1)[1]
-        
-        # Check if we're actually in a group chat
-        is_group = update.effective_chat.type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]
-        if not is_group:
-            query.edit_message_text(
-                "⚠️ This option is only available in group chats.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            return
-        
-        # Add the task to the database with group tag
-        task = add_task(chat_id, task_text, category="Group Task")
-        
-        # Find the task index in the active tasks list
-        tasks = get_tasks(chat_id)
-        task_index = next((i for i, t in enumerate(tasks) if t['text'] == task['text']), 0)
-        
-        # Show time selection for reminder
-        keyboard = get_time_selection_keyboard(task_index)
-        
+
+# New handlers for enhanced private chat functionality
+@callback_router.route("add_task_help")
+def add_task_help_callback(update: Update, context: CallbackContext) -> None:
+    """Provide help for adding tasks in private chat"""
+    query = update.callback_query
+    query.edit_message_text(
+        "➕ *Adding Tasks*\n\n"
+        "Here are different ways to add tasks:\n\n"
+        "• Simply type your task (e.g., 'Buy milk')\n"
+        "• Use `/add Buy groceries` command\n"
+        "• Add with deadline: `/add Meeting with John tomorrow 2pm`\n"
+        "• Add with priority: `/add Important presentation #high`\n"
+        "• Add with category: `/add Buy gift for mom #shopping`\n\n"
+        "You can also combine these options!",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("list_tasks")
+def list_tasks_callback(update: Update, context: CallbackContext) -> None:
+    """Show task list (shortcut for /list command)"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    tasks = get_tasks(chat_id)
+    if tasks:
+        task_text = "📋 *Your Tasks*\n\n" + format_task_list(tasks)
+        keyboard = get_task_list_keyboard(tasks)
         query.edit_message_text(
-            f"👥 *Group Task Added!*\n\nWhen should I remind everyone about:\n*{task_text}*",
+            task_text,
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.MARKDOWN
         )
-        
-    elif data == "cancel_add_task":
-        # User declined to add the message as task
+    else:
+        query.edit_message_text(
+            "📝 You don't have any tasks yet. Use /add to create one!"
+        )
+
+@callback_router.route("add_task_reminder:", payload_store.resolve)
+def add_task_reminder_callback(update: Update, context: CallbackContext, task_text: Optional[str]) -> None:
+    """Add task with reminder from message text"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    
+    if task_text is None:
+        query.edit_message_text("⌛ This button has expired. Please send the task again.")
+        return
+    
+    # Add the task to the database
+    task = add_task(chat_id, task_text)
+    
+    # Show time selection for reminder
+    keyboard = get_time_selection_keyboard(task['id'])
+    
+    # Check if this is a group chat for friendlier message
+    is_group = update.effective_chat.type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]
+    
+    query.edit_message_text(
+        f"⏰ Task added! When should I remind {'everyone' if is_group else 'you'} about:\n\n*{task_text}*",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("assign_group:", payload_store.resolve)
+def assign_group_callback(update: Update, context: CallbackContext, task_text: Optional[str]) -> None:
+    """Add a task specifically for the group (everyone)"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    
+    if task_text is None:
+        query.edit_message_text("⌛ This button has expired. Please send the task again.")
+        return
+    
+    # Check if we're actually in a group chat
+    is_group = update.effective_chat.type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]
+    if not is_group:
         query.edit_message_text(
-            "⏹️ Message not added as a task.",
+            "⚠️ This option is only available in group chats.",
             parse_mode=ParseMode.MARKDOWN
         )
+        return
     
-    elif data.startswith("done:"):
-        # Mark task as done
-        task_index = int(data.split(":")[1])
-        if mark_task_done(chat_id, task_index):
-            tasks = get_tasks(chat_id, include_done=True)
-            task_text = tasks[task_index]['text']
-            
-            # Update statistics
-            chat_data = get_chat_data(chat_id)
+    # Add the task to the database with group tag
+    task = add_task(chat_id, task_text, category="Group Task")
+    
+    # Show time selection for reminder
+    keyboard = get_time_selection_keyboard(task['id'])
+    
+    query.edit_message_text(
+        f"👥 *Group Task Added!*\n\nWhen should I remind everyone about:\n*{task_text}*",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("cancel_add_task")
+def cancel_add_task_callback(update: Update, context: CallbackContext) -> None:
+    """User declined to add the message as task"""
+    query = update.callback_query
+    query.edit_message_text(
+        "⏹️ Message not added as a task.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("done:", _task_id)
+def done_callback(update: Update, context: CallbackContext, task_id: str) -> None:
+    """Mark task as done"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    task = get_task(chat_id, task_id)
+    if task is not None and mark_task_done(chat_id, task_id):
+        task_text = task['text']
+        
+        # Update statistics
+        with chat_transaction(chat_id) as chat_data:
             if 'stats' in chat_data:
                 chat_data['stats']['tasks_completed'] = chat_data['stats'].get('tasks_completed', 0) + 1
                 chat_data['stats']['last_active'] = iso_now()
@@ -589,458 +632,509 @@ def button_callback_handler(update: Update, context: CallbackContext) -> None:
                 else:
                     # First completion
                     chat_data['stats']['streaks']['current'] = 1
-                    
+                
                 # Update last completion date
                 chat_data['stats']['streaks']['last_completion_date'] = now.isoformat()
-                update_chat_data(chat_id, chat_data)
-            
-            # Update the message to reflect the change
-            query.edit_message_text(
-                f"✅ Task marked as done: *{task_text}*",
-                parse_mode=ParseMode.MARKDOWN
-            )
-    
-    elif data.startswith("delete:"):
-        # Show confirmation for task deletion
-        task_index = int(data.split(":")[1])
-        tasks = get_tasks(chat_id)
+            mark_dirty(chat_id, key='stats')
         
-        if 0 <= task_index < len(tasks):
-            task_text = tasks[task_index]['text']
-            keyboard = get_confirmation_keyboard(f"delete:{task_index}")
-            
-            query.edit_message_text(
-                f"Are you sure you want to delete this task?\n\n*{task_text}*",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.MARKDOWN
-            )
-    
-    elif data.startswith("confirm_delete:"):
-        # Extract task index from original message
-        original_text = query.message.text
-        try:
-            task_index_match = original_text.strip().split("delete:")[1]
-            task_index = int(task_index_match)
-            
-            if delete_task(chat_id, task_index):
-                tasks = get_tasks(chat_id, include_done=True)
-                task_text = tasks[task_index]['text'] if task_index < len(tasks) else "Unknown task"
-                
-                query.edit_message_text(
-                    f"🗑️ Task deleted: *{task_text}*",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            else:
-                query.edit_message_text("❌ Failed to delete task. Please try again.")
-        except (IndexError, ValueError):
-            query.edit_message_text("❌ Error processing task deletion. Please try again.")
+        # Update the message to reflect the change
+        query.edit_message_text(
+            f"✅ Task marked as done: *{task_text}*",
+            parse_mode=ParseMode.MARKDOWN
+        )
     
-    elif data == "cancel_delete":
-        query.edit_message_text("❌ Task deletion canceled.")
+@callback_router.route("delete:", _task_id)
+def delete_callback(update: Update, context: CallbackContext, task_id: str) -> None:
+    """Show confirmation for task deletion"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    task = get_task(chat_id, task_id)
         
-    elif data == "confirm_clear":
-        count = clear_tasks(chat_id)
-        query.edit_message_text(f"🧹 Cleared {count} tasks.")
+    if task is not None and task.get('active', True):
+        task_text = task['text']
+        keyboard = get_confirmation_keyboard(f"delete:{task_id}")
         
-    elif data == "cancel_clear":
-        query.edit_message_text("❌ Clear operation canceled.")
+        query.edit_message_text(
+            f"Are you sure you want to delete this task?\n\n*{task_text}*",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
         
-    elif data.startswith("remind:"):
-        # Show time selection for reminder
-        task_index = int(data.split(":")[1])
-        tasks = get_tasks(chat_id)
+@callback_router.route("confirm_delete:", _task_id)
+def confirm_delete_callback(update: Update, context: CallbackContext, task_id: str) -> None:
+    """Delete a task once the user confirmed"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    try:
+        task = get_task(chat_id, task_id)
         
-        if 0 <= task_index < len(tasks):
-            task_text = tasks[task_index]['text']
-            keyboard = get_time_selection_keyboard(task_index)
-            
-            # Check if this is a group chat
-            is_group = update.effective_chat.type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]
+        if task is not None and delete_task(chat_id, task_id):
+            task_text = task['text']
             
             query.edit_message_text(
-                f"⏰ *When should I remind {'everyone' if is_group else 'you'} about:*\n\n*{task_text}*",
-                reply_markup=InlineKeyboardMarkup(keyboard),
+                f"🗑️ Task deleted: *{task_text}*",
                 parse_mode=ParseMode.MARKDOWN
             )
+        else:
+            query.edit_message_text("❌ Failed to delete task. Please try again.")
+    except (IndexError, ValueError):
+        query.edit_message_text("❌ Error processing task deletion. Please try again.")
+        
+@callback_router.route("cancel_delete")
+def cancel_delete_callback(update: Update, context: CallbackContext) -> None:
+    """Cancel task deletion"""
+    query = update.callback_query
+    query.edit_message_text("❌ Task deletion canceled.")
+        
+@callback_router.route("confirm_clear")
+def confirm_clear_callback(update: Update, context: CallbackContext) -> None:
+    """Clear all tasks of the chat once the user confirmed"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    count = clear_tasks(chat_id)
+    query.edit_message_text(f"🧹 Cleared {count} tasks.")
+
+@callback_router.route("cancel_clear")
+def cancel_clear_callback(update: Update, context: CallbackContext) -> None:
+    """Cancel clearing tasks"""
+    query = update.callback_query
+    query.edit_message_text("❌ Clear operation canceled.")
+
+@callback_router.route("remind:", _task_id)
+def remind_callback(update: Update, context: CallbackContext, task_id: str) -> None:
+    """Show time selection for reminder"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    task = get_task(chat_id, task_id)
     
-    elif data == "cancel_reminder":
-        # User cancelled setting a reminder
+    if task is not None:
+        task_text = task['text']
+        keyboard = get_time_selection_keyboard(task_id)
+        
+        # Check if this is a group chat
+        is_group = update.effective_chat.type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]
+        
         query.edit_message_text(
-            "⏹️ Reminder setup cancelled.",
+            f"⏰ *When should I remind {'everyone' if is_group else 'you'} about:*\n\n*{task_text}*",
+            reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.MARKDOWN
         )
         
-    # Chat cleanup actions
-    elif data.startswith("clean_chat:"):
-        action = data.split(":", 1)[1]
-        chat_type = update.effective_chat.type
-        
-        if action == "bot_only":
-            # Try to clean up recent bot messages
-            try:
-                # Delete the prompt message
-                query.message.delete()
-                
-                # Show temporary confirmation message that will self-destruct
-                cleanup_msg = context.bot.send_message(
-                    chat_id=chat_id,
-                    text="🧹 *Cleaning up my messages...*\n(This message will disappear in a few seconds)",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                
-                # Schedule this message for deletion too
-                context.job_queue.run_once(
-                    lambda job_context: cleanup_msg.delete(),
-                    5,  # 5 seconds delay
-                    context=None
-                )
-                
-                # If we have a record of recent bot messages in this chat, try to delete them
-                if context.chat_data.get('cleanup_messages'):
-                    for msg_data in context.chat_data['cleanup_messages']:
-                        try:
-                            # Try to delete both command and prompt messages
-                            context.bot.delete_message(chat_id=chat_id, message_id=msg_data['command_id'])
-                            context.bot.delete_message(chat_id=chat_id, message_id=msg_data['prompt_id'])
-                        except Exception as e:
-                            logger.debug(f"Could not delete message {msg_data['prompt_id']}: {e}")
-                    
-                    # Clear the cleanup messages list
-                    context.chat_data['cleanup_messages'] = []
-                
-                logger.info(f"Chat cleanup (bot messages) executed in {chat_id}")
-                
-            except Exception as e:
-                logger.error(f"Error during chat cleanup: {e}")
-                # Don't send error message to avoid adding more clutter
-        
-        elif action == "tasks":
-            # In group chats, offer to clean all task listings
-            if chat_type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]:
-                # Show a confirmation keyboard first
-                keyboard = [
-                    [
-                        InlineKeyboardButton("✅ Yes, clean all", callback_data="confirm_clear"),
-                        InlineKeyboardButton("❌ No, cancel", callback_data="cancel_clear")
-                    ]
-                ]
-                
-                query.edit_message_text(
-                    "⚠️ *Are you sure?*\n\nThis will clear ALL tasks for this group. This action cannot be undone.",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                
-            else:
-                # For private chats, do the same
-                keyboard = [
-                    [
-                        InlineKeyboardButton("✅ Yes, clean all", callback_data="confirm_clear"),
-                        InlineKeyboardButton("❌ No, cancel", callback_data="cancel_clear")
-                    ]
-                ]
+@callback_router.route("cancel_reminder")
+def cancel_reminder_callback(update: Update, context: CallbackContext) -> None:
+    """User cancelled setting a reminder"""
+    query = update.callback_query
+    query.edit_message_text(
+        "⏹️ Reminder setup cancelled.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    
+# Chat cleanup actions
+@callback_router.route("clean_chat:")
+def clean_chat_callback(update: Update, context: CallbackContext, action: str) -> None:
+    """Run the cleanup action picked in the /clean menu"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    chat_type = update.effective_chat.type
+            
+    if action == "bot_only":
+        # Try to clean up recent bot messages
+        try:
+            # Delete the prompt message
+            query.message.delete()
                 
-                query.edit_message_text(
-                    "⚠️ *Are you sure?*\n\nThis will clear ALL your tasks. This action cannot be undone.",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode=ParseMode.MARKDOWN
-                )
+            # Show temporary confirmation message that will self-destruct
+            cleanup_msg = context.bot.send_message(
+                chat_id=chat_id,
+                text="🧹 *Cleaning up my messages...*\n(This message will disappear in a few seconds)",
+                parse_mode=ParseMode.MARKDOWN
+            )
+    
+            # Schedule this message for deletion too, once the cleanup is done
+            def delete_cleanup_msg(job_context):
+                cleanup_msg.delete()
+                message_ledger.discard(chat_id, [cleanup_msg.message_id])
+            
+            # Delete the bot messages the ledger recorded that Telegram still lets us delete
+            since = time.time() - MESSAGE_DELETE_WINDOW
+            message_ids = [
+                message_id for message_id, timestamp in message_ledger.recent(chat_id, since)
+                if message_id not in (query.message.message_id, cleanup_msg.message_id)
+            ]
+            progress = {'left': len(message_ids), 'deleted': 0}
+            progress_lock = threading.Lock()
+            
+            def finish_cleanup():
+                # Deleted or not, they are done with
+                message_ledger.discard(chat_id, message_ids + [query.message.message_id])
+                try:
+                    cleanup_msg.edit_text(
+                        f"🧹 *Cleaned up {progress['deleted']} of my messages*\n(This message will disappear in a few seconds)",
+                        parse_mode=ParseMode.MARKDOWN
+                    )
+                except Exception as e:
+                    logger.debug(f"Could not update cleanup message in {chat_id}: {e}")
+                context.job_queue.run_once(delete_cleanup_msg, 5, context=None)
+                logger.info(f"Chat cleanup (bot messages) executed in {chat_id}: {progress['deleted']} deleted")
+            
+            def message_deleted(future, message_id):
+                error = future.exception()
+                if error is not None:
+                    logger.debug(f"Could not delete message {message_id}: {error}")
+                with progress_lock:
+                    progress['deleted'] += error is None
+                    progress['left'] -= 1
+                    done = progress['left'] == 0
+                if done:
+                    finish_cleanup()
+            
+            # Deletions wait behind other traffic in the maintenance class, so
+            # they finish in the background instead of holding up this chat's updates
+            delete = context.bot.raw('delete_message')
+            for message_id in message_ids:
+                future = send_queue.submit(delete, 'delete', 'maintenance', chat_id=chat_id, message_id=message_id)
+                future.add_done_callback(lambda future, message_id=message_id: message_deleted(future, message_id))
+            if not message_ids:
+                finish_cleanup()
                 
-        elif action == "completed":
-            # Only for private chats, clear completed tasks
-            # First offer confirmation
+        except Exception as e:
+            logger.error(f"Error during chat cleanup: {e}")
+            # Don't send error message to avoid adding more clutter
+    
+    elif action == "tasks":
+        # In group chats, offer to clean all task listings
+        if chat_type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]:
+            # Show a confirmation keyboard first
             keyboard = [
                 [
-                    InlineKeyboardButton("✅ Yes, clear completed", callback_data="confirm_clear_completed"),
+                    InlineKeyboardButton("✅ Yes, clean all", callback_data="confirm_clear"),
                     InlineKeyboardButton("❌ No, cancel", callback_data="cancel_clear")
                 ]
             ]
             
             query.edit_message_text(
-                "⚠️ *Clear completed tasks?*\n\nThis will remove all completed tasks from your list.",
+                "⚠️ *Are you sure?*\n\nThis will clear ALL tasks for this group. This action cannot be undone.",
                 reply_markup=InlineKeyboardMarkup(keyboard),
                 parse_mode=ParseMode.MARKDOWN
             )
             
-        elif action == "cancel":
-            query.edit_message_text(
-                "❌ Cleanup operation cancelled.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-    
-    elif data == "confirm_clear_completed":
-        # Clear only completed tasks
-        try:
-            # Get all tasks for this chat
-            chat_data = get_chat_data(chat_id)
-            tasks = chat_data.get('tasks', [])
-            
-            # Count how many completed tasks we have
-            completed_count = sum(1 for task in tasks if task.get('done', False))
-            
-            # Filter out completed tasks
-            chat_data['tasks'] = [task for task in tasks if not task.get('done', False)]
-            update_chat_data(chat_id, chat_data)
+        else:
+            # For private chats, do the same
+            keyboard = [
+                [
+                    InlineKeyboardButton("✅ Yes, clean all", callback_data="confirm_clear"),
+                    InlineKeyboardButton("❌ No, cancel", callback_data="cancel_clear")
+                ]
+            ]
             
             query.edit_message_text(
-                f"🧹 Cleared {completed_count} completed tasks.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            
-        except Exception as e:
-            logger.error(f"Error clearing completed tasks: {e}")
-            query.edit_message_text(
-                "❌ There was an error clearing your completed tasks. Please try again later.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-
-    # Private chat enhanced functionality - priorities and tags
-    elif data.startswith("set_priority:"):
-        # Show priority selection for a task
-        task_index = int(data.split(":")[1])
-        tasks = get_tasks(chat_id)
-        
-        if 0 <= task_index < len(tasks):
-            task_text = tasks[task_index]['text']
-            
-            # Create priority selection keyboard
-            keyboard = [
-                [
-                    InlineKeyboardButton("🔴 High", callback_data=f"priority:{task_index}:high"),
-                    InlineKeyboardButton("🟡 Medium", callback_data=f"priority:{task_index}:medium"),
-                    InlineKeyboardButton("🟢 Low", callback_data=f"priority:{task_index}:low")
-                ],
-                [
-                    InlineKeyboardButton("❌ Cancel", callback_data="cancel_priority")
-                ]
-            ]
-            
-            query.edit_message_text(
-                f"🔝 *Select Priority Level*\n\nTask: *{task_text}*",
-                reply_markup=InlineKeyboardMarkup(keyboard),
+                "⚠️ *Are you sure?*\n\nThis will clear ALL your tasks. This action cannot be undone.",
+                reply_markup=InlineKeyboardMarkup(keyboard),
                 parse_mode=ParseMode.MARKDOWN
             )
     
-    elif data.startswith("priority:"):
-        # Set priority for a task
-        parts = data.split(":")
-        task_index = int(parts[1])
-        priority_level = parts[2]
+    elif action == "completed":
+        # Only for private chats, clear completed tasks
+        # First offer confirmation
+        keyboard = [
+            [
+                InlineKeyboardButton("✅ Yes, clear completed", callback_data="confirm_clear_completed"),
+                InlineKeyboardButton("❌ No, cancel", callback_data="cancel_clear")
+            ]
+        ]
         
-        tasks = get_tasks(chat_id)
+        query.edit_message_text(
+            "⚠️ *Clear completed tasks?*\n\nThis will remove all completed tasks from your list.",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
         
-        if 0 <= task_index < len(tasks):
-            # Get the task and update its priority
-            chat_data = get_chat_data(chat_id)
-            if 'tasks' in chat_data and task_index < len(chat_data['tasks']):
-                task = chat_data['tasks'][task_index]
-                task['priority'] = priority_level
-                update_chat_data(chat_id, chat_data)
-                
-                # Get emoji for priority level
-                priority_emoji = "🔴" if priority_level == "high" else "🟡" if priority_level == "medium" else "🟢"
-                
-                # Success message with task details and options for further actions
-                keyboard = [
-                    [
-                        InlineKeyboardButton("⏰ Add Reminder", callback_data=f"remind:{task_index}"),
-                        InlineKeyboardButton("🏷️ Add Tag", callback_data=f"add_tag:{task_index}")
-                    ],
-                    [
-                        InlineKeyboardButton("📋 View All Tasks", callback_data="list_tasks")
-                    ]
-                ]
-                
-                query.edit_message_text(
-                    f"{priority_emoji} Priority set to *{priority_level.upper()}* for task:\n\n*{task['text']}*",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            else:
-                query.edit_message_text("❌ Task not found. It may have been deleted.")
-    
-    elif data == "cancel_priority":
-        # Cancel priority setting
+    elif action == "cancel":
         query.edit_message_text(
-            "❌ Priority setting cancelled.",
+            "❌ Cleanup operation cancelled.",
             parse_mode=ParseMode.MARKDOWN
         )
-    
-    elif data.startswith("add_tag:"):
-        # Show tag selection or entry UI
-        task_index = int(data.split(":")[1])
-        tasks = get_tasks(chat_id)
         
-        if 0 <= task_index < len(tasks):
-            task_text = tasks[task_index]['text']
-            
-            # Get existing categories from all tasks
-            chat_data = get_chat_data(chat_id)
-            all_tasks = chat_data.get('tasks', [])
-            existing_categories = set()
-            for t in all_tasks:
-                if 'category' in t and t['category']:
-                    existing_categories.add(t['category'])
-            
-            # Create buttons for common categories
-            keyboard = []
-            
-            # Add buttons for existing categories (up to 6)
-            common_categories = list(existing_categories)[:6]
-            for i in range(0, len(common_categories), 2):
-                row = []
-                row.append(InlineKeyboardButton(f"#{common_categories[i]}", callback_data=f"tag:{task_index}:{common_categories[i]}"))
-                if i+1 < len(common_categories):
-                    row.append(InlineKeyboardButton(f"#{common_categories[i+1]}", callback_data=f"tag:{task_index}:{common_categories[i+1]}"))
-                keyboard.append(row)
-            
-            # Add preset common tags if we have few existing ones
-            if len(existing_categories) < 4:
-                preset_categories = ["Work", "Personal", "Shopping", "Health", "Urgent", "Project"]
-                for cat in preset_categories:
-                    if cat not in existing_categories:
-                        common_categories.append(cat)
-                        if len(common_categories) >= 6:
-                            break
-            
-            # Add custom tag option and cancel
-            keyboard.append([InlineKeyboardButton("✏️ Custom Tag", callback_data=f"custom_tag:{task_index}")])
-            keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data="cancel_tag")])
-            
-            query.edit_message_text(
-                f"🏷️ *Select or Add a Tag*\n\nTask: *{task_text}*\n\nChoose from existing tags or create a custom one:",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.MARKDOWN
-            )
+@callback_router.route("confirm_clear_completed")
+def confirm_clear_completed_callback(update: Update, context: CallbackContext) -> None:
+    """Clear only completed tasks"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    try:
+        # Get all tasks for this chat
+        with chat_transaction(chat_id) as chat_data:
+            tasks = chat_data.get('tasks', [])
             
-            # Store that we're waiting for a custom tag entry
-            context.user_data['custom_tag_task'] = task_index
-    
-    elif data.startswith("tag:"):
-        # Apply a tag to a task
-        parts = data.split(":")
-        task_index = int(parts[1])
-        category = parts[2]
+            # Count how many completed tasks we have
+            completed_count = sum(1 for task in tasks if task.get('done', False))
         
-        # Update the task with the selected category
-        chat_data = get_chat_data(chat_id)
-        if 'tasks' in chat_data and task_index < len(chat_data['tasks']):
-            task = chat_data['tasks'][task_index]
-            task['category'] = category
-            update_chat_data(chat_id, chat_data)
-            
-            # Success message with further options
-            keyboard = [
-                [
-                    InlineKeyboardButton("⏰ Add Reminder", callback_data=f"remind:{task_index}"),
-                    InlineKeyboardButton("🔝 Set Priority", callback_data=f"set_priority:{task_index}")
-                ],
-                [
-                    InlineKeyboardButton("📋 View All Tasks", callback_data="list_tasks")
-                ]
-            ]
+            # Filter out completed tasks
+            chat_data['tasks'] = [task for task in tasks if not task.get('done', False)]
             
-            query.edit_message_text(
-                f"🏷️ Tag *#{category}* added to task:\n\n*{task['text']}*",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.MARKDOWN
-            )
-        else:
-            query.edit_message_text("❌ Task not found. It may have been deleted.")
-    
-    elif data.startswith("custom_tag:"):
-        # Store that we're waiting for custom tag input
-        task_index = int(data.split(":")[1])
-        context.user_data['custom_tag_task'] = task_index
-        
         query.edit_message_text(
-            "✏️ Please send me the name for your custom tag (one word without spaces).\n\n"
-            "Type 'cancel' to cancel.",
+            f"🧹 Cleared {completed_count} completed tasks.",
             parse_mode=ParseMode.MARKDOWN
         )
-    
-    elif data == "cancel_tag":
-        # Cancel tag addition
-        if 'custom_tag_task' in context.user_data:
-            del context.user_data['custom_tag_task']
-            
+        
+    except Exception as e:
+        logger.error(f"Error clearing completed tasks: {e}")
         query.edit_message_text(
-            "❌ Tag addition cancelled.",
+            "❌ There was an error clearing your completed tasks. Please try again later.",
             parse_mode=ParseMode.MARKDOWN
         )
+        
+# Private chat enhanced functionality - priorities and tags
+@callback_router.route("set_priority:", _task_id)
+def set_priority_callback(update: Update, context: CallbackContext, task_id: str) -> None:
+    """Show priority selection for a task"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    task = get_task(chat_id, task_id)
             
-    # Broadcast deletion related callbacks
-    elif data.startswith("delbroadcast:"):
-        # Only developers can delete broadcasts
-        if not is_developer(user_id):
-            query.answer("⚠️ Only developers can delete broadcasts.")
-            return
+    if task is not None:
+        task_text = task['text']
             
-        broadcast_id = data.split(":", 1)[1]
+        # Create priority selection keyboard
+        keyboard = [
+            [
+                InlineKeyboardButton("🔴 High", callback_data=f"priority:{task_id}:high"),
+                InlineKeyboardButton("🟡 Medium", callback_data=f"priority:{task_id}:medium"),
+                InlineKeyboardButton("🟢 Low", callback_data=f"priority:{task_id}:low")
+            ],
+            [
+                InlineKeyboardButton("❌ Cancel", callback_data="cancel_priority")
+            ]
+        ]
         
-        # Check if broadcast exists
-        if 'broadcasts' not in context.bot_data or broadcast_id not in context.bot_data['broadcasts']:
-            query.edit_message_text(f"❌ Broadcast with ID {broadcast_id} not found.")
-            return
-            
-        broadcast = context.bot_data['broadcasts'][broadcast_id]
-        sent_messages = broadcast.get('sent_messages', [])
-        message_preview = broadcast['message'][:100] + "..." if len(broadcast['message']) > 100 else broadcast['message']
+        query.edit_message_text(
+            f"🔝 *Select Priority Level*\n\nTask: *{task_text}*",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
         
-        # Ask for confirmation
+@callback_router.route("priority:", _task_id, str)
+def priority_callback(update: Update, context: CallbackContext, task_id: str, priority_level: str) -> None:
+    """Set priority for a task"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    
+    # Update the task's priority
+    task = update_task(chat_id, task_id, {'priority': priority_level})
+    if task is not None:
+        # Get emoji for priority level
+        priority_emoji = "🔴" if priority_level == "high" else "🟡" if priority_level == "medium" else "🟢"
+        
+        # Success message with task details and options for further actions
         keyboard = [
             [
-                InlineKeyboardButton("✅ Yes, delete all", callback_data=f"confirm_delbroadcast:{broadcast_id}"),
-                InlineKeyboardButton("❌ No, cancel", callback_data="cancel_delbroadcast")
+                InlineKeyboardButton("⏰ Add Reminder", callback_data=f"remind:{task_id}"),
+                InlineKeyboardButton("🏷️ Add Tag", callback_data=f"add_tag:{task_id}")
+            ],
+            [
+                InlineKeyboardButton("📋 View All Tasks", callback_data="list_tasks")
             ]
         ]
         
         query.edit_message_text(
-            f"🗑️ *Delete Broadcast Confirmation*\n\n"
-            f"You are about to delete this broadcast from {len(sent_messages)} chats:\n\n"
-            f"Message: {message_preview}\n\n"
-            f"Are you sure you want to proceed?",
+            f"{priority_emoji} Priority set to *{priority_level.upper()}* for task:\n\n*{task['text']}*",
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.MARKDOWN
         )
+    else:
+        query.edit_message_text("❌ Task not found. It may have been deleted.")
+
+@callback_router.route("cancel_priority")
+def cancel_priority_callback(update: Update, context: CallbackContext) -> None:
+    """Cancel priority setting"""
+    query = update.callback_query
+    query.edit_message_text(
+        "❌ Priority setting cancelled.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("add_tag:", _task_id)
+def add_tag_callback(update: Update, context: CallbackContext, task_id: str) -> None:
+    """Show tag selection or entry UI"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    task = get_task(chat_id, task_id)
+    
+    if task is not None:
+        task_text = task['text']
         
-    elif data.startswith("viewbroadcast:"):
-        # Only developers can view broadcasts
-        if not is_developer(user_id):
-            query.answer("⚠️ Only developers can view broadcast details.")
-            return
-            
-        broadcast_id = data.split(":", 1)[1]
+        # Get existing categories from all tasks
+        existing_categories = set(get_categories(chat_id))
         
-        # Check if broadcast exists
-        if 'broadcasts' not in context.bot_data or broadcast_id not in context.bot_data['broadcasts']:
-            query.edit_message_text(f"❌ Broadcast with ID {broadcast_id} not found.")
-            return
-            
-        broadcast = context.bot_data['broadcasts'][broadcast_id]
-        sent_messages = broadcast.get('sent_messages', [])
+        # Create buttons for common categories
+        keyboard = []
+        
+        # Add buttons for existing categories (up to 6)
+        common_categories = list(existing_categories)[:6]
+        for i in range(0, len(common_categories), 2):
+            row = []
+            row.append(InlineKeyboardButton(f"#{common_categories[i]}", callback_data=f"tag:{task_id}:{payload_store.ref(common_categories[i])}"))
+            if i+1 < len(common_categories):
+                row.append(InlineKeyboardButton(f"#{common_categories[i+1]}", callback_data=f"tag:{task_id}:{payload_store.ref(common_categories[i+1])}"))
+            keyboard.append(row)
         
+        # Add preset common tags if we have few existing ones
+        if len(existing_categories) < 4:
+            preset_categories = ["Work", "Personal", "Shopping", "Health", "Urgent", "Project"]
+            for cat in preset_categories:
+                if cat not in existing_categories:
+                    common_categories.append(cat)
+                    if len(common_categories) >= 6:
+                        break
+        
+        # Add custom tag option and cancel
+        keyboard.append([InlineKeyboardButton("✏️ Custom Tag", callback_data=f"custom_tag:{task_id}")])
+        keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data="cancel_tag")])
+        
+        query.edit_message_text(
+            f"🏷️ *Select or Add a Tag*\n\nTask: *{task_text}*\n\nChoose from existing tags or create a custom one:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+        
+        # Store that we're waiting for a custom tag entry
+        context.user_data['custom_tag_task'] = task_id
+
+@callback_router.route("tag:", _task_id, payload_store.resolve)
+def tag_callback(update: Update, context: CallbackContext, task_id: str, category: Optional[str]) -> None:
+    """Apply a tag to a task"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    
+    if category is None:
+        query.edit_message_text("⌛ This button has expired. Please open the tag menu again.")
+        return
+    
+    # Update the task with the selected category
+    task = update_task(chat_id, task_id, {'category': category})
+    if task is not None:
+        # Success message with further options
+        keyboard = [
+            [
+                InlineKeyboardButton("⏰ Add Reminder", callback_data=f"remind:{task_id}"),
+                InlineKeyboardButton("🔝 Set Priority", callback_data=f"set_priority:{task_id}")
+            ],
+            [
+                InlineKeyboardButton("📋 View All Tasks", callback_data="list_tasks")
+            ]
+        ]
+        
+        query.edit_message_text(
+            f"🏷️ Tag *#{category}* added to task:\n\n*{task['text']}*",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    else:
+        query.edit_message_text("❌ Task not found. It may have been deleted.")
+
+@callback_router.route("custom_tag:", _task_id)
+def custom_tag_callback(update: Update, context: CallbackContext, task_id: str) -> None:
+    """Store that we're waiting for custom tag input"""
+    query = update.callback_query
+    context.user_data['custom_tag_task'] = task_id
+    
+    query.edit_message_text(
+        "✏️ Please send me the name for your custom tag (one word without spaces).\n\n"
+        "Type 'cancel' to cancel.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("cancel_tag")
+def cancel_tag_callback(update: Update, context: CallbackContext) -> None:
+    """Cancel tag addition"""
+    query = update.callback_query
+    if 'custom_tag_task' in context.user_data:
+        del context.user_data['custom_tag_task']
+    
+    query.edit_message_text(
+        "❌ Tag addition cancelled.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+# Broadcast deletion related callbacks
+@callback_router.route("delbroadcast:")
+def delbroadcast_callback(update: Update, context: CallbackContext, broadcast_id: str) -> None:
+    """Ask to confirm deleting a broadcast"""
+    query = update.callback_query
+    user_id = update.callback_query.from_user.id
+    # Only developers can delete broadcasts
+    if not is_developer(user_id):
+        query.answer("⚠️ Only developers can delete broadcasts.")
+        return
+    
+    # Check if broadcast exists
+    if 'broadcasts' not in context.bot_data or broadcast_id not in context.bot_data['broadcasts']:
+        query.edit_message_text(f"❌ Broadcast with ID {broadcast_id} not found.")
+        return
+    
+    broadcast = context.bot_data['broadcasts'][broadcast_id]
+    sent_messages = broadcast.get('sent_messages', [])
+    message_preview = broadcast['message'][:100] + "..." if len(broadcast['message']) > 100 else broadcast['message']
+    
+    # Ask for confirmation
+    keyboard = [
+        [
+            InlineKeyboardButton("✅ Yes, delete all", callback_data=f"confirm_delbroadcast:{broadcast_id}"),
+            InlineKeyboardButton("❌ No, cancel", callback_data="cancel_delbroadcast")
+        ]
+    ]
+    
+    query.edit_message_text(
+        f"🗑️ *Delete Broadcast Confirmation*\n\n"
+        f"You are about to delete this broadcast from {len(sent_messages)} chats:\n\n"
+        f"Message: {message_preview}\n\n"
+        f"Are you sure you want to proceed?",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("viewbroadcast:")
+def viewbroadcast_callback(update: Update, context: CallbackContext, broadcast_id: str) -> None:
+    """Show the details of a broadcast"""
+    query = update.callback_query
+    user_id = update.callback_query.from_user.id
+    # Only developers can view broadcasts
+    if not is_developer(user_id):
+        query.answer("⚠️ Only developers can view broadcast details.")
+        return
+    
+    # Check if broadcast exists
+    if 'broadcasts' not in context.bot_data or broadcast_id not in context.bot_data['broadcasts']:
+        query.edit_message_text(f"❌ Broadcast with ID {broadcast_id} not found.")
+        return
+    
+    broadcast = context.bot_data['broadcasts'][broadcast_id]
+    sent_messages = broadcast.get('sent_messages', [])
+    bot = context.bot
+    
+    def show_broadcast(job):
         # Create a list of chats where the message was sent
         chat_list = ""
-        for i, msg in enumerate(sent_messages[:10]):  # Show only the first 10
+        shown = sent_messages[:10]  # Show only the first 10
+        for i, msg in enumerate(shown):
             try:
                 chat_id = msg['chat_id']
-                chat_info = context.bot.get_chat(chat_id)
+                chat_info = bot.get_chat(chat_id)
                 if chat_info.username:
                     chat_name = f"@{chat_info.username}"
                 else:
                     chat_name = chat_info.title or f"Chat {chat_id}"
-                    
+                
                 chat_list += f"• {chat_name}\n"
             except Exception:
                 chat_list += f"• Chat {chat_id}\n"
-                
+            job.progress(i + 1, len(shown))
+        
         if len(sent_messages) > 10:
             chat_list += f"... and {len(sent_messages) - 10} more\n"
-            
+        
         if not chat_list:
             chat_list = "No chats found."
-            
+        
         # Create keyboard to go back or delete
         keyboard = [
             [
@@ -1049,7 +1143,7 @@ def button_callback_handler(update: Update, context: CallbackContext) -> None:
             ]
         ]
         
-        query.edit_message_text(
+        job.finish(
             f"📢 *Broadcast Details*\n\n"
             f"🆔 ID: `{broadcast_id}`\n"
             f"⏰ Time: {broadcast.get('timestamp', 'Unknown')}\n"
@@ -1059,163 +1153,158 @@ def button_callback_handler(update: Update, context: CallbackContext) -> None:
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.MARKDOWN
         )
-        
-    elif data == "back_to_broadcasts":
-        # Go back to broadcast list
-        if not is_developer(user_id):
-            query.answer("⚠️ Only developers can view broadcasts.")
-            return
-            
-        query.edit_message_text(
-            "Please use /delbroadcast to see the list of recent broadcasts.",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-    elif data.startswith("confirm_delbroadcast:"):
-        # Process broadcast deletion confirmation
-        if not is_developer(user_id):
-            query.answer("⚠️ Only developers can delete broadcasts.")
-            return
-            
-        broadcast_id = data.split(":", 1)[1]
-        
-        # Check if broadcast exists
-        if 'broadcasts' not in context.bot_data or broadcast_id not in context.bot_data['broadcasts']:
-            query.edit_message_text(f"❌ Broadcast with ID {broadcast_id} not found.")
-            return
-            
-        broadcast = context.bot_data['broadcasts'][broadcast_id]
-        sent_messages = broadcast.get('sent_messages', [])
-        
-        # Send a status message first
-        query.edit_message_text(
-            f"🗑️ Deleting broadcast messages from {len(sent_messages)} chats...\n"
-            f"Deleted: 0\nFailed: 0",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
+    
+    # Chat lookups run in the background; the details replace this placeholder
+    query.edit_message_text(f"⏳ Loading details of broadcast {broadcast_id}...")
+    job_runner.run(f"View broadcast {broadcast_id}", show_broadcast, bot, query.message.chat_id, query.message.message_id)
+
+@callback_router.route("back_to_broadcasts")
+def back_to_broadcasts_callback(update: Update, context: CallbackContext) -> None:
+    """Go back to broadcast list"""
+    query = update.callback_query
+    user_id = update.callback_query.from_user.id
+    if not is_developer(user_id):
+        query.answer("⚠️ Only developers can view broadcasts.")
+        return
+    
+    query.edit_message_text(
+        "Please use /delbroadcast to see the list of recent broadcasts.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("confirm_delbroadcast:")
+def confirm_delbroadcast_callback(update: Update, context: CallbackContext, broadcast_id: str) -> None:
+    """Process broadcast deletion confirmation"""
+    query = update.callback_query
+    user_id = update.callback_query.from_user.id
+    if not is_developer(user_id):
+        query.answer("⚠️ Only developers can delete broadcasts.")
+        return
+    
+    # Check if broadcast exists
+    if 'broadcasts' not in context.bot_data or broadcast_id not in context.bot_data['broadcasts']:
+        query.edit_message_text(f"❌ Broadcast with ID {broadcast_id} not found.")
+        return
+    
+    # Take the broadcast out of bot_data and stop its persisted job right away
+    broadcast = context.bot_data['broadcasts'].pop(broadcast_id)
+    stopped = broadcast_jobs.forget(broadcast_id)
+    sent_messages = broadcast.get('sent_messages', [])
+    delete = context.bot.raw('delete_message')
+    
+    def delete_broadcast(job):
         deleted_count = 0
         failed_count = 0
         
-        # Delete each message
-        for msg in sent_messages:
+        # Messages from the job's batch in flight are only recorded in the job
+        if stopped is not None:
+            broadcast_jobs.join(stopped)
+            recorded = {msg['chat_id'] for msg in sent_messages}
+            sent_messages.extend(
+                {'chat_id': sent_chat_id, 'message_id': message_id}
+                for sent_chat_id, message_id in stopped.sent.items() if sent_chat_id not in recorded
+            )
+        
+        # Queue every deletion; the outbound queue paces them
+        futures = {
+            send_queue.submit(delete, 'delete', 'broadcast', chat_id=msg['chat_id'], message_id=msg['message_id']): msg
+            for msg in sent_messages
+        }
+        
+        for future in as_completed(futures):
+            msg = futures[future]
             try:
-                context.bot.delete_message(
-                    chat_id=msg['chat_id'],
-                    message_id=msg['message_id']
-                )
+                future.result()
                 deleted_count += 1
-                
-                # Update status every 10 deletions
-                if deleted_count % 10 == 0:
-                    query.edit_message_text(
-                        f"🗑️ Deleting broadcast messages from {len(sent_messages)} chats...\n"
-                        f"Deleted: {deleted_count}\nFailed: {failed_count}",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    
-                # Add a small delay to avoid hitting rate limits
-                time.sleep(0.1)
-                
             except Exception as e:
                 logger.error(f"Failed to delete message from {msg['chat_id']}: {e}")
                 failed_count += 1
-        
-        # Remove the broadcast from bot_data
-        del context.bot_data['broadcasts'][broadcast_id]
-        
-        # Final status update
-        query.edit_message_text(
+            job.progress(
+                deleted_count + failed_count, len(sent_messages),
+                f"🗑️ Deleting broadcast messages from {len(sent_messages)} chats...\n"
+                f"Deleted: {deleted_count}\nFailed: {failed_count}\n\n"
+                f"Job: #{job.id}"
+            )
+            
+        job.finish(
             f"🗑️ Broadcast deletion complete!\n"
-            f"Deleted: {deleted_count}\nFailed: {failed_count}",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-    elif data == "cancel_delbroadcast":
-        # User cancelled broadcast deletion
-        query.edit_message_text(
-            "⏹️ Broadcast deletion cancelled.",
-            parse_mode=ParseMode.MARKDOWN
+            f"Deleted: {deleted_count}\nFailed: {failed_count}"
         )
-        
-    # Group broadcast handling
-    elif data.startswith("groupcast_select:"):
-        # Only developers can use this
-        if not is_developer(user_id):
-            query.answer("⚠️ Only developers can send broadcasts.")
-            return
-            
-        # Extract group ID
-        group_id = int(data.split(":", 1)[1])
-        
-        # Store the selected group ID in user_data for the next step
-        if not context.user_data:
-            context.user_data = {}
-        context.user_data['groupcast_state'] = 'entering_message'
-        context.user_data['selected_group_id'] = group_id
-        
-        # Try to get the group name
-        group_name = "the selected group"
-        try:
-            chat_info = context.bot.get_chat(group_id)
-            if chat_info.username:
-                group_name = f"@{chat_info.username}"
-            else:
-                group_name = chat_info.title or f"group with ID {group_id}"
-        except Exception:
-            pass
-        
-        # Ask for the message to send
+    
+    # Deleting runs in the background so the dispatcher keeps serving other chats
+    query.edit_message_text(
+        f"🗑️ Deleting broadcast messages from {len(sent_messages)} chats...\n"
+        f"Deleted: 0\nFailed: 0"
+    )
+    job_runner.run(
+        f"Delete broadcast {broadcast_id}", delete_broadcast,
+        context.bot, query.message.chat_id, query.message.message_id
+    )
+
+@callback_router.route("cancel_delbroadcast")
+def cancel_delbroadcast_callback(update: Update, context: CallbackContext) -> None:
+    """User cancelled broadcast deletion"""
+    query = update.callback_query
+    query.edit_message_text(
+        "⏹️ Broadcast deletion cancelled.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+# Group broadcast handling
+@callback_router.route("groupcast_select:", int)
+def groupcast_select_callback(update: Update, context: CallbackContext, group_id: int) -> None:
+    """Pick the group a groupcast message goes to"""
+    query = update.callback_query
+    user_id = update.callback_query.from_user.id
+    # Only developers can use this
+    if not is_developer(user_id):
+        query.answer("⚠️ Only developers can send broadcasts.")
+        return
+    
+    # Store the selected group ID in user_data for the next step
+    if not context.user_data:
+        context.user_data = {}
+    context.user_data['groupcast_state'] = 'entering_message'
+    context.user_data['selected_group_id'] = group_id
+    
+    # Try to get the group name
+    group_name = "the selected group"
+    try:
+        chat_info = context.bot.get_chat(group_id)
+        if chat_info.username:
+            group_name = f"@{chat_info.username}"
+        else:
+            group_name = chat_info.title or f"group with ID {group_id}"
+    except Exception:
+        pass
+    
+    # Ask for the message to send
+    query.edit_message_text(
+        f"📝 *Enter Broadcast Message*\n\n"
+        f"Please reply to this message with the announcement you want to send to *{group_name}*.\n\n"
+        f"Your message will be sent as-is with Markdown formatting support.\n"
+        f"Type `cancel` to cancel.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("groupcast_confirm")
+def groupcast_confirm_callback(update: Update, context: CallbackContext) -> None:
+    """User confirmed sending the broadcast message"""
+    query = update.callback_query
+    user_id = update.callback_query.from_user.id
+    # Only developers can use this
+    if not is_developer(user_id):
+        query.answer("⚠️ Only developers can send broadcasts.")
+        return
+    
+    # Make sure we have all the data we need
+    if ('selected_group_id' not in context.user_data or
+        'groupcast_message' not in context.user_data or
+        context.user_data.get('groupcast_state') != 'confirming_message'):
         query.edit_message_text(
-            f"📝 *Enter Broadcast Message*\n\n"
-            f"Please reply to this message with the announcement you want to send to *{group_name}*.\n\n"
-            f"Your message will be sent as-is with Markdown formatting support.\n"
-            f"Type `cancel` to cancel.",
+            "⚠️ Error: Broadcast data missing. Please try again with /groupcast command.",
             parse_mode=ParseMode.MARKDOWN
         )
-        
-    elif data == "groupcast_confirm":
-        # User confirmed sending the broadcast message
-        # Only developers can use this
-        if not is_developer(user_id):
-            query.answer("⚠️ Only developers can send broadcasts.")
-            return
-            
-        # Make sure we have all the data we need
-        if ('selected_group_id' not in context.user_data or 
-            'groupcast_message' not in context.user_data or
-            context.user_data.get('groupcast_state') != 'confirming_message'):
-            query.edit_message_text(
-                "⚠️ Error: Broadcast data missing. Please try again with /groupcast command.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            # Clean up user_data
-            if 'groupcast_state' in context.user_data:
-                del context.user_data['groupcast_state']
-            if 'selected_group_id' in context.user_data:
-                del context.user_data['selected_group_id']
-            if 'groupcast_message' in context.user_data:
-                del context.user_data['groupcast_message']
-            return
-            
-        # Get the data from user_data
-        group_id = context.user_data.get('selected_group_id')
-        message = context.user_data.get('groupcast_message')
-        
-        # Send the broadcast to the selected group
-        result = send_group_broadcast_by_id(update, context, group_id, message)
-        
-        if result:
-            query.edit_message_text(
-                "✅ Broadcast message sent successfully!",
-                parse_mode=ParseMode.MARKDOWN
-            )
-        else:
-            query.edit_message_text(
-                "❌ Failed to send broadcast message. Please check if the bot is still a member of the group.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            
         # Clean up user_data
         if 'groupcast_state' in context.user_data:
             del context.user_data['groupcast_state']
@@ -1223,494 +1312,502 @@ def button_callback_handler(update: Update, context: CallbackContext) -> None:
             del context.user_data['selected_group_id']
         if 'groupcast_message' in context.user_data:
             del context.user_data['groupcast_message']
+        return
             
-    elif data == "groupcast_edit":
-        # User wants to edit the message before sending
-        # Only developers can use this
-        if not is_developer(user_id):
-            query.answer("⚠️ Only developers can send broadcasts.")
-            return
-            
-        # Make sure we have the required data
-        if 'selected_group_id' not in context.user_data:
-            query.edit_message_text(
-                "⚠️ Error: Group ID missing. Please try again with /groupcast command.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            # Clean up user_data
-            if 'groupcast_state' in context.user_data:
-                del context.user_data['groupcast_state']
-            if 'groupcast_message' in context.user_data:
-                del context.user_data['groupcast_message']
-            return
-            
-        # Get the group ID and possibly the group name
-        group_id = context.user_data.get('selected_group_id')
-        group_name = "the selected group"
-        try:
-            chat_info = context.bot.get_chat(group_id)
-            if chat_info.username:
-                group_name = f"@{chat_info.username}"
-            else:
-                group_name = chat_info.title or f"group with ID {group_id}"
-        except Exception:
-            pass
+    # Get the data from user_data
+    group_id = context.user_data.get('selected_group_id')
+    message = context.user_data.get('groupcast_message')
             
-        # Change state back to entering message
-        context.user_data['groupcast_state'] = 'entering_message'
-        # Keep the group ID
-        
-        # Show message asking for new text
-        query.edit_message_text(
-            f"📝 *Edit Broadcast Message*\n\n"
-            f"Please reply with your new announcement for *{group_name}*.\n\n"
-            f"Your message will be sent as-is with Markdown formatting support.\n"
-            f"Type `cancel` to cancel.",
-            parse_mode=ParseMode.MARKDOWN
-        )
+    # Send the broadcast to the selected group
+    result = send_group_broadcast_by_id(update, context, group_id, message)
     
-    elif data == "groupcast_cancel":
-        # Cancel groupcast
-        if 'groupcast_state' in context.user_data:
-            del context.user_data['groupcast_state']
-        if 'selected_group_id' in context.user_data:
-            del context.user_data['selected_group_id']
-        if 'groupcast_message' in context.user_data:
-            del context.user_data['groupcast_message']
-            
+    if result:
         query.edit_message_text(
-            "⏹️ Group broadcast cancelled.",
+            "✅ Broadcast message sent successfully!",
             parse_mode=ParseMode.MARKDOWN
         )
-        
-    elif data == "group_help":
-        # Display helpful information for groups
-        group_commands = [
-            "*/add* - Create a new task for the group",
-            "*/list* - View all active group tasks",
-            "*/done* - Mark a task as completed",
-            "*/delete* - Remove a task from the list",
-            "*/remind* - Set a reminder for a task",
-            "*/today* - View tasks due today",
-            "*/priority* - Set task priority (high/medium/low)",
-            "*/tag* - Add a category to a task",
-            "*/clean* - Clean up bot messages in the chat"
-        ]
-        
-        # Create a help message with basic commands
-        help_text = "📚 *Group Commands*\n\n" + "\n".join(group_commands) + "\n\n"
-        help_text += "To mention the entire group in reminders, use `/remind` with any task."
-        
-        # Add a keyboard with the most useful commands
-        keyboard = [
-            [
-                InlineKeyboardButton("➕ Add Task", callback_data="show_add_format"),
-                InlineKeyboardButton("📋 List Tasks", callback_data="show_list_format")
-            ],
-            [
-                InlineKeyboardButton("⏰ Set Reminder", callback_data="show_remind_format"),
-                InlineKeyboardButton("🧹 Clean Chat", callback_data="show_clean_format")
-            ]
-        ]
-        
-        query.edit_message_text(
-            help_text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-    elif data == "show_add_format":
-        # Show the format for adding tasks
-        query.edit_message_text(
-            "➕ *Adding Tasks*\n\n"
-            "Use `/add` followed by your task description:\n"
-            "`/add Buy snacks for the meeting`\n\n"
-            "You can also add tasks with due dates:\n"
-            "`/add Submit report due:friday`\n\n"
-            "Or with priorities:\n"
-            "`/add Call client priority:high`",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-    elif data == "show_list_format":
-        # Show the format for listing tasks
-        query.edit_message_text(
-            "📋 *Listing Tasks*\n\n"
-            "Use `/list` to view all active tasks\n"
-            "Use `/today` to see tasks due today\n"
-            "Use `/list done` to see completed tasks\n\n"
-            "From the list view, you can mark tasks as done, delete them, or set reminders with the inline buttons.",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-    elif data == "show_remind_format":
-        # Show the format for setting reminders
+    else:
         query.edit_message_text(
-            "⏰ *Setting Reminders*\n\n"
-            "Use `/remind` followed by the task number and time:\n"
-            "`/remind 1 30m` (30 minutes)\n"
-            "`/remind 2 2h` (2 hours)\n"
-            "`/remind 3 tomorrow 9am`\n\n"
-            "Or use `/list` and click the ⏰ button next to any task.",
+            "❌ Failed to send broadcast message. Please check if the bot is still a member of the group.",
             parse_mode=ParseMode.MARKDOWN
         )
-        
-    elif data == "show_clean_format":
-        # Show the format for cleaning chat
+    
+    # Clean up user_data
+    if 'groupcast_state' in context.user_data:
+        del context.user_data['groupcast_state']
+    if 'selected_group_id' in context.user_data:
+        del context.user_data['selected_group_id']
+    if 'groupcast_message' in context.user_data:
+        del context.user_data['groupcast_message']
+
+@callback_router.route("groupcast_edit")
+def groupcast_edit_callback(update: Update, context: CallbackContext) -> None:
+    """User wants to edit the message before sending"""
+    query = update.callback_query
+    user_id = update.callback_query.from_user.id
+    # Only developers can use this
+    if not is_developer(user_id):
+        query.answer("⚠️ Only developers can send broadcasts.")
+        return
+    
+    # Make sure we have the required data
+    if 'selected_group_id' not in context.user_data:
         query.edit_message_text(
-            "🧹 *Cleaning Chat*\n\n"
-            "Use `/clean` to remove bot messages and keep the chat tidy.\n\n"
-            "Options:\n"
-            "• Clean bot messages: Removes recent bot responses\n"
-            "• Clean all tasks: Clears the task list (requires confirmation)\n\n"
-            "This helps keep your group chat organized and focused.",
+            "⚠️ Error: Group ID missing. Please try again with /groupcast command.",
             parse_mode=ParseMode.MARKDOWN
         )
-        
-    elif data.startswith("time:"):
-        # Set reminder with predefined time
-        parts = data.split(":")
-        task_index = int(parts[1])
-        time_minutes = int(parts[2])
-        
-        current_time = get_current_time()
-        reminder_time = current_time + (time_minutes * 60)
-        
-        if set_reminder(chat_id, task_index, reminder_time):
-            tasks = get_tasks(chat_id)
-            if 0 <= task_index < len(tasks):
-                task_text = tasks[task_index]['text']
-                
-                # Format time for display
-                if time_minutes < 60:
-                    time_display = f"{time_minutes} minute{'s' if time_minutes != 1 else ''}"
-                else:
-                    hours = time_minutes // 60
-                    mins = time_minutes % 60
-                    time_display = f"{hours} hour{'s' if hours != 1 else ''}"
-                    if mins > 0:
-                        time_display += f" {mins} minute{'s' if mins != 1 else ''}"
-                
-                # Check if this is a group chat
-                is_group = update.effective_chat.type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]
-                mention = f"@all" if is_group else "you"
-                
-                query.edit_message_text(
-                    f"⏰ Reminder set! I'll remind {mention} about:\n*{task_text}*\nIn: {time_display}",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            else:
-                query.edit_message_text("❌ Task not found. It may have been deleted.")
+        # Clean up user_data
+        if 'groupcast_state' in context.user_data:
+            del context.user_data['groupcast_state']
+        if 'groupcast_message' in context.user_data:
+            del context.user_data['groupcast_message']
+        return
+    
+    # Get the group ID and possibly the group name
+    group_id = context.user_data.get('selected_group_id')
+    group_name = "the selected group"
+    try:
+        chat_info = context.bot.get_chat(group_id)
+        if chat_info.username:
+            group_name = f"@{chat_info.username}"
         else:
-            query.edit_message_text("❌ Failed to set reminder. Please try again.")
-            
-    elif data.startswith("special_time:"):
-        # Handle special timing options (end of day, weekend, next week)
-        parts = data.split(":")
-        task_index = int(parts[1])
-        time_option = int(parts[2])
-        
-        current_time = get_current_time()
-        reminder_time = current_time
-        time_display = ""
-        
-        # Calculate the appropriate reminder time based on special options
-        if time_option == 0:  # End of day
-            # Calculate time until 8:00 PM today
-            from datetime import datetime, timedelta
-            current_dt = datetime.fromtimestamp(current_time)
-            end_of_day = current_dt.replace(hour=20, minute=0, second=0)
-            
-            # If it's already past 8 PM, set for tomorrow
-            if current_dt.hour >= 20:
-                end_of_day = end_of_day + timedelta(days=1)
-                
-            reminder_time = end_of_day.timestamp()
-            time_display = "end of day (8:00 PM)"
-            
-        elif time_option == -1:  # Weekend
-            # Calculate time until Saturday 10:00 AM
-            from datetime import datetime, timedelta
-            current_dt = datetime.fromtimestamp(current_time)
-            days_until_saturday = (5 - current_dt.weekday()) % 7
-            
-            # If it's already Saturday or Sunday, set for next Saturday
-            if days_until_saturday == 0 and current_dt.hour >= 10:
-                days_until_saturday = 7
-            elif days_until_saturday < 0:
-                days_until_saturday += 7
-                
-            weekend = current_dt + timedelta(days=days_until_saturday)
-            weekend = weekend.replace(hour=10, minute=0, second=0)
-            
-            reminder_time = weekend.timestamp()
-            time_display = f"this weekend (Saturday, 10:00 AM)"
-            
-        elif time_option == -2:  # Next week
-            # Calculate time until Monday 9:00 AM
-            from datetime import datetime, timedelta
-            current_dt = datetime.fromtimestamp(current_time)
-            days_until_monday = (0 - current_dt.weekday()) % 7
-            
-            # If it's already Monday, set for next Monday
-            if days_until_monday == 0:
-                days_until_monday = 7
-                
-            next_week = current_dt + timedelta(days=days_until_monday)
-            next_week = next_week.replace(hour=9, minute=0, second=0)
+            group_name = chat_info.title or f"group with ID {group_id}"
+    except Exception:
+        pass
+    
+    # Change state back to entering message
+    context.user_data['groupcast_state'] = 'entering_message'
+    # Keep the group ID
+    
+    # Show message asking for new text
+    query.edit_message_text(
+        f"📝 *Edit Broadcast Message*\n\n"
+        f"Please reply with your new announcement for *{group_name}*.\n\n"
+        f"Your message will be sent as-is with Markdown formatting support.\n"
+        f"Type `cancel` to cancel.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("groupcast_cancel")
+def groupcast_cancel_callback(update: Update, context: CallbackContext) -> None:
+    """Cancel groupcast"""
+    query = update.callback_query
+    if 'groupcast_state' in context.user_data:
+        del context.user_data['groupcast_state']
+    if 'selected_group_id' in context.user_data:
+        del context.user_data['selected_group_id']
+    if 'groupcast_message' in context.user_data:
+        del context.user_data['groupcast_message']
+    
+    query.edit_message_text(
+        "⏹️ Group broadcast cancelled.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("group_help")
+def group_help_callback(update: Update, context: CallbackContext) -> None:
+    """Display helpful information for groups"""
+    query = update.callback_query
+    group_commands = [
+        "*/add* - Create a new task for the group",
+        "*/list* - View all active group tasks",
+        "*/done* - Mark a task as completed",
+        "*/delete* - Remove a task from the list",
+        "*/remind* - Set a reminder for a task",
+        "*/today* - View tasks due today",
+        "*/priority* - Set task priority (high/medium/low)",
+        "*/tag* - Add a category to a task",
+        "*/clean* - Clean up bot messages in the chat"
+    ]
+    
+    # Create a help message with basic commands
+    help_text = "📚 *Group Commands*\n\n" + "\n".join(group_commands) + "\n\n"
+    help_text += "To mention the entire group in reminders, use `/remind` with any task."
+    
+    # Add a keyboard with the most useful commands
+    keyboard = [
+        [
+            InlineKeyboardButton("➕ Add Task", callback_data="show_add_format"),
+            InlineKeyboardButton("📋 List Tasks", callback_data="show_list_format")
+        ],
+        [
+            InlineKeyboardButton("⏰ Set Reminder", callback_data="show_remind_format"),
+            InlineKeyboardButton("🧹 Clean Chat", callback_data="show_clean_format")
+        ]
+    ]
+    
+    query.edit_message_text(
+        help_text,
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("show_add_format")
+def show_add_format_callback(update: Update, context: CallbackContext) -> None:
+    """Show the format for adding tasks"""
+    query = update.callback_query
+    query.edit_message_text(
+        "➕ *Adding Tasks*\n\n"
+        "Use `/add` followed by your task description:\n"
+        "`/add Buy snacks for the meeting`\n\n"
+        "You can also add tasks with due dates:\n"
+        "`/add Submit report due:friday`\n\n"
+        "Or with priorities:\n"
+        "`/add Call client priority:high`",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("show_list_format")
+def show_list_format_callback(update: Update, context: CallbackContext) -> None:
+    """Show the format for listing tasks"""
+    query = update.callback_query
+    query.edit_message_text(
+        "📋 *Listing Tasks*\n\n"
+        "Use `/list` to view all active tasks\n"
+        "Use `/today` to see tasks due today\n"
+        "Use `/list done` to see completed tasks\n\n"
+        "From the list view, you can mark tasks as done, delete them, or set reminders with the inline buttons.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("show_remind_format")
+def show_remind_format_callback(update: Update, context: CallbackContext) -> None:
+    """Show the format for setting reminders"""
+    query = update.callback_query
+    query.edit_message_text(
+        "⏰ *Setting Reminders*\n\n"
+        "Use `/remind` followed by the task number and time:\n"
+        "`/remind 1 30m` (30 minutes)\n"
+        "`/remind 2 2h` (2 hours)\n"
+        "`/remind 3 tomorrow 9am`\n\n"
+        "Or use `/list` and click the ⏰ button next to any task.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("show_clean_format")
+def show_clean_format_callback(update: Update, context: CallbackContext) -> None:
+    """Show the format for cleaning chat"""
+    query = update.callback_query
+    query.edit_message_text(
+        "🧹 *Cleaning Chat*\n\n"
+        "Use `/clean` to remove bot messages and keep the chat tidy.\n\n"
+        "Options:\n"
+        "• Clean bot messages: Removes recent bot responses\n"
+        "• Clean all tasks: Clears the task list (requires confirmation)\n\n"
+        "This helps keep your group chat organized and focused.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("time:", _task_id, int)
+def time_callback(update: Update, context: CallbackContext, task_id: str, time_minutes: int) -> None:
+    """Set reminder with predefined time"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    
+    current_time = get_current_time()
+    reminder_time = current_time + (time_minutes * 60)
+    
+    if set_reminder(chat_id, task_id, reminder_time):
+        task = get_task(chat_id, task_id)
+        if task is not None:
+            task_text = task['text']
             
-            reminder_time = next_week.timestamp()
-            time_display = f"next week (Monday, 9:00 AM)"
-        
-        # Set the reminder with calculated time
-        if set_reminder(chat_id, task_index, reminder_time):
-            tasks = get_tasks(chat_id)
-            if 0 <= task_index < len(tasks):
-                task_text = tasks[task_index]['text']
-                
-                # Check if this is a group chat
-                is_group = update.effective_chat.type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]
-                mention = f"everyone in this group" if is_group else "you"
-                
-                query.edit_message_text(
-                    f"📅 *Special Reminder Set!*\n\nI'll remind {mention} about:\n*{task_text}*\n\nTime: {time_display}",
-                    parse_mode=ParseMode.MARKDOWN
-                )
+            # Format time for display
+            if time_minutes < 60:
+                time_display = f"{time_minutes} minute{'s' if time_minutes != 1 else ''}"
             else:
-                query.edit_message_text("❌ Task not found. It may have been deleted.")
-        else:
-            query.edit_message_text("❌ Failed to set reminder. Please try again.")
-            
-    elif data.startswith("custom_time:"):
-        # Handle custom time input request
-        task_index = int(data.split(":")[1])
-        tasks = get_tasks(chat_id)
-        
-        if 0 <= task_index < len(tasks):
-            task_text = tasks[task_index]['text']
+                hours = time_minutes // 60
+                mins = time_minutes % 60
+                time_display = f"{hours} hour{'s' if hours != 1 else ''}"
+                if mins > 0:
+                    time_display += f" {mins} minute{'s' if mins != 1 else ''}"
             
-            # Store the task index in user_data for the next step
-            if not context.user_data:
-                context.user_data = {}
-            context.user_data["custom_reminder_task"] = task_index
+            # Check if this is a group chat
+            is_group = update.effective_chat.type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]
+            mention = f"@all" if is_group else "you"
             
             query.edit_message_text(
-                f"⏰ *Custom Reminder*\n\nPlease reply with the time for your reminder for:\n*{task_text}*\n\n"
-                f"*Examples:*\n"
-                f"*Relative Time:*\n"
-                f"• `1h 30m` (1 hour and 30 minutes)\n"
-                f"• `3 hours 45 minutes` (3 hours and 45 minutes)\n"
-                f"• `2:30` (2 hours and 30 minutes)\n\n"
-                f"*Days & Times:*\n"
-                f"• `today 3pm` (today at 3:00 PM)\n"
-                f"• `tomorrow 9am` (tomorrow at 9:00 AM)\n"
-                f"• `friday 3pm` (next Friday at 3:00 PM)\n\n"
-                f"*Specific Dates:*\n"
-                f"• `apr 15` (April 15th this year)\n"
-                f"• `5/20` (May 20th this year)\n"
-                f"• `12-25 8am` (December 25th at 8:00 AM)\n\n"
-                f"*Times Only:*\n"
-                f"• `3pm` (today at 3:00 PM, or tomorrow if already past)\n"
-                f"• `21:30` (9:30 PM today or tomorrow)\n\n"
-                f"Type `cancel` to cancel.",
+                f"⏰ Reminder set! I'll remind {mention} about:\n*{task_text}*\nIn: {time_display}",
                 parse_mode=ParseMode.MARKDOWN
             )
-    
-    # Priority handling
-    elif data.startswith("priority:"):
-        parts = data.split(":")
-        task_index = int(parts[1])
-        priority = parts[2]
-        
-        tasks = get_tasks(chat_id)
-        if 0 <= task_index < len(tasks):
-            # Update task priority
-            chat_data = get_chat_data(chat_id)
-            all_tasks = chat_data.get('tasks', [])
-            
-            # Find the right task (it might not be in the same position as in filtered tasks)
-            for task in all_tasks:
-                if task.get('text') == tasks[task_index].get('text') and task.get('active', True):
-                    task['priority'] = priority
-                    task['updated_at'] = iso_now()
-                    break
-            
-            update_chat_data(chat_id, chat_data)
+        else:
+            query.edit_message_text("❌ Task not found. It may have been deleted.")
+    else:
+        query.edit_message_text("❌ Failed to set reminder. Please try again.")
             
-            # Get priority icon
-            priority_icon = "🔴" if priority == "high" else "🟡" if priority == "medium" else "🟢"
+@callback_router.route("special_time:", _task_id, int)
+def special_time_callback(update: Update, context: CallbackContext, task_id: str, time_option: int) -> None:
+    """Handle special timing options (end of day, weekend, next week)"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
             
-            query.edit_message_text(
-                f"{priority_icon} Priority updated to *{priority.upper()}* for task:\n\n*{tasks[task_index]['text']}*",
-                parse_mode=ParseMode.MARKDOWN
-            )
-        else:
-            query.edit_message_text("❌ Failed to update priority. Task not found.")
+    current_time = get_current_time()
+    reminder_time = current_time
+    time_display = ""
+        
+    # Calculate the appropriate reminder time based on special options
+    if time_option == 0:  # End of day
+        # Calculate time until 8:00 PM today
+        from datetime import datetime, timedelta
+        current_dt = datetime.fromtimestamp(current_time)
+        end_of_day = current_dt.replace(hour=20, minute=0, second=0)
+        
+        # If it's already past 8 PM, set for tomorrow
+        if current_dt.hour >= 20:
+            end_of_day = end_of_day + timedelta(days=1)
+        
+        reminder_time = end_of_day.timestamp()
+        time_display = "end of day (8:00 PM)"
     
-    # Category handling
-    elif data.startswith("category:"):
-        parts = data.split(":", 2)  # Split into 3 parts
-        task_index = int(parts[1])
-        category = parts[2]
+    elif time_option == -1:  # Weekend
+        # Calculate time until Saturday 10:00 AM
+        from datetime import datetime, timedelta
+        current_dt = datetime.fromtimestamp(current_time)
+        days_until_saturday = (5 - current_dt.weekday()) % 7
         
-        tasks = get_tasks(chat_id)
-        if 0 <= task_index < len(tasks):
-            # Update task category
-            chat_data = get_chat_data(chat_id)
-            all_tasks = chat_data.get('tasks', [])
-            
-            # Find the right task
-            for task in all_tasks:
-                if task.get('text') == tasks[task_index].get('text') and task.get('active', True):
-                    task['category'] = category
-                    task['updated_at'] = iso_now()
-                    break
+        # If it's already Saturday or Sunday, set for next Saturday
+        if days_until_saturday == 0 and current_dt.hour >= 10:
+            days_until_saturday = 7
+        elif days_until_saturday < 0:
+            days_until_saturday += 7
+        
+        weekend = current_dt + timedelta(days=days_until_saturday)
+        weekend = weekend.replace(hour=10, minute=0, second=0)
+        
+        reminder_time = weekend.timestamp()
+        time_display = f"this weekend (Saturday, 10:00 AM)"
+    
+    elif time_option == -2:  # Next week
+        # Calculate time until Monday 9:00 AM
+        from datetime import datetime, timedelta
+        current_dt = datetime.fromtimestamp(current_time)
+        days_until_monday = (0 - current_dt.weekday()) % 7
+        
+        # If it's already Monday, set for next Monday
+        if days_until_monday == 0:
+            days_until_monday = 7
+        
+        next_week = current_dt + timedelta(days=days_until_monday)
+        next_week = next_week.replace(hour=9, minute=0, second=0)
+        
+        reminder_time = next_week.timestamp()
+        time_display = f"next week (Monday, 9:00 AM)"
+    
+    # Set the reminder with calculated time
+    if set_reminder(chat_id, task_id, reminder_time):
+        task = get_task(chat_id, task_id)
+        if task is not None:
+            task_text = task['text']
             
-            update_chat_data(chat_id, chat_data)
+            # Check if this is a group chat
+            is_group = update.effective_chat.type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]
+            mention = f"everyone in this group" if is_group else "you"
             
             query.edit_message_text(
-                f"🏷️ Category updated to *{category}* for task:\n\n*{tasks[task_index]['text']}*",
+                f"📅 *Special Reminder Set!*\n\nI'll remind {mention} about:\n*{task_text}*\n\nTime: {time_display}",
                 parse_mode=ParseMode.MARKDOWN
             )
         else:
-            query.edit_message_text("❌ Failed to update category. Task not found.")
+            query.edit_message_text("❌ Task not found. It may have been deleted.")
+    else:
+        query.edit_message_text("❌ Failed to set reminder. Please try again.")
+
+@callback_router.route("custom_time:", _task_id)
+def custom_time_callback(update: Update, context: CallbackContext, task_id: str) -> None:
+    """Handle custom time input request"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    task = get_task(chat_id, task_id)
     
-    elif data.startswith("setting_help:"):
-        # Handle setting help requests
-        setting_help = data.split(":", 1)[1]
-        
-        help_texts = {
-            "reminder": "⚙️ *Default Reminder*\n\nWhen turned ON, all new tasks will automatically have a reminder set (24 hours before due date). This is useful for ensuring you don't forget any tasks.\n\nClick the button to toggle this setting ON/OFF.",
-            "sort": "⚙️ *Sort Tasks By*\n\nChoose how your tasks are sorted when displayed:\n• *Date*: Sort by due date (soonest first)\n• *Priority*: Sort by priority level (highest first)\n\nClick the button to switch between these options.",
-            "auto_clean": "⚙️ *Auto-Clean*\n\nWhen turned ON, the bot will automatically delete its old messages in group chats to keep the chat tidy.\n\nThis is especially useful in busy groups so old bot responses don't clutter the chat history.\n\nClick the button to toggle this setting ON/OFF.",
-            "auto_clean_days": "⚙️ *Clean Messages Days*\n\nSet how many days to keep bot messages before cleaning them:\n• 3 days: Quick cleanup (good for active groups)\n• 7 days: Standard (recommended)\n• 14 days: Extended history\n• 30 days: Maximum retention\n\nClick the button to cycle through these options."
-        }
+    if task is not None:
+        task_text = task['text']
         
-        # Get the appropriate help text
-        help_text = help_texts.get(setting_help, "No help available for this setting.")
+        # Store the task ID in user_data for the next step
+        if not context.user_data:
+            context.user_data = {}
+        context.user_data["custom_reminder_task"] = task_id
         
-        # Show help text with a "Back to Settings" button
-        keyboard = [[InlineKeyboardButton("🔙 Back to Settings", callback_data="setting:back")]]
+        query.edit_message_text(
+            f"⏰ *Custom Reminder*\n\nPlease reply with the time for your reminder for:\n*{task_text}*\n\n"
+            f"*Examples:*\n"
+            f"*Relative Time:*\n"
+            f"• `1h 30m` (1 hour and 30 minutes)\n"
+            f"• `3 hours 45 minutes` (3 hours and 45 minutes)\n"
+            f"• `2:30` (2 hours and 30 minutes)\n\n"
+            f"*Days & Times:*\n"
+            f"• `today 3pm` (today at 3:00 PM)\n"
+            f"• `tomorrow 9am` (tomorrow at 9:00 AM)\n"
+            f"• `friday 3pm` (next Friday at 3:00 PM)\n\n"
+            f"*Specific Dates:*\n"
+            f"• `apr 15` (April 15th this year)\n"
+            f"• `5/20` (May 20th this year)\n"
+            f"• `12-25 8am` (December 25th at 8:00 AM)\n\n"
+            f"*Times Only:*\n"
+            f"• `3pm` (today at 3:00 PM, or tomorrow if already past)\n"
+            f"• `21:30` (9:30 PM today or tomorrow)\n\n"
+            f"Type `cancel` to cancel.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+# Category handling
+@callback_router.route("category:", _task_id, payload_store.resolve)
+def category_callback(update: Update, context: CallbackContext, task_id: str, category: Optional[str]) -> None:
+    """Update task category"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    
+    if category is None:
+        query.edit_message_text("⌛ This button has expired. Please pick the category again.")
+        return
+    
+    task = update_task(chat_id, task_id, {'category': category})
+    if task is not None:
+        query.edit_message_text(
+            f"🏷️ Category updated to *{category}* for task:\n\n*{task['text']}*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    else:
+        query.edit_message_text("❌ Failed to update category. Task not found.")
+
+@callback_router.route("setting_help:")
+def setting_help_callback(update: Update, context: CallbackContext, setting_help: str) -> None:
+    """Handle setting help requests"""
+    query = update.callback_query
+    
+    help_texts = {
+        "reminder": "⚙️ *Default Reminder*\n\nWhen turned ON, all new tasks will automatically have a reminder set (24 hours before due date). This is useful for ensuring you don't forget any tasks.\n\nClick the button to toggle this setting ON/OFF.",
+        "sort": "⚙️ *Sort Tasks By*\n\nChoose how your tasks are sorted when displayed:\n• *Date*: Sort by due date (soonest first)\n• *Priority*: Sort by priority level (highest first)\n\nClick the button to switch between these options.",
+        "auto_clean": "⚙️ *Auto-Clean*\n\nWhen turned ON, the bot will automatically delete its old messages in group chats to keep the chat tidy.\n\nThis is especially useful in busy groups so old bot responses don't clutter the chat history.\n\nClick the button to toggle this setting ON/OFF.",
+        "auto_clean_days": "⚙️ *Clean Messages Days*\n\nSet how many days to keep bot messages before cleaning them:\n• 3 days: Quick cleanup (good for active groups)\n• 7 days: Standard (recommended)\n• 14 days: Extended history\n• 30 days: Maximum retention\n\nClick the button to cycle through these options."
+    }
+    
+    # Get the appropriate help text
+    help_text = help_texts.get(setting_help, "No help available for this setting.")
+    
+    # Show help text with a "Back to Settings" button
+    keyboard = [[InlineKeyboardButton("🔙 Back to Settings", callback_data="setting:back")]]
+    
+    query.edit_message_text(
+        help_text,
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route("setting:")
+def setting_callback(update: Update, context: CallbackContext, setting: str) -> None:
+    """Handle settings changes"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    
+    if setting == "reminder_default":
+        # Toggle default reminder setting
+        chat_data = get_chat_data(chat_id)
+        current = chat_data.get('settings', {}).get('reminder_default', False)
+        update_settings(chat_id, {'reminder_default': not current})
         
+        # Refresh settings menu
+        chat_data = get_chat_data(chat_id)
+        settings = chat_data.get('settings', {})
+        keyboard = get_settings_keyboard(settings)
+            
         query.edit_message_text(
-            help_text,
+            "⚙️ *Bot Settings*\n\nSetting updated! Select an option to configure:",
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.MARKDOWN
         )
         
-    elif data.startswith("setting:"):
-        # Handle settings changes
-        setting = data.split(":", 1)[1]
+    elif setting == "sort_by":
+        # Toggle sort order
+        chat_data = get_chat_data(chat_id)
+        current = chat_data.get('settings', {}).get('sort_by', 'date')
+        new_sort = 'priority' if current == 'date' else 'date'
+        update_settings(chat_id, {'sort_by': new_sort})
         
-        if setting == "reminder_default":
-            # Toggle default reminder setting
-            chat_data = get_chat_data(chat_id)
-            current = chat_data.get('settings', {}).get('reminder_default', False)
-            update_settings(chat_id, {'reminder_default': not current})
-            
-            # Refresh settings menu
-            chat_data = get_chat_data(chat_id)
-            settings = chat_data.get('settings', {})
-            keyboard = get_settings_keyboard(settings)
-            
-            query.edit_message_text(
-                "⚙️ *Bot Settings*\n\nSetting updated! Select an option to configure:",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.MARKDOWN
-            )
+        # Refresh settings menu
+        chat_data = get_chat_data(chat_id)
+        settings = chat_data.get('settings', {})
         
-        elif setting == "sort_by":
-            # Toggle sort order
-            chat_data = get_chat_data(chat_id)
-            current = chat_data.get('settings', {}).get('sort_by', 'date')
-            new_sort = 'priority' if current == 'date' else 'date'
-            update_settings(chat_id, {'sort_by': new_sort})
-            
-            # Refresh settings menu
-            chat_data = get_chat_data(chat_id)
-            settings = chat_data.get('settings', {})
-            
-        elif setting == "auto_clean":
-            # Toggle auto-clean setting
-            chat_data = get_chat_data(chat_id)
-            current = chat_data.get('settings', {}).get('auto_clean', True)
-            update_settings(chat_id, {'auto_clean': not current})
-            
-            # Refresh settings menu
-            chat_data = get_chat_data(chat_id)
-            settings = chat_data.get('settings', {})
-            
-        elif setting == "auto_clean_days":
-            # Cycle through different day options (3, 7, 14, 30)
-            chat_data = get_chat_data(chat_id)
-            current = chat_data.get('settings', {}).get('auto_clean_days', 3)
-            
-            # Cycle through 3 -> 7 -> 14 -> 30 -> 3
-            if current == 3:
-                new_days = 7
-            elif current == 7:
-                new_days = 14
-            elif current == 14:
-                new_days = 30
-            else:
-                new_days = 3
+    elif setting == "auto_clean":
+        # Toggle auto-clean setting
+        chat_data = get_chat_data(chat_id)
+        current = chat_data.get('settings', {}).get('auto_clean', True)
+        update_settings(chat_id, {'auto_clean': not current})
+        
+        # Refresh settings menu
+        chat_data = get_chat_data(chat_id)
+        settings = chat_data.get('settings', {})
+        
+    elif setting == "auto_clean_days":
+        # Cycle through different day options (3, 7, 14, 30)
+        chat_data = get_chat_data(chat_id)
+        current = chat_data.get('settings', {}).get('auto_clean_days', 3)
+        
+        # Cycle through 3 -> 7 -> 14 -> 30 -> 3
+        if current == 3:
+            new_days = 7
+        elif current == 7:
+            new_days = 14
+        elif current == 14:
+            new_days = 30
+        else:
+            new_days = 3
+        
+        update_settings(chat_id, {'auto_clean_days': new_days})
                 
-            update_settings(chat_id, {'auto_clean_days': new_days})
-            
-            # Refresh settings menu
-            chat_data = get_chat_data(chat_id)
-            settings = chat_data.get('settings', {})
-            keyboard = get_settings_keyboard(settings)
-            
-            query.edit_message_text(
-                "⚙️ *Bot Settings*\n\nSetting updated! Select an option to configure:",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.MARKDOWN
-            )
+        # Refresh settings menu
+        chat_data = get_chat_data(chat_id)
+        settings = chat_data.get('settings', {})
+        keyboard = get_settings_keyboard(settings)
         
-        elif setting.startswith("theme:"):
-            # Update UI theme
-            theme = setting.split(":", 1)[1]
-            update_settings(chat_id, {'theme': theme})
-            
-            # Refresh settings menu
-            chat_data = get_chat_data(chat_id)
-            settings = chat_data.get('settings', {})
-            keyboard = get_settings_keyboard(settings)
+        query.edit_message_text(
+            "⚙️ *Bot Settings*\n\nSetting updated! Select an option to configure:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+        
+    elif setting.startswith("theme:"):
+        # Update UI theme
+        theme = setting.split(":", 1)[1]
+        update_settings(chat_id, {'theme': theme})
+        
+        # Refresh settings menu
+        chat_data = get_chat_data(chat_id)
+        settings = chat_data.get('settings', {})
+        keyboard = get_settings_keyboard(settings)
             
-            query.edit_message_text(
-                f"⚙️ *Bot Settings*\n\nTheme updated to *{theme.title()}*! Select an option to configure:",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.MARKDOWN
-            )
+        query.edit_message_text(
+            f"⚙️ *Bot Settings*\n\nTheme updated to *{theme.title()}*! Select an option to configure:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
             
-        elif setting.startswith("time_format:"):
-            # Update time format
-            time_format = setting.split(":", 1)[1]
-            update_settings(chat_id, {'time_format': time_format})
+    elif setting.startswith("time_format:"):
+        # Update time format
+        time_format = setting.split(":", 1)[1]
+        update_settings(chat_id, {'time_format': time_format})
+        
+        # Refresh settings menu
+        chat_data = get_chat_data(chat_id)
+        settings = chat_data.get('settings', {})
+        keyboard = get_settings_keyboard(settings)
             
-            # Refresh settings menu
-            chat_data = get_chat_data(chat_id)
-            settings = chat_data.get('settings', {})
-            keyboard = get_settings_keyboard(settings)
+        query.edit_message_text(
+            f"⚙️ *Bot Settings*\n\nTime format updated to *{time_format}*! Select an option to configure:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
             
-            query.edit_message_text(
-                f"⚙️ *Bot Settings*\n\nTime format updated to *{time_format}*! Select an option to configure:",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.MARKDOWN
-            )
-        
-        elif setting == "back":
-            # Just refresh the settings menu
-            chat_data = get_chat_data(chat_id)
-            settings = chat_data.get('settings', {})
-            keyboard = get_settings_keyboard(settings)
+    elif setting == "back":
+        # Just refresh the settings menu
+        chat_data = get_chat_data(chat_id)
+        settings = chat_data.get('settings', {})
+        keyboard = get_settings_keyboard(settings)
             
-            query.edit_message_text(
-                "⚙️ *Bot Settings*\n\nSelect an option to configure:",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.MARKDOWN
-            )
+        query.edit_message_text(
+            "⚙️ *Bot Settings*\n\nSelect an option to configure:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
 
 def join_group_handler(update: Update, context: CallbackContext) -> None:
     """Handle the /join command - join a group via invite link"""
@@ -1903,10 +2000,7 @@ def today_tasks_handler(update: Update, context: CallbackContext) -> None:
         
     chat_id = update.effective_chat.id
     
-    # Get all tasks for this chat
-    all_tasks = get_tasks(chat_id)
-    
-    if not all_tasks:
+    if not count_open_tasks(chat_id):
         update.message.reply_text("📝 You don't have any tasks yet. Use /add to create one!")
         return
     
@@ -1920,12 +2014,8 @@ def today_tasks_handler(update: Update, context: CallbackContext) -> None:
     today_start = datetime.combine(today, datetime.min.time()).timestamp()
     today_end = datetime.combine(tomorrow, datetime.min.time()).timestamp()
     
-    # Filter tasks due today
-    today_tasks = []
-    for task in all_tasks:
-        due_date = task.get('due_date')
-        if due_date and today_start <= float(due_date) < today_end:
-            today_tasks.append(task)
+    # Look up tasks due today in the due-date index
+    today_tasks = get_tasks_due_between(chat_id, today_start, today_end)
     
     if not today_tasks:
         update.message.reply_text("📅 You don't have any tasks due today!")
@@ -1949,10 +2039,7 @@ def week_tasks_handler(update: Update, context: CallbackContext) -> None:
         
     chat_id = update.effective_chat.id
     
-    # Get all tasks for this chat
-    all_tasks = get_tasks(chat_id)
-    
-    if not all_tasks:
+    if not count_open_tasks(chat_id):
         update.message.reply_text("📝 You don't have any tasks yet. Use /add to create one!")
         return
     
@@ -1966,12 +2053,8 @@ def week_tasks_handler(update: Update, context: CallbackContext) -> None:
     week_start = datetime.combine(today, datetime.min.time()).timestamp()
     week_end = datetime.combine(next_week, datetime.min.time()).timestamp()
     
-    # Filter tasks due this week
-    week_tasks = []
-    for task in all_tasks:
-        due_date = task.get('due_date')
-        if due_date and week_start <= float(due_date) < week_end:
-            week_tasks.append(task)
+    # Look up tasks due this week in the due-date index
+    week_tasks = get_tasks_due_between(chat_id, week_start, week_end)
     
     if not week_tasks:
         update.message.reply_text("📅 You don't have any tasks due this week!")
@@ -2013,7 +2096,7 @@ def priority_task_handler(update: Update, context: CallbackContext) -> None:
             row = []
             for priority in ["high", "medium", "low"]:
                 label = "🔴" if priority == "high" else "🟡" if priority == "medium" else "🟢"
-                row.append(InlineKeyboardButton(f"{label} {i+1}", callback_data=f"priority:{i}:{priority}"))
+                row.append(InlineKeyboardButton(f"{label} {i+1}", callback_data=f"priority:{task['id']}:{priority}"))
             keyboard.append(row)
         
         update.message.reply_text(
@@ -2039,17 +2122,7 @@ def priority_task_handler(update: Update, context: CallbackContext) -> None:
                     return
                 
                 # Update task priority
-                chat_data = get_chat_data(chat_id)
-                all_tasks = chat_data.get('tasks', [])
-                
-                # Find the right task (it might not be in the same position as in filtered tasks)
-                for task in all_tasks:
-                    if task.get('text') == tasks[task_index].get('text') and task.get('active', True):
-                        task['priority'] = priority
-                        task['updated_at'] = iso_now()
-                        break
-                
-                update_chat_data(chat_id, chat_data)
+                update_task(chat_id, tasks[task_index]['id'], {'priority': priority})
                 
                 # Get priority icon
                 priority_icon = "🔴" if priority == "high" else "🟡" if priority == "medium" else "🟢"
@@ -2062,9 +2135,9 @@ def priority_task_handler(update: Update, context: CallbackContext) -> None:
                 # Show priority options
                 keyboard = [
                     [
-                        InlineKeyboardButton("🔴 High", callback_data=f"priority:{task_index}:high"),
-                        InlineKeyboardButton("🟡 Medium", callback_data=f"priority:{task_index}:medium"),
-                        InlineKeyboardButton("🟢 Low", callback_data=f"priority:{task_index}:low")
+                        InlineKeyboardButton("🔴 High", callback_data=f"priority:{tasks[task_index]['id']}:high"),
+                        InlineKeyboardButton("🟡 Medium", callback_data=f"priority:{tasks[task_index]['id']}:medium"),
+                        InlineKeyboardButton("🟢 Low", callback_data=f"priority:{tasks[task_index]['id']}:low")
                     ]
                 ]
                 
@@ -2106,10 +2179,9 @@ def user_stats_handler(update: Update, context: CallbackContext) -> None:
     longest_streak = streaks.get('longest', 0)
     
     # Get active tasks by priority
-    tasks = get_tasks(chat_id)
-    high_priority = sum(1 for task in tasks if task.get('priority') == 'high')
-    medium_priority = sum(1 for task in tasks if task.get('priority') == 'medium')
-    low_priority = sum(1 for task in tasks if task.get('priority') == 'low')
+    high_priority = len(get_tasks_by_priority(chat_id, 'high'))
+    medium_priority = len(get_tasks_by_priority(chat_id, 'medium'))
+    low_priority = len(get_tasks_by_priority(chat_id, 'low'))
     
     # Format stats message
     stats_text = (
@@ -2169,17 +2241,7 @@ def tag_task_handler(update: Update, context: CallbackContext) -> None:
                 category = context.args[1]
                 
                 # Update task category
-                chat_data = get_chat_data(chat_id)
-                all_tasks = chat_data.get('tasks', [])
-                
-                # Find the right task (it might not be in the same position as in filtered tasks)
-                for task in all_tasks:
-                    if task.get('text') == tasks[task_index].get('text') and task.get('active', True):
-                        task['category'] = category
-                        task['updated_at'] = iso_now()
-                        break
-                
-                update_chat_data(chat_id, chat_data)
+                update_task(chat_id, tasks[task_index]['id'], {'category': category})
                 
                 update.message.reply_text(
                     f"🏷️ Category set to *{category}* for task:\n\n*{tasks[task_index]['text']}*",
@@ -2190,7 +2252,7 @@ def tag_task_handler(update: Update, context: CallbackContext) -> None:
                 keyboard = []
                 row = []
                 for i, category in enumerate(available_categories):
-                    row.append(InlineKeyboardButton(category, callback_data=f"category:{task_index}:{category}"))
+                    row.append(InlineKeyboardButton(category, callback_data=f"category:{tasks[task_index]['id']}:{payload_store.ref(category)}"))
                     if (i + 1) % 3 == 0:  # 3 buttons per row
                         keyboard.append(row)
                         row = []
@@ -2218,41 +2280,54 @@ def search_tasks_handler(update: Update, context: CallbackContext) -> None:
         return
         
     chat_id = update.effective_chat.id
+    args = list(context.args or [])
     
-    # Get tasks for this chat
-    all_tasks = get_tasks(chat_id, include_done=True)
-    
-    if not all_tasks:
-        update.message.reply_text("📝 You don't have any tasks yet. Use /add to create one!")
-        return
+    # Developers can search every chat with /search --all <terms>
+    global_search = bool(args) and args[0] == '--all' and is_developer(update.effective_user.id)
+    if global_search:
+        args = args[1:]
     
     # Check if search keyword is provided
-    if not context.args:
+    if not args:
         update.message.reply_text(
             "🔍 Please provide a search term after the /search command.\n"
-            "Example: `/search grocery` to find tasks containing 'grocery'",
+            "Example: `/search grocery` to find tasks containing words starting with 'grocery'",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    # Every word must match (as a word or word prefix) in the text, notes or category
+    search_term = ' '.join(args).lower()
+    
+    if global_search:
+        results = search_all_tasks(search_term)
+        if not results:
+            update.message.reply_text(f"🔍 No tasks in any chat match '{search_term}'.")
+            return
+        update.message.reply_text(
+            f"🔍 *Top matches for '{search_term}' across all chats:*\n\n" +
+            "\n".join(f"• `{result_chat_id}`: {task['text']}" for result_chat_id, task in results),
             parse_mode=ParseMode.MARKDOWN
         )
         return
     
-    # Join all arguments into a single search term
-    search_term = ' '.join(context.args).lower()
+    if not get_tasks(chat_id, include_done=True):
+        update.message.reply_text("📝 You don't have any tasks yet. Use /add to create one!")
+        return
     
-    # Search in task text, notes, and category
-    matching_tasks = []
-    for task in all_tasks:
-        if (search_term in task.get('text', '').lower() or 
-            search_term in task.get('notes', '').lower() or 
-            search_term in task.get('category', '').lower()):
-            if task.get('active', True):  # Only include active tasks
-                matching_tasks.append(task)
+    matching_tasks = search_tasks(chat_id, search_term)
     
-    if not matching_tasks:
+    # Completed tasks that were archived are indexed on the first search that needs them
+    archived_matches = search_archived_tasks(chat_id, search_term)
+    
+    if not matching_tasks and not archived_matches:
         update.message.reply_text(f"🔍 No tasks found matching '{search_term}'.")
         return
     
     # Format tasks as a list
     task_text = f"🔍 *Search results for '{search_term}':*\n\n" + format_task_list(matching_tasks)
+    if archived_matches:
+        task_text += "\n📦 *Archived:*\n" + "\n".join(f"• {task['text']}" for task in archived_matches)
     keyboard = get_task_list_keyboard(matching_tasks)
     
     update.message.reply_text(
@@ -2286,7 +2361,7 @@ def clean_chat_handler(update: Update, context: CallbackContext) -> None:
             ]
         ]
         
-        prompt_message = update.message.reply_text(
+        update.message.reply_text(
             "🧹 *Chat Cleanup Options*\n\n"
             "• *Clean bot messages*: Removes recent bot messages from this chat\n"
             "• *Clean all tasks*: Removes task listings and prompts\n\n"
@@ -2295,31 +2370,9 @@ def clean_chat_handler(update: Update, context: CallbackContext) -> None:
             parse_mode=ParseMode.MARKDOWN
         )
         
-        # Store the prompt message ID in the context for later deletion
-        if not context.chat_data.get('cleanup_messages'):
-            context.chat_data['cleanup_messages'] = []
-        
-        context.chat_data['cleanup_messages'].append({
-            'command_id': command_message_id,
-            'prompt_id': prompt_message.message_id,
-            'timestamp': datetime.now().timestamp()
-        })
-        
-        # Schedule automatic cleanup of old cleanup messages
-        def clean_old_prompts(context):
-            if context.chat_data.get('cleanup_messages'):
-                current_time = datetime.now().timestamp()
-                # Filter out messages older than 10 minutes
-                context.chat_data['cleanup_messages'] = [
-                    msg for msg in context.chat_data['cleanup_messages'] 
-                    if current_time - msg['timestamp'] < 600  # 10 minutes
-                ]
-        
-        context.job_queue.run_once(
-            clean_old_prompts,
-            600,  # 10 minutes
-            context=context
-        )
+        # The prompt is in the message ledger already; add the command so
+        # "Clean bot messages" removes it too
+        message_ledger.record(chat_id, command_message_id)
         
         logger.info(f"Chat cleanup options presented in {chat_id} (group chat)")
     else:
@@ -2427,7 +2480,7 @@ def text_message_handler(update: Update, context: CallbackContext) -> None:
     
     # Check if waiting for a custom tag
     if context.user_data and "custom_tag_task" in context.user_data:
-        task_index = context.user_data["custom_tag_task"]
+        task_id = context.user_data["custom_tag_task"]
         
         # Check for cancel
         if message_text.lower() == "cancel":
@@ -2451,42 +2504,30 @@ def text_message_handler(update: Update, context: CallbackContext) -> None:
             return
             
         # Update the task with the custom tag
-        tasks = get_tasks(chat_id)
-        if 0 <= task_index < len(tasks):
-            chat_data = get_chat_data(chat_id)
-            if 'tasks' in chat_data and task_index < len(chat_data['tasks']):
-                task = chat_data['tasks'][task_index]
-                task['category'] = tag
-                task_text = task['text']
-                update_chat_data(chat_id, chat_data)
+        task = update_task(chat_id, task_id, {'category': tag})
+        if task is not None:
+            task_text = task['text']
                 
-                # Success message with further options
-                keyboard = [
-                    [
-                        InlineKeyboardButton("⏰ Add Reminder", callback_data=f"remind:{task_index}"),
-                        InlineKeyboardButton("🔝 Set Priority", callback_data=f"set_priority:{task_index}")
-                    ],
-                    [
-                        InlineKeyboardButton("📋 View All Tasks", callback_data="list_tasks")
-                    ]
+            # Success message with further options
+            keyboard = [
+                [
+                    InlineKeyboardButton("⏰ Add Reminder", callback_data=f"remind:{task_id}"),
+                    InlineKeyboardButton("🔝 Set Priority", callback_data=f"set_priority:{task_id}")
+                ],
+                [
+                    InlineKeyboardButton("📋 View All Tasks", callback_data="list_tasks")
                 ]
+            ]
                 
-                update.message.reply_text(
-                    f"🏷️ Custom tag *#{tag}* added to task:\n\n*{task_text}*",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode=ParseMode.MARKDOWN
-                )
+            update.message.reply_text(
+                f"🏷️ Custom tag *#{tag}* added to task:\n\n*{task_text}*",
+                reply_markup=InlineKeyboardMarkup(keyboard),
+                parse_mode=ParseMode.MARKDOWN
+            )
                 
-                # Clean up user data
-                del context.user_data["custom_tag_task"]
-                return
-            else:
-                update.message.reply_text(
-                    "❌ Task not found. It may have been deleted.",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                del context.user_data["custom_tag_task"]
-                return
+            # Clean up user data
+            del context.user_data["custom_tag_task"]
+            return
         else:
             update.message.reply_text(
                 "❌ Task not found. It may have been deleted.",
@@ -2497,7 +2538,7 @@ def text_message_handler(update: Update, context: CallbackContext) -> None:
     
     # Check if waiting for custom reminder time
     if context.user_data and "custom_reminder_task" in context.user_data:
-        task_index = context.user_data["custom_reminder_task"]
+        task_id = context.user_data["custom_reminder_task"]
         
         # Check for cancel
         if message_text.lower() == "cancel":
@@ -2515,10 +2556,10 @@ def text_message_handler(update: Update, context: CallbackContext) -> None:
             
             if reminder_time:
                 # Successfully parsed the time
-                if set_reminder(chat_id, task_index, reminder_time):
-                    tasks = get_tasks(chat_id)
-                    if 0 <= task_index < len(tasks):
-                        task_text = tasks[task_index]['text']
+                if set_reminder(chat_id, task_id, reminder_time):
+                    task = get_task(chat_id, task_id)
+                    if task is not None:
+                        task_text = task['text']
                         
                         # Calculate time difference for display
                         from datetime import datetime
@@ -2737,11 +2778,11 @@ def text_message_handler(update: Update, context: CallbackContext) -> None:
             # Ask if user wants to add this as a task with smart buttons
             keyboard = [
                 [
-                    InlineKeyboardButton("✅ Yes, add task", callback_data=f"add_task:{message_text[:200]}"),
+                    InlineKeyboardButton("✅ Yes, add task", callback_data=f"add_task:{payload_store.ref(message_text)}"),
                     InlineKeyboardButton("❌ No", callback_data="cancel_add_task")
                 ],
                 [
-                    InlineKeyboardButton("⏰ Add with reminder", callback_data=f"add_task_reminder:{message_text[:200]}")
+                    InlineKeyboardButton("⏰ Add with reminder", callback_data=f"add_task_reminder:{payload_store.ref(message_text)}")
                 ]
             ]
             
@@ -2768,7 +2809,7 @@ def text_message_handler(update: Update, context: CallbackContext) -> None:
             keyboard = [
                 [
                     InlineKeyboardButton("📚 View Commands", callback_data="group_help"),
-                    InlineKeyboardButton("➕ Add Task", callback_data=f"add_task:{message_text[:200]}")
+                    InlineKeyboardButton("➕ Add Task", callback_data=f"add_task:{payload_store.ref(message_text)}")
                 ]
             ]
             
@@ -2803,6 +2844,24 @@ def reply_to_message(update: Update, text: str, **kwargs):
         return update.effective_chat.send_message(text, **kwargs)
     return None
 
+def my_chat_member_handler(update: Update, context: CallbackContext) -> None:
+    """Track whether the bot can still reach a chat from its own membership changes"""
+    member_update = update.my_chat_member
+    chat_id = member_update.chat.id
+    status = member_update.new_chat_member.status
+    if status in ('kicked', 'left'):
+        chat_registry.mark_dead(chat_id, f"bot {status}")
+    elif status in ('member', 'administrator', 'creator', 'restricted'):
+        chat_registry.mark_alive(chat_id)
+
+def chat_migration_handler(update: Update, context: CallbackContext) -> None:
+    """Move a group's data to its new ID when it is upgraded to a supergroup"""
+    message = update.effective_message
+    if message.migrate_to_chat_id:
+        chat_registry.mark_migrated(message.chat.id, message.migrate_to_chat_id)
+    elif message.migrate_from_chat_id:
+        chat_registry.mark_migrated(message.migrate_from_chat_id, message.chat.id)
+
 def error_handler(update: Update, context: CallbackContext) -> None:
     """Handle errors in the telegram bot"""
     error_message = str(context.error)
@@ -2878,92 +2937,101 @@ def groupcast_handler(update: Update, context: CallbackContext) -> None:
     
     # Check if there are enough arguments
     if not context.args or (len(context.args) == 1 and context.args[0].lower() == "help"):
-        # Show help menu with known groups if available
-        known_groups = []
-        known_group_usernames = []
-        
-        # Get all known chats from database
-        chat_ids = get_all_chat_ids()
-        
-        # Try to get information for each chat
-        for chat_id_str in chat_ids:
-            try:
-                chat_id = int(chat_id_str)
-                chat_data = get_chat_data(chat_id)
-                
-                # Only include groups and supergroups
-                chat_type = chat_data.get('chat_type', '')
-                if chat_type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]:
-                    # Try to get chat info from Telegram
-                    try:
-                        chat_info = context.bot.get_chat(chat_id)
-                        if chat_info.username:
-                            group_name = f"@{chat_info.username}"
-                            known_group_usernames.append((group_name, chat_id))
-                        else:
-                            group_name = chat_info.title or f"Group {chat_id}"
-                        
-                        known_groups.append((group_name, chat_id))
-                    except Exception:
-                        # Couldn't get chat info, but we know it's a group
-                        known_groups.append((f"Group {chat_id}", chat_id))
-            except Exception as e:
-                logger.warning(f"Error getting info for chat {chat_id_str}: {e}")
+        # Store user's current state in user_data
+        if not context.user_data:
+            context.user_data = {}
+        context.user_data['groupcast_state'] = 'selecting_group'
         
-        # Create inline keyboard with known groups
-        keyboard = []
+        # Looking up every known group takes one API call each, so it runs in
+        # the background and fills in this placeholder when done
+        status_message = update.message.reply_text("📢 Looking up known groups...")
+        bot = context.bot
         
-        # First add groups with usernames (easier to identify)
-        for group_name, chat_id in sorted(known_group_usernames, key=lambda x: x[0].lower()):
+        def list_groups(job):
+            # Show help menu with known groups if available
+            known_groups = []
+            known_group_usernames = []
+            
+            # Get all known chats from database, except those the bot can no longer reach
+            chat_ids = chat_registry.filter_alive(get_all_chat_ids())
+            
+            # Try to get information for each chat
+            for i, chat_id_str in enumerate(chat_ids):
+                job.progress(i, len(chat_ids), f"📢 Looking up known groups... ({i}/{len(chat_ids)} chats)")
+                try:
+                    chat_id = int(chat_id_str)
+                    chat_data = get_chat_data(chat_id)
+                    
+                    # Only include groups and supergroups
+                    chat_type = chat_data.get('chat_type', '')
+                    if chat_type in [CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP]:
+                        # Try to get chat info from Telegram
+                        try:
+                            chat_info = bot.get_chat(chat_id)
+                            if chat_info.username:
+                                group_name = f"@{chat_info.username}"
+                                known_group_usernames.append((group_name, chat_id))
+                            else:
+                                group_name = chat_info.title or f"Group {chat_id}"
+                            
+                            known_groups.append((group_name, chat_id))
+                        except Exception:
+                            # Couldn't get chat info, but we know it's a group
+                            known_groups.append((f"Group {chat_id}", chat_id))
+                except Exception as e:
+                    logger.warning(f"Error getting info for chat {chat_id_str}: {e}")
+            
+            # Create inline keyboard with known groups
+            keyboard = []
+            
+            # First add groups with usernames (easier to identify)
+            for group_name, chat_id in sorted(known_group_usernames, key=lambda x: x[0].lower()):
+                keyboard.append([
+                    InlineKeyboardButton(
+                        f"{group_name}",
+                        callback_data=f"groupcast_select:{chat_id}"
+                    )
+                ])
+            
+            # Then add groups without usernames
+            for group_name, chat_id in sorted(known_groups, key=lambda x: x[0].lower()):
+                # Skip groups that are already added (those with usernames)
+                if any(chat_id == x[1] for x in known_group_usernames):
+                    continue
+                
+                keyboard.append([
+                    InlineKeyboardButton(
+                        f"{group_name}",
+                        callback_data=f"groupcast_select:{chat_id}"
+                    )
+                ])
+            
+            # Add a cancel button
             keyboard.append([
-                InlineKeyboardButton(
-                    f"{group_name}", 
-                    callback_data=f"groupcast_select:{chat_id}"
-                )
+                InlineKeyboardButton("❌ Cancel", callback_data="groupcast_cancel")
             ])
-        
-        # Then add groups without usernames
-        for group_name, chat_id in sorted(known_groups, key=lambda x: x[0].lower()):
-            # Skip groups that are already added (those with usernames)
-            if any(chat_id == x[1] for x in known_group_usernames):
-                continue
-                
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"{group_name}", 
-                    callback_data=f"groupcast_select:{chat_id}"
+            
+            if keyboard and len(keyboard) > 1:  # More than just the cancel button
+                job.finish(
+                    "📢 *Group Broadcast*\n\n"
+                    "Select a group to send your announcement to, or use the command with a group ID/username and message:\n\n"
+                    "• `/groupcast GROUP_ID Your message`\n"
+                    "• `/groupcast @group_username Your message`",
+                    reply_markup=InlineKeyboardMarkup(keyboard),
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            else:
+                # No known groups or error fetching them
+                job.finish(
+                    "📢 *Group Broadcast*\n\n"
+                    "No groups found that the bot is a member of. Please provide a group ID/username and message:\n\n"
+                    "• `/groupcast GROUP_ID Your message`\n"
+                    "• `/groupcast @group_username Your message`\n"
+                    "• `/groupcast group_username Your message`",
+                    parse_mode=ParseMode.MARKDOWN
                 )
-            ])
-        
-        # Add a cancel button
-        keyboard.append([
-            InlineKeyboardButton("❌ Cancel", callback_data="groupcast_cancel")
-        ])
-        
-        # Store user's current state in user_data
-        if not context.user_data:
-            context.user_data = {}
-        context.user_data['groupcast_state'] = 'selecting_group'
         
-        if keyboard and len(keyboard) > 1:  # More than just the cancel button
-            update.message.reply_text(
-                "📢 *Group Broadcast*\n\n"
-                "Select a group to send your announcement to, or use the command with a group ID/username and message:\n\n"
-                "• `/groupcast GROUP_ID Your message`\n"
-                "• `/groupcast @group_username Your message`",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode=ParseMode.MARKDOWN
-            )
-        else:
-            # No known groups or error fetching them
-            update.message.reply_text(
-                "📢 *Group Broadcast*\n\n"
-                "No groups found that the bot is a member of. Please provide a group ID/username and message:\n\n"
-                "• `/groupcast GROUP_ID Your message`\n"
-                "• `/groupcast @group_username Your message`\n"
-                "• `/groupcast group_username Your message`",
-                parse_mode=ParseMode.MARKDOWN
-            )
+        job_runner.run("Group lookup", list_groups, bot, status_message.chat_id, status_message.message_id)
         return
     
     # First argument is the group identifier (ID or username)
@@ -3186,73 +3254,76 @@ def send_group_broadcast(update: Update, context: CallbackContext, group_id: int
     return send_group_broadcast_by_id(update, context, group_id, message)
 
 def send_global_broadcast(update: Update, context: CallbackContext, broadcast_message: str) -> None:
-    """Send a broadcast message to all chats"""
-    chat_ids = get_all_chat_ids()
+    """Start a persisted broadcast job that sends a message to all live chats"""
+    chat_ids = chat_registry.filter_alive(get_all_chat_ids())
     
-    sent_count = 0
-    failed_count = 0
-    
-    # Send a status message first
+    # Send a status message first; the job keeps editing it with its progress
     status_message = update.message.reply_text(
         f"📣 Broadcasting message to {len(chat_ids)} chats...\n"
         f"Sent: 0\nFailed: 0"
     )
     
-    # Track sent messages for potential deletion
+    # The job checkpoints its progress, so it resumes after a restart and its
+    # sent messages stay available for /delbroadcast
     broadcast_id = datetime.now().strftime('%Y%m%d%H%M%S')
-    sent_messages = []
+    broadcast_jobs.start(
+        broadcast_id,
+        broadcast_message,
+        [int(chat_id) for chat_id in chat_ids],
+        update.effective_user.id,
+        status_message.chat_id,
+        status_message.message_id
+    )
     
-    # Send the broadcast message to all chats
-    for chat_id in chat_ids:
-        try:
-            # Send the message and get the message object
-            sent_msg = context.bot.send_message(
-                chat_id=int(chat_id),
-                text=f"📣 *Announcement*\n\n{broadcast_message}",
-                parse_mode=ParseMode.MARKDOWN
-            )
+def broadcast_control_handler(update: Update, context: CallbackContext, status: str) -> None:
+    """Pause, resume or cancel a broadcast job (developer only)"""
+    if not is_developer(update.effective_user.id):
+        update.message.reply_text("❌ This command is only available to developers.")
+        return
+    
+    if not context.args:
+        jobs = broadcast_jobs.unfinished_jobs()
+        job_list = "\n".join(
+            f"• `{job.id}` ({job.status}, {job.cursor}/{len(job.recipients)} chats)" for job in jobs
+        ) or "No running or paused broadcasts."
+        update.message.reply_text(
+            f"Please provide a broadcast ID.\n\n{job_list}",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    broadcast_id = context.args[0]
+    job = broadcast_jobs.set_status(broadcast_id, status)
+    if job is None:
+        update.message.reply_text(f"❌ No running or paused broadcast with ID {broadcast_id}.")
+        return
             
-            # Store the chat ID and message ID
-            sent_messages.append({
-                'chat_id': int(chat_id),
-                'message_id': sent_msg.message_id
-            })
+    actions = {'paused': "⏸️ Pausing", 'running': "▶️ Resuming", 'cancelled': "⏹️ Cancelling"}
+    update.message.reply_text(
+        f"{actions[status]} broadcast {broadcast_id} "
+        f"({len(job.sent)} sent, {len(job.recipients) - job.cursor} chats left)."
+    )
             
-            sent_count += 1
+def pause_broadcast_handler(update: Update, context: CallbackContext) -> None:
+    """Handle the /pausebroadcast command - pause a running broadcast (developer only)"""
+    broadcast_control_handler(update, context, 'paused')
             
-            # Update status every 10 messages
-            if sent_count % 10 == 0:
-                status_message.edit_text(
-                    f"📣 Broadcasting message to {len(chat_ids)} chats...\n"
-                    f"Sent: {sent_count}\nFailed: {failed_count}"
-                )
-                
-            # Add a small delay to avoid hitting rate limits
-            time.sleep(0.1)
+def resume_broadcast_handler(update: Update, context: CallbackContext) -> None:
+    """Handle the /resumebroadcast command - resume a paused broadcast (developer only)"""
+    broadcast_control_handler(update, context, 'running')
             
-        except Exception as e:
-            logger.error(f"Failed to send broadcast to {chat_id}: {e}")
-            failed_count += 1
-    
-    # Save broadcast messages to bot data
-    if 'broadcasts' not in context.bot_data:
-        context.bot_data['broadcasts'] = {}
-    
-    context.bot_data['broadcasts'][broadcast_id] = {
-        'message': broadcast_message,
-        'sent_messages': sent_messages,
-        'timestamp': datetime.now().isoformat(),
-        'sender_id': update.effective_user.id
-    }
-    
-    # Final status update with broadcast ID for deletion reference
-    status_message.edit_text(
-        f"📣 Broadcast complete!\n"
-        f"Sent: {sent_count}\nFailed: {failed_count}\n\n"
-        f"Broadcast ID: `{broadcast_id}`\n"
-        f"Use /delbroadcast {broadcast_id} to delete this announcement from all chats.",
-        parse_mode=ParseMode.MARKDOWN
-    )
+def cancel_broadcast_handler(update: Update, context: CallbackContext) -> None:
+    """Handle the /cancelbroadcast command - cancel a broadcast (developer only)"""
+    broadcast_control_handler(update, context, 'cancelled')
+
+def format_button_stats(route_stats: List[Dict[str, Any]]) -> str:
+    """Format the busiest button routes as a /devstats line"""
+    # Patterns like add_task: are code spans, so their underscores don't open an italic
+    return "Busiest buttons: " + ", ".join(
+        f"`{route['pattern']}` {route['calls']}x {route['avg_time'] * 1000:.0f}ms"
+        + (f" ({route['errors']} errors)" if route['errors'] else "")
+        for route in route_stats
+    ) + "\n"
 
 def stats_handler(update: Update, context: CallbackContext) -> None:
     """Handle the /devstats command - show detailed bot statistics (developer only)"""
@@ -3262,7 +3333,14 @@ def stats_handler(update: Update, context: CallbackContext) -> None:
         update.message.reply_text("❌ This command is only available to developers.")
         return
     
+    # `/devstats verify` recounts everything to check the incremental counters
+    verify = bool(context.args) and context.args[0].lower() == 'verify'
     stats = get_stats()
+    if verify:
+        recounted = recount_stats()
+        drift = ", ".join(f"{key.replace('_', ' ')} {recounted[key] - stats[key]:+d}"
+                          for key in stats if recounted[key] != stats[key])
+        stats = recounted
     
     stats_text = (
         "📊 *Bot Statistics*\n\n"
@@ -3273,9 +3351,65 @@ def stats_handler(update: Update, context: CallbackContext) -> None:
         f"• Active: {stats['active_tasks']}\n"
         f"• Completed: {stats['completed_tasks']}\n"
     )
+    if verify:
+        stats_text += "\n✅ Counters verified" if not drift else f"\n⚠️ Counters corrected: {drift}"
+    
+    # Chats skipped by bulk sends
+    liveness = chat_registry.stats()
+    stats_text += f"\nUnreachable chats: {liveness['dead']} dead, {liveness['migrated']} migrated\n"
+    
+    # Sends held back by network outages
+    outbox_stats = outbox.stats()
+    stats_text += f"Outbox: {outbox_stats['pending']} pending, {outbox_stats['waiting']} waiting"
+    stats_text += f" (Telegram unreachable, retry in {outbox_stats['retry_in']:.0f}s)\n" if outbox_stats['down'] else "\n"
+    
+    # Slowest button handlers by total time
+    route_stats = callback_router.stats()[:5]
+    if route_stats:
+        stats_text += format_button_stats(route_stats)
+    
+    # Button texts kept server-side
+    payload_stats = payload_store.stats()
+    stats_text += f"Button payloads: {payload_stats['entries']} stored ({payload_stats['log_lines']} log lines)\n"
+    
+    # Group messages recorded for cleanup
+    ledger_stats = message_ledger.stats()
+    stats_text += f"Message ledger: {ledger_stats['buckets']} day buckets in {ledger_stats['chats']} chats\n"
+    
+    # Outbound queue depth and wait per traffic class
+    send_stats = send_queue.stats()
+    stats_text += (
+        f"\nOutbound: {send_stats['sent']} sent, {send_stats['failed']} failed, {send_stats['retried']} retried\n" +
+        "".join(f"• {priority.capitalize()}: {c['queued']} queued, {c['avg_wait']:.1f}s avg / {c['max_wait']:.1f}s max wait\n"
+                for priority, c in send_stats['classes'].items())
+    )
+    
+    # Incoming update pool depth and latency
+    pool_stats = update_pool.stats()
+    stats_text += (
+        f"\nUpdates: {pool_stats['processed']} handled, {pool_stats['failed']} failed\n"
+        f"• {pool_stats['queued']} queued across {pool_stats['chats']} chats, {pool_stats['active']}/{pool_stats['workers']} workers busy\n"
+        f"• {pool_stats['avg_latency']:.2f}s avg / {pool_stats['max_latency']:.1f}s max latency, deepest chat queue {pool_stats['max_depth']}\n"
+    )
     
     update.message.reply_text(stats_text, parse_mode=ParseMode.MARKDOWN)
 
+def jobs_handler(update: Update, context: CallbackContext) -> None:
+    """Handle the /jobs command - show background job status (developer only)"""
+    if not is_developer(update.effective_user.id):
+        update.message.reply_text("❌ This command is only available to developers.")
+        return
+    
+    if context.args:
+        job = job_runner.get_job(context.args[0])
+        update.message.reply_text(job.describe() if job else f"❌ No job with ID {context.args[0]}.")
+        return
+    
+    lines = [job.describe() for job in job_runner.recent_jobs()]
+    lines += [f"Broadcast {job.id}: {job.status} {job.cursor}/{len(job.recipients)}"
+              for job in broadcast_jobs.unfinished_jobs()]
+    update.message.reply_text("⚙️ Background jobs\n\n" + ("\n".join(lines) or "No recent jobs."))
+
 def maintenance_handler(update: Update, context: CallbackContext) -> None:
     """Handle the /maintenance command - toggle maintenance mode (developer only)"""
     user_id = update.effective_user.id
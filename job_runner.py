@@ -0,0 +1,106 @@
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Optional
+from config import JOB_RUNNER_WORKERS, JOB_STATUS_EDIT_INTERVAL, JOB_HISTORY_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Long developer operations run here instead of on the dispatcher thread.
+# Finished jobs are kept (up to JOB_HISTORY_SIZE) so their status stays queryable.
+_executor = ThreadPoolExecutor(max_workers=JOB_RUNNER_WORKERS, thread_name_prefix="job")
+_jobs = {}  # Job ID -> Job, oldest first
+_lock = threading.Lock()
+_ids = itertools.count(1)
+
+class StatusEditor:
+    """Edits one status message, at most once per JOB_STATUS_EDIT_INTERVAL except for the final edit"""
+    
+    def __init__(self, bot, chat_id: int, message_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.last_edit = 0.0
+        self.last_text = None
+    
+    def update(self, text: str, force: bool = False, **kwargs) -> None:
+        """Show text in the status message unless the last edit was too recent"""
+        now = time.monotonic()
+        if text == self.last_text or (not force and now - self.last_edit < JOB_STATUS_EDIT_INTERVAL):
+            return
+        self.last_edit = now
+        self.last_text = text
+        try:
+            self.bot.edit_message_text(text=text, chat_id=self.chat_id, message_id=self.message_id, **kwargs)
+        except Exception as e:
+            logger.debug(f"Could not edit status message {self.message_id} in {self.chat_id}: {e}")
+
+class Job:
+    """A background operation with progress"""
+    
+    def __init__(self, name: str, editor: Optional[StatusEditor]):
+        self.id = str(next(_ids))
+        self.name = name
+        self.editor = editor
+        self.status = 'queued'  # queued, running, done or failed
+        self.done = 0
+        self.total = 0
+        self.error = None
+        self.created = datetime.now()
+        self.finished = None
+    
+    def progress(self, done: int, total: int, text: str = None, **kwargs) -> None:
+        """Record progress and show text in the status message (throttled)"""
+        self.done = done
+        self.total = total
+        if text is not None and self.editor is not None:
+            self.editor.update(text, **kwargs)
+    
+    def finish(self, text: str, **kwargs) -> None:
+        """Show the final text in the status message"""
+        if self.editor is not None:
+            self.editor.update(text, force=True, **kwargs)
+    
+    def describe(self) -> str:
+        """Get a one-line summary of the job"""
+        progress = f" {self.done}/{self.total}" if self.total else ""
+        error = f" ({self.error})" if self.error else ""
+        return f"#{self.id} {self.name}: {self.status}{progress}{error}"
+
+def _run(job: Job, func: Callable[[Job], None]) -> None:
+    job.status = 'running'
+    try:
+        func(job)
+        job.status = 'done'
+    except Exception as e:
+        logger.error(f"Job #{job.id} {job.name} failed: {e}")
+        job.status = 'failed'
+        job.error = str(e)
+        job.finish(f"❌ {job.name} failed: {e}")
+    job.finished = datetime.now()
+
+def run(name: str, func: Callable[[Job], None], bot=None, chat_id: int = None, message_id: int = None) -> Job:
+    """Run func(job) in the background, reporting through the given status message if any"""
+    editor = StatusEditor(bot, chat_id, message_id) if bot is not None and message_id is not None else None
+    job = Job(name, editor)
+    with _lock:
+        _jobs[job.id] = job
+        while len(_jobs) > JOB_HISTORY_SIZE:
+            oldest = next(iter(_jobs))
+            if _jobs[oldest].status in ('queued', 'running'):
+                break
+            del _jobs[oldest]
+    _executor.submit(_run, job, func)
+    return job
+
+def get_job(job_id: str) -> Optional[Job]:
+    """Get a job by ID"""
+    return _jobs.get(job_id.lstrip('#'))
+
+def recent_jobs(limit: int = 10) -> List[Job]:
+    """Get the most recent jobs, newest first"""
+    with _lock:
+        return list(reversed(list(_jobs.values())))[:limit]
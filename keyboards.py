@@ -7,26 +7,38 @@ def get_task_list_keyboard(tasks: List[Dict[str, Any]], action_type: str = "defa
     
     for i, task in enumerate(tasks):
         row = []
+        # Buttons carry the stable task ID; the number is only for display
+        task_id = task['id']
         
         if action_type == "default":
             # Default keyboard for task list has Done and Delete buttons
-            row.append(InlineKeyboardButton("✅ Done", callback_data=f"done:{i}"))
-            row.append(InlineKeyboardButton("🗑️ Delete", callback_data=f"delete:{i}"))
-            row.append(InlineKeyboardButton("⏰ Remind", callback_data=f"remind:{i}"))
+            row.append(InlineKeyboardButton("✅ Done", callback_data=f"done:{task_id}"))
+            row.append(InlineKeyboardButton("🗑️ Delete", callback_data=f"delete:{task_id}"))
+            row.append(InlineKeyboardButton("⏰ Remind", callback_data=f"remind:{task_id}"))
         elif action_type == "done":
             # Only Done button
-            row.append(InlineKeyboardButton(f"✅ Task {i+1}", callback_data=f"done:{i}"))
+            row.append(InlineKeyboardButton(f"✅ Task {i+1}", callback_data=f"done:{task_id}"))
         elif action_type == "delete":
             # Only Delete button
-            row.append(InlineKeyboardButton(f"🗑️ Task {i+1}", callback_data=f"delete:{i}"))
+            row.append(InlineKeyboardButton(f"🗑️ Task {i+1}", callback_data=f"delete:{task_id}"))
         elif action_type == "remind":
             # Only Remind button
-            row.append(InlineKeyboardButton(f"⏰ Task {i+1}", callback_data=f"remind:{i}"))
+            row.append(InlineKeyboardButton(f"⏰ Task {i+1}", callback_data=f"remind:{task_id}"))
         
         keyboard.append(row)
     
     return keyboard
 
+def get_reminder_digest_keyboard(tasks: List[Dict[str, Any]]) -> List[List[InlineKeyboardButton]]:
+    """Generate Done and Remind buttons for each task of a reminder digest"""
+    return [
+        [
+            InlineKeyboardButton(f"✅ Done {i+1}", callback_data=f"done:{task['id']}"),
+            InlineKeyboardButton(f"⏰ Remind {i+1}", callback_data=f"remind:{task['id']}"),
+        ]
+        for i, task in enumerate(tasks)
+    ]
+
 def get_confirmation_keyboard(action: str) -> List[List[InlineKeyboardButton]]:
     """Generate confirmation keyboard with Yes/No buttons"""
     if action == "clear_all":
@@ -38,15 +50,15 @@ def get_confirmation_keyboard(action: str) -> List[List[InlineKeyboardButton]]:
             ]
         ]
     else:
-        # Confirmation for other actions (like deleting a specific task)
+        # Confirmation for other actions (like "delete:<task ID>")
         return [
             [
-                InlineKeyboardButton("✅ Yes", callback_data="confirm_delete"),
+                InlineKeyboardButton("✅ Yes", callback_data=f"confirm_{action}"),
                 InlineKeyboardButton("❌ No", callback_data="cancel_delete")
             ]
         ]
 
-def get_time_selection_keyboard(task_index: int) -> List[List[InlineKeyboardButton]]:
+def get_time_selection_keyboard(task_id: str) -> List[List[InlineKeyboardButton]]:
     """Generate keyboard for selecting reminder time"""
     # Define common reminder times (in minutes) with more friendly labels
     times = [
@@ -70,33 +82,33 @@ def get_time_selection_keyboard(task_index: int) -> List[List[InlineKeyboardButt
     
     # First section: Quick options (most common)
     keyboard.append([
-        InlineKeyboardButton(times[0][0], callback_data=f"time:{task_index}:{times[0][1]}"),
-        InlineKeyboardButton(times[1][0], callback_data=f"time:{task_index}:{times[1][1]}")
+        InlineKeyboardButton(times[0][0], callback_data=f"time:{task_id}:{times[0][1]}"),
+        InlineKeyboardButton(times[1][0], callback_data=f"time:{task_id}:{times[1][1]}")
     ])
     
     keyboard.append([
-        InlineKeyboardButton(times[2][0], callback_data=f"time:{task_index}:{times[2][1]}"),
-        InlineKeyboardButton(times[3][0], callback_data=f"time:{task_index}:{times[3][1]}")
+        InlineKeyboardButton(times[2][0], callback_data=f"time:{task_id}:{times[2][1]}"),
+        InlineKeyboardButton(times[3][0], callback_data=f"time:{task_id}:{times[3][1]}")
     ])
     
     # Second section: Longer periods
     keyboard.append([
-        InlineKeyboardButton(times[4][0], callback_data=f"time:{task_index}:{times[4][1]}"),
-        InlineKeyboardButton(times[5][0], callback_data=f"time:{task_index}:{times[5][1]}")
+        InlineKeyboardButton(times[4][0], callback_data=f"time:{task_id}:{times[4][1]}"),
+        InlineKeyboardButton(times[5][0], callback_data=f"time:{task_id}:{times[5][1]}")
     ])
     
     # Third section: Special timing options (good for groups)
-    keyboard.append([InlineKeyboardButton(times[6][0], callback_data=f"time:{task_index}:{times[6][1]}")])
+    keyboard.append([InlineKeyboardButton(times[6][0], callback_data=f"time:{task_id}:{times[6][1]}")])
     
     keyboard.append([
-        InlineKeyboardButton(group_times[0][0], callback_data=f"special_time:{task_index}:{group_times[0][1]}"),
-        InlineKeyboardButton(group_times[1][0], callback_data=f"special_time:{task_index}:{group_times[1][1]}")
+        InlineKeyboardButton(group_times[0][0], callback_data=f"special_time:{task_id}:{group_times[0][1]}"),
+        InlineKeyboardButton(group_times[1][0], callback_data=f"special_time:{task_id}:{group_times[1][1]}")
     ])
     
-    keyboard.append([InlineKeyboardButton(group_times[2][0], callback_data=f"special_time:{task_index}:{group_times[2][1]}")])
+    keyboard.append([InlineKeyboardButton(group_times[2][0], callback_data=f"special_time:{task_id}:{group_times[2][1]}")])
     
     # Add custom time option
-    keyboard.append([InlineKeyboardButton("⚙️ Custom time", callback_data=f"custom_time:{task_index}")])
+    keyboard.append([InlineKeyboardButton("⚙️ Custom time", callback_data=f"custom_time:{task_id}")])
     
     # Add cancel option (important for UX)
     keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_reminder")])
@@ -116,20 +116,13 @@ def main():
                 
                 updater.job_queue.run_repeating(log_uptime_job, interval=3600, first=3600)  # Log uptime every hour
                 
-                # Schedule automatic cleanup of old messages in group chats (once per day)
+                # Clean up old group messages in small slices through the day
                 def auto_cleanup_job(context):
-                    logger.info("Running scheduled auto-cleanup task")
-                    try:
-                        from auto_cleanup import clean_old_messages
-                        clean_old_messages(TELEGRAM_TOKEN, default_days_old=7)
-                        logger.info("Scheduled auto-cleanup completed successfully")
-                    except Exception as e:
-                        logger.error(f"Scheduled auto-cleanup failed: {e}")
+                    from auto_cleanup import run_cleanup_slice
+                    run_cleanup_slice(TELEGRAM_TOKEN, default_days_old=7, bot=context.bot)
                 
-                # Run once a day at 3:00 AM UTC
-                from datetime import time as datetime_time
-                cleanup_time = datetime_time(hour=3, minute=0)
-                updater.job_queue.run_daily(auto_cleanup_job, time=cleanup_time)
+                from config import CLEANUP_SLICE_INTERVAL
+                updater.job_queue.run_repeating(auto_cleanup_job, interval=CLEANUP_SLICE_INTERVAL, first=60)
                 
                 # Reset restart counter after successful start
                 restart_count = 0
@@ -0,0 +1,142 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+from telegram import Message
+from config import LEDGER_DIR, CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP
+
+logger = logging.getLogger(__name__)
+
+# Every message the bot sends to a group is recorded so it can be cleaned up
+# later. Records are "<message_id> <unix time>" lines appended to one file per
+# chat and UTC day, LEDGER_DIR/<chat_id>/<YYYYMMDD>.log, so a cleanup run
+# lists a chat's day files and only opens the ones that are entirely older
+# than its cutoff, then drops them whole. Appends are not fsynced: a crash can
+# lose the last few records, which only means those messages are not
+# auto-deleted.
+_lock = threading.Lock()
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%d')
+
+def _chat_dir(chat_id) -> str:
+    return os.path.join(LEDGER_DIR, str(chat_id))
+
+def _bucket_path(chat_id, day: str) -> str:
+    return os.path.join(_chat_dir(chat_id), f"{day}.log")
+
+def record(chat_id, message_id: int, timestamp: float = None) -> None:
+    """Append a sent message to its chat's bucket for the day"""
+    timestamp = time.time() if timestamp is None else timestamp
+    path = _bucket_path(chat_id, _day(timestamp))
+    with _lock:
+        try:
+            os.makedirs(_chat_dir(chat_id), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as file:
+                file.write(f"{message_id} {int(timestamp)}\n")
+        except OSError as e:
+            logger.error(f"Could not record message {message_id} of chat {chat_id}: {e}")
+
+def record_sent(message) -> None:
+    """Record a message the bot sent, if it went to a group"""
+    if not isinstance(message, Message) or message.chat.type not in (CHAT_TYPE_GROUP, CHAT_TYPE_SUPERGROUP):
+        return
+    timestamp = message.date.timestamp() if message.date else None
+    record(message.chat_id, message.message_id, timestamp)
+
+def buckets(chat_id) -> List[str]:
+    """Get the days (YYYYMMDD) a chat has records for, oldest first"""
+    try:
+        names = os.listdir(_chat_dir(chat_id))
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-4] for name in names if name.endswith('.log'))
+
+def expired_buckets(chat_id, days: float, now: float = None) -> List[str]:
+    """Get the days whose every record is more than `days` days old
+    
+    The bucket the cutoff falls in is left for a later run, so a message may
+    outlive its cutoff by up to a day.
+    """
+    cutoff = (time.time() if now is None else now) - days * 24 * 60 * 60
+    # A day is expired once the next day started before the cutoff
+    last_expired = _day(cutoff - 24 * 60 * 60)
+    return [day for day in buckets(chat_id) if day <= last_expired]
+
+def load_bucket(chat_id, day: str) -> List[Tuple[int, int]]:
+    """Get the (message_id, timestamp) records of one day, oldest first"""
+    records = []
+    path = _bucket_path(chat_id, day)
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) != 2:
+                    continue  # A torn last line after a crash
+                try:
+                    records.append((int(parts[0]), int(parts[1])))
+                except ValueError:
+                    logger.warning(f"Skipping unreadable record {line.strip()!r} in {path}")
+    except FileNotFoundError:
+        pass
+    return records
+
+def drop_bucket(chat_id, day: str) -> None:
+    """Forget every record of one day"""
+    with _lock:
+        try:
+            os.remove(_bucket_path(chat_id, day))
+        except FileNotFoundError:
+            pass
+        try:
+            os.rmdir(_chat_dir(chat_id))
+        except OSError:
+            pass  # Not empty yet
+
+def recent(chat_id, since: float) -> List[Tuple[int, int]]:
+    """Get the records of a chat from `since` on, oldest first"""
+    first_day = _day(since)
+    return [
+        (message_id, timestamp)
+        for day in buckets(chat_id) if day >= first_day
+        for message_id, timestamp in load_bucket(chat_id, day)
+        if timestamp >= since
+    ]
+
+def discard(chat_id, message_ids: Iterable[int]) -> None:
+    """Forget individual messages, e.g. after deleting them outside a cleanup run"""
+    message_ids = set(message_ids)
+    if not message_ids:
+        return
+    with _lock:
+        for day in buckets(chat_id):
+            records = load_bucket(chat_id, day)
+            kept = [(message_id, timestamp) for message_id, timestamp in records if message_id not in message_ids]
+            if len(kept) == len(records):
+                continue
+            path = _bucket_path(chat_id, day)
+            try:
+                if kept:
+                    with open(path + ".tmp", 'w', encoding='utf-8') as file:
+                        file.writelines(f"{message_id} {timestamp}\n" for message_id, timestamp in kept)
+                    os.replace(path + ".tmp", path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                logger.error(f"Could not rewrite ledger bucket {path}: {e}")
+
+def forget_chat(chat_id) -> None:
+    """Drop every record of a chat whose messages can no longer be deleted"""
+    with _lock:
+        shutil.rmtree(_chat_dir(chat_id), ignore_errors=True)
+
+def stats() -> Dict[str, int]:
+    """Count the chats and day buckets in the ledger"""
+    try:
+        chats = os.listdir(LEDGER_DIR)
+    except FileNotFoundError:
+        return {'chats': 0, 'buckets': 0}
+    return {'chats': len(chats), 'buckets': sum(len(buckets(chat_id)) for chat_id in chats)}
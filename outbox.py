@@ -0,0 +1,225 @@
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from telegram import ReplyMarkup
+from telegram.error import BadRequest, NetworkError
+import send_queue
+from config import OUTBOX_DIR, OUTBOX_RETRY_MIN, OUTBOX_RETRY_MAX, OUTBOX_MAX_AGE
+
+logger = logging.getLogger(__name__)
+
+# Fire-and-forget sends (reminders) go through the outbox. A send that fails
+# with a network error is written to OUTBOX_DIR/<id>.json and retried once
+# Telegram is reachable again: while it is not, one waiting entry at a time is
+# retried as a probe with exponential backoff, and the first probe that gets
+# through releases all the others. Each entry names a purpose whose callback
+# runs once its outcome is final, so e.g. a reminder is only marked delivered
+# after Telegram confirmed it, even across a restart.
+_cond = threading.Condition()
+_entries = {}  # Entry ID -> OutboxEntry, in flight or waiting
+_waiting = deque()  # Entries waiting for connectivity, oldest first
+_handlers = {}  # Purpose -> callback(entry, error or None)
+_ids = itertools.count(1)
+_bot = None
+_down = False  # Whether the last send failed with a network error
+_probe = None  # The entry in flight to find out whether Telegram is back
+_retry_at = 0.0
+_backoff = OUTBOX_RETRY_MIN
+_flusher = None
+
+class OutboxEntry:
+    """One API call waiting to be confirmed"""
+    
+    def __init__(self, entry_id: str, method: str, kwargs: Dict, priority: str, purpose: str = None,
+                 data: Any = None, created: float = None, persisted: bool = False):
+        self.id = entry_id
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.purpose = purpose
+        self.data = data
+        self.created = created or time.time()
+        self.persisted = persisted  # Whether its file exists in OUTBOX_DIR
+        self.attempts = 0
+    
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'method': self.method,
+            'kwargs': self.kwargs,
+            'priority': self.priority,
+            'purpose': self.purpose,
+            'data': self.data,
+            'created': self.created,
+        }
+
+def _path(entry_id: str) -> str:
+    return os.path.join(OUTBOX_DIR, f"{entry_id}.json")
+
+def _persist(entry: OutboxEntry) -> None:
+    """Atomically write an entry's file"""
+    os.makedirs(OUTBOX_DIR, exist_ok=True)
+    path = _path(entry.id)
+    with open(path + ".tmp", 'w', encoding='utf-8') as file:
+        json.dump(entry.to_dict(), file, ensure_ascii=False)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+    entry.persisted = True
+
+def _is_transient(error: Exception) -> bool:
+    """Check whether an error means Telegram was unreachable rather than that the call was rejected"""
+    return isinstance(error, NetworkError) and not isinstance(error, BadRequest)
+
+def register(purpose: str, callback: Callable[[OutboxEntry, Optional[Exception]], None]) -> None:
+    """Register the callback run with (entry, error or None) once an entry of this purpose is final"""
+    _handlers[purpose] = callback
+
+def send(method: str, priority: str = 'interactive', purpose: str = None, data: Any = None, **kwargs) -> OutboxEntry:
+    """Queue a bot API call that is retried across network outages
+    
+    `data` must be JSON serializable; it is handed back to the purpose's
+    callback. A reply_markup is stored as its JSON.
+    """
+    if isinstance(kwargs.get('reply_markup'), ReplyMarkup):
+        kwargs['reply_markup'] = kwargs['reply_markup'].to_json()
+    entry = OutboxEntry(f"{int(time.time() * 1000)}-{next(_ids)}", method, kwargs, priority, purpose, data)
+    with _cond:
+        _entries[entry.id] = entry
+        if _down:
+            # Don't add to the failures while a probe is finding out whether Telegram is back
+            try:
+                _persist(entry)
+            except OSError as e:
+                logger.error(f"Could not persist outbox entry {entry.id}: {e}")
+            _waiting.append(entry)
+            return entry
+    _submit(entry)
+    return entry
+
+def _submit(entry: OutboxEntry) -> None:
+    entry.attempts += 1
+    future = send_queue.submit(_bot.raw(entry.method), 'send', entry.priority, **entry.kwargs)
+    future.add_done_callback(lambda future: _on_result(entry, future))
+
+def _on_result(entry: OutboxEntry, future) -> None:
+    """Finish an entry, or park it until Telegram is reachable again"""
+    global _down, _probe, _retry_at, _backoff
+    error = future.exception()
+    with _cond:
+        was_probe = entry is _probe
+        if was_probe:
+            _probe = None
+        
+        if error is not None and _is_transient(error) and time.time() - entry.created < OUTBOX_MAX_AGE:
+            if not entry.persisted:
+                try:
+                    _persist(entry)
+                except OSError as e:
+                    logger.error(f"Could not persist outbox entry {entry.id}: {e}")
+            if was_probe or not _down:
+                # Still (or newly) unreachable: back off before the next probe
+                _backoff = _backoff * 2 if was_probe else OUTBOX_RETRY_MIN
+                _backoff = min(_backoff, OUTBOX_RETRY_MAX)
+                _retry_at = time.time() + _backoff
+                _down = True
+                logger.warning(f"Telegram unreachable ({error}), retrying outbox in {_backoff}s")
+            if was_probe:
+                _waiting.appendleft(entry)
+            else:
+                _waiting.append(entry)
+            _cond.notify_all()
+            return
+        
+        if was_probe or (_down and error is None):
+            # Reachable again: release everything that was waiting
+            _down = False
+            _backoff = OUTBOX_RETRY_MIN
+            _retry_at = 0.0
+            _cond.notify_all()
+        _entries.pop(entry.id, None)
+    
+    if entry.persisted:
+        try:
+            os.remove(_path(entry.id))
+        except OSError as e:
+            logger.error(f"Could not remove outbox entry {entry.id}: {e}")
+    handler = _handlers.get(entry.purpose)
+    if handler is not None:
+        try:
+            handler(entry, error)
+        except Exception as e:
+            logger.error(f"Outbox callback for {entry.purpose} failed: {e}")
+    elif error is not None:
+        logger.error(f"Outbox send {entry.method} to {entry.kwargs.get('chat_id')} failed: {error}")
+
+def _flusher_loop() -> None:
+    """Send a probe while Telegram is unreachable, and everything waiting once it is back"""
+    global _probe
+    while True:
+        with _cond:
+            while True:
+                now = time.time()
+                if _waiting and _probe is None and (not _down or now >= _retry_at):
+                    break
+                _cond.wait(_retry_at - now if _waiting and _down and _probe is None else None)
+            if _down:
+                _probe = _waiting.popleft()
+                batch = [_probe]
+            else:
+                batch = list(_waiting)
+                _waiting.clear()
+        if len(batch) > 1:
+            logger.info(f"Telegram reachable again, sending {len(batch)} outbox entries")
+        for entry in batch:
+            _submit(entry)
+
+def init(bot) -> None:
+    """Load the entries left from a previous run and start delivering them"""
+    global _bot, _flusher
+    _bot = bot
+    loaded = []
+    if os.path.isdir(OUTBOX_DIR):
+        for file_name in sorted(os.listdir(OUTBOX_DIR)):
+            if not file_name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(OUTBOX_DIR, file_name), 'r', encoding='utf-8') as file:
+                    record = json.load(file)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not load outbox entry {file_name}: {e}")
+                continue
+            loaded.append(OutboxEntry(
+                record['id'], record['method'], record['kwargs'], record['priority'],
+                record.get('purpose'), record.get('data'), record.get('created'), persisted=True
+            ))
+    with _cond:
+        for entry in loaded:
+            _entries[entry.id] = entry
+            _waiting.append(entry)
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flusher_loop, name="outbox", daemon=True)
+            _flusher.start()
+        _cond.notify_all()
+    if loaded:
+        logger.info(f"Loaded {len(loaded)} undelivered outbox entries")
+
+def pending(purpose: str) -> List[OutboxEntry]:
+    """Get the entries of a purpose that are not final yet"""
+    with _cond:
+        return [entry for entry in _entries.values() if entry.purpose == purpose]
+
+def stats() -> Dict[str, Any]:
+    """Get the outbox size and connectivity state"""
+    with _cond:
+        return {
+            'pending': len(_entries),
+            'waiting': len(_waiting),
+            'down': _down,
+            'retry_in': max(0.0, _retry_at - time.time()) if _down else 0.0,
+        }
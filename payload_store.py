@@ -0,0 +1,123 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import PAYLOAD_STORE_FILE, PAYLOAD_STORE_MAX, PAYLOAD_TTL
+
+logger = logging.getLogger(__name__)
+
+# Telegram caps callback_data at 64 bytes, so buttons that carry free text
+# (a message to add as a task, a category name) carry a reference instead:
+# '~' and a short key derived from the text. The texts live here, in an LRU
+# of at most PAYLOAD_STORE_MAX entries that expire PAYLOAD_TTL seconds after
+# their last use in a button. Every store is appended to PAYLOAD_STORE_FILE,
+# which is replayed at startup and rewritten once it holds mostly stale lines;
+# appends aren't fsynced, so a crash can only expire the newest buttons early.
+REF_MARKER = '~'
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # Key -> (payload, expiry), least recently used first
+_loaded = False
+_log_lines = 0  # Lines in PAYLOAD_STORE_FILE, live or stale
+
+def _key(payload: str) -> str:
+    """Derive the 11-character key of a payload, so storing the same text twice reuses it"""
+    digest = hashlib.blake2b(payload.encode('utf-8'), digest_size=8).digest()
+    return base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')
+
+def _ensure_loaded() -> None:
+    """Replay PAYLOAD_STORE_FILE on first use (caller holds _lock)"""
+    global _loaded, _log_lines
+    if _loaded:
+        return
+    _loaded = True
+    if not os.path.exists(PAYLOAD_STORE_FILE):
+        return
+    now = time.time()
+    try:
+        with open(PAYLOAD_STORE_FILE, 'r', encoding='utf-8') as file:
+            for line in file:
+                _log_lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A torn last line after a crash
+                if record['e'] > now:
+                    _entries.pop(record['k'], None)
+                    _entries[record['k']] = (record['p'], record['e'])
+    except OSError as e:
+        logger.error(f"Could not load {PAYLOAD_STORE_FILE}: {e}")
+    _evict(now)
+    logger.info(f"Loaded {len(_entries)} button payloads")
+
+def _evict(now: float) -> None:
+    """Drop expired entries and the least recently used beyond PAYLOAD_STORE_MAX (caller holds _lock)"""
+    for key in [key for key, (payload, expiry) in _entries.items() if expiry <= now]:
+        del _entries[key]
+    while len(_entries) > PAYLOAD_STORE_MAX:
+        _entries.popitem(last=False)
+
+def _compact() -> None:
+    """Rewrite PAYLOAD_STORE_FILE with only the live entries (caller holds _lock)"""
+    global _log_lines
+    _evict(time.time())
+    with open(PAYLOAD_STORE_FILE + ".tmp", 'w', encoding='utf-8') as file:
+        for key, (payload, expiry) in _entries.items():
+            file.write(json.dumps({'k': key, 'p': payload, 'e': expiry}, ensure_ascii=False) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(PAYLOAD_STORE_FILE + ".tmp", PAYLOAD_STORE_FILE)
+    _log_lines = len(_entries)
+
+def ref(payload: str) -> str:
+    """Store a payload and get the short reference to put in callback_data"""
+    global _log_lines
+    key = _key(payload)
+    expiry = time.time() + PAYLOAD_TTL
+    with _lock:
+        _ensure_loaded()
+        _entries.pop(key, None)
+        _entries[key] = (payload, expiry)
+        if len(_entries) > PAYLOAD_STORE_MAX:
+            _entries.popitem(last=False)
+        try:
+            with open(PAYLOAD_STORE_FILE, 'a', encoding='utf-8') as file:
+                file.write(json.dumps({'k': key, 'p': payload, 'e': expiry}, ensure_ascii=False) + "\n")
+            _log_lines += 1
+            if _log_lines > 2 * PAYLOAD_STORE_MAX:
+                _compact()
+        except OSError as e:
+            logger.error(f"Could not persist button payload {key}: {e}")
+    return REF_MARKER + key
+
+def resolve(value: str) -> Optional[str]:
+    """Get the payload a callback_data value refers to, or None if it expired
+    
+    Values without the reference marker are inline payloads from older
+    buttons and are returned as they are.
+    """
+    if not value.startswith(REF_MARKER):
+        return value
+    key = value[len(REF_MARKER):]
+    with _lock:
+        _ensure_loaded()
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        payload, expiry = entry
+        if expiry <= time.time():
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return payload
+
+def stats() -> Dict[str, int]:
+    """Count the stored payloads and the lines of their log"""
+    with _lock:
+        _ensure_loaded()
+        return {'entries': len(_entries), 'log_lines': _log_lines}
@@ -0,0 +1,121 @@
+import heapq
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Min-heap of (due time, chat ID, task ID). Entries are never removed in place;
+# _pending holds the live due time for each task and anything on the heap that
+# disagrees with it is stale and skipped when it reaches the top.
+_heap = []
+_pending = {}  # (chat ID, task ID) -> due time
+_lock = threading.Lock()
+
+# Called with the new earliest due time whenever it moves earlier
+_listener = None
+
+def set_listener(listener: Optional[Callable[[float], None]]) -> None:
+    """Register a callback for when the earliest pending reminder moves earlier"""
+    global _listener
+    _listener = listener
+
+def _reminder_time(task: Dict) -> Optional[float]:
+    """Get the reminder time of a task if it still needs to fire"""
+    if not task.get('active', True) or task.get('done', False) or task.get('reminded', False):
+        return None
+    try:
+        reminder = task.get('reminder')
+        return float(reminder) if reminder else None
+    except (TypeError, ValueError):
+        return None
+
+def schedule(chat_id, task_id: str, due_time: float) -> None:
+    """Add or move the reminder for a task"""
+    key = (str(chat_id), task_id)
+    with _lock:
+        _pending[key] = due_time
+        heapq.heappush(_heap, (due_time, key[0], task_id))
+        # The heap top may be a stale entry; only the exact new entry moves the wakeup
+        notify = _heap[0] == (due_time, key[0], task_id)
+    if notify and _listener is not None:
+        _listener(due_time)
+
+def cancel(chat_id, task_id: str) -> None:
+    """Drop the pending reminder for a task, if any"""
+    with _lock:
+        _pending.pop((str(chat_id), task_id), None)
+
+def sync_task(chat_id, task: Dict) -> None:
+    """Schedule or cancel a task's reminder to match its current state"""
+    task_id = task.get('id')
+    if task_id is None:
+        return
+    due_time = _reminder_time(task)
+    if due_time is None:
+        cancel(chat_id, task_id)
+    elif _pending.get((str(chat_id), task_id)) != due_time:
+        schedule(chat_id, task_id, due_time)
+
+def sync_chat(chat_id, tasks: List[Dict]) -> None:
+    """Resynchronize every reminder of a chat after its task list was replaced"""
+    chat_id_str = str(chat_id)
+    with _lock:
+        for key in [key for key in _pending if key[0] == chat_id_str]:
+            del _pending[key]
+    for task in tasks:
+        sync_task(chat_id_str, task)
+
+def rebuild(data: Dict) -> None:
+    """Rebuild the heap from all loaded chats"""
+    global _heap
+    with _lock:
+        _pending.clear()
+        for chat_id_str, chat_data in data.items():
+            for task in chat_data.get('tasks', []):
+                due_time = _reminder_time(task)
+                if due_time is not None and task.get('id') is not None:
+                    _pending[(chat_id_str, task['id'])] = due_time
+        _heap = [(due_time, key[0], key[1]) for key, due_time in _pending.items()]
+        heapq.heapify(_heap)
+    logger.info(f"Scheduled {len(_heap)} pending reminders")
+
+def _discard_stale() -> None:
+    """Pop stale entries off the top of the heap (caller holds _lock)"""
+    while _heap:
+        due_time, chat_id_str, task_id = _heap[0]
+        if _pending.get((chat_id_str, task_id)) == due_time:
+            return
+        heapq.heappop(_heap)
+
+def pop_due(now: float, window: float = 0) -> List[Tuple[str, str]]:
+    """Remove and return (chat ID, task ID) for every reminder due by now, earliest first
+    
+    Reminders due within `window` seconds after now are taken early, but only
+    in chats that already have one due, so they can share a digest message.
+    """
+    due = []
+    with _lock:
+        _discard_stale()
+        while _heap and _heap[0][0] <= now + window:
+            entry = heapq.heappop(_heap)
+            del _pending[(entry[1], entry[2])]
+            due.append(entry)
+            _discard_stale()
+        
+        chats_due = {chat_id_str for due_time, chat_id_str, _ in due if due_time <= now}
+        for entry in due:
+            if entry[1] not in chats_due:
+                _pending[(entry[1], entry[2])] = entry[0]
+                heapq.heappush(_heap, entry)
+    return [(chat_id_str, task_id) for _, chat_id_str, task_id in due if chat_id_str in chats_due]
+
+def next_due() -> Optional[float]:
+    """Get the time of the earliest pending reminder"""
+    with _lock:
+        _discard_stale()
+        return _heap[0][0] if _heap else None
+
+def pending_count() -> int:
+    """Get the number of pending reminders"""
+    return len(_pending)
@@ -0,0 +1,293 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+from config import (
+    SEND_WORKERS,
+    SEND_GLOBAL_RATE,
+    SEND_GLOBAL_BURST,
+    SEND_CHAT_RATE,
+    SEND_GROUP_RATE,
+    SEND_CHAT_BURST,
+    SEND_MAX_RETRIES,
+    SEND_CLASS_RESERVE,
+)
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second, holding at most `capacity`"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+    
+    def wait_time(self, now: float, reserve: float = 0) -> float:
+        """Get the seconds until a token is available while leaving `reserve` tokens untouched"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        needed = 1 + reserve
+        return 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+    
+    def take(self) -> None:
+        """Spend a token (call right after wait_time returned 0)"""
+        self.tokens -= 1
+    
+    def block(self, seconds: float, now: float) -> None:
+        """Hand out no tokens for the next `seconds`"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+    
+    def is_full(self, now: float) -> bool:
+        """Check whether the bucket is back at capacity, i.e. holds no state worth keeping"""
+        return self.wait_time(now) == 0 and self.tokens >= self.capacity
+
+class _Job:
+    """One queued API call"""
+    
+    def __init__(self, func: Callable, kwargs: Dict, kind: str, priority: str):
+        self.func = func
+        self.kwargs = kwargs
+        self.kind = kind
+        self.priority = priority
+        self.future = Future()
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+# Traffic classes, highest first. Workers always serve the highest class that
+# has a call ready, and lower classes leave SEND_CLASS_RESERVE global tokens
+# untouched so interactive replies find capacity even mid-broadcast.
+PRIORITIES = ('interactive', 'reminder', 'broadcast', 'maintenance')
+
+# Jobs wait in a FIFO per (class, chat), so calls of one class to one chat go
+# out in order, one at a time. A queue key is "scheduled" while it has a queue:
+# it then sits in exactly one of _ready, _delayed (waiting for its chat's rate
+# limit) or a worker.
+_cond = threading.Condition()
+_chat_queues = {}  # (class, chat key) -> deque of jobs
+_ready = {priority: deque() for priority in PRIORITIES}  # Keys whose next job may run now, round-robin
+_delayed = []  # Min-heap of (monotonic time, seq, queue key)
+_seq = itertools.count()
+_workers = []
+
+_global_bucket = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_BURST)
+_chat_buckets = {}  # Chat key -> TokenBucket
+_MAX_IDLE_BUCKETS = 10000
+
+_counters = {'sent': 0, 'retried': 0, 'failed': 0}
+_class_stats = {priority: {'started': 0, 'total_wait': 0.0, 'max_wait': 0.0} for priority in PRIORITIES}
+
+# Called with (chat ID, error or None) after every call that targeted a chat
+_result_listener = None
+# Called with the result of every successful 'send' call
+_sent_listener = None
+
+def set_result_listener(listener: Optional[Callable[[Any, Optional[Exception]], None]]) -> None:
+    """Register a callback for the outcome of each call to a chat"""
+    global _result_listener
+    _result_listener = listener
+
+def set_sent_listener(listener: Optional[Callable[[Any], None]]) -> None:
+    """Register a callback for every message sent through the queue"""
+    global _sent_listener
+    _sent_listener = listener
+
+def _report(job: _Job, error: Optional[Exception], result: Any = None) -> None:
+    """Pass a call's outcome to the listeners, which must never break the worker"""
+    if error is None and job.kind == 'send' and _sent_listener is not None:
+        try:
+            _sent_listener(result)
+        except Exception as e:
+            logger.error(f"Sent listener failed: {e}")
+    chat_id = job.kwargs.get('chat_id')
+    if _result_listener is None or chat_id is None:
+        return
+    try:
+        _result_listener(chat_id, error)
+    except Exception as e:
+        logger.error(f"Result listener failed for chat {chat_id}: {e}")
+
+def _chat_key(chat_id) -> str:
+    return str(chat_id) if chat_id is not None else ''
+
+def _chat_bucket(key: str, now: float) -> TokenBucket:
+    """Get the rate limiter of a chat (caller holds _cond)"""
+    bucket = _chat_buckets.get(key)
+    if bucket is None:
+        if len(_chat_buckets) >= _MAX_IDLE_BUCKETS:
+            busy = {chat_key for _, chat_key in _chat_queues}
+            for idle_key in [k for k, b in _chat_buckets.items() if k not in busy and b.is_full(now)]:
+                del _chat_buckets[idle_key]
+        # Groups and channels (negative IDs, @usernames) have a much lower per-chat limit
+        rate = SEND_GROUP_RATE if key.startswith(('-', '@')) else SEND_CHAT_RATE
+        bucket = _chat_buckets[key] = TokenBucket(rate, SEND_CHAT_BURST)
+    return bucket
+
+def _start_workers() -> None:
+    """Start the sender threads on first use (caller holds _cond)"""
+    while len(_workers) < SEND_WORKERS:
+        worker = threading.Thread(target=_worker_loop, name=f"send-worker-{len(_workers)}", daemon=True)
+        _workers.append(worker)
+        worker.start()
+
+def submit(func: Callable, kind: str = 'send', priority: str = 'interactive', **kwargs) -> Future:
+    """Queue func(**kwargs) and return a Future for its result
+    
+    Calls are rate limited and ordered by their `chat_id` argument. `kind` is
+    'send', 'edit' or 'delete'; deletions only count against the global limit,
+    since Telegram's per-chat limit is about posting messages. `priority` is
+    one of PRIORITIES.
+    """
+    if priority not in _ready:
+        raise ValueError(f"Unknown send priority: {priority}")
+    job = _Job(func, kwargs, kind, priority)
+    key = (priority, _chat_key(kwargs.get('chat_id')))
+    with _cond:
+        _start_workers()
+        queue = _chat_queues.get(key)
+        if queue is None:
+            queue = _chat_queues[key] = deque()
+            _ready[priority].append(key)
+        queue.append(job)
+        _cond.notify()
+    return job.future
+
+def call(func: Callable, kind: str = 'send', priority: str = 'interactive', **kwargs) -> Any:
+    """Queue func(**kwargs) and wait for its result, raising whatever the call raised"""
+    return submit(func, kind, priority, **kwargs).result()
+
+def _next_job() -> Tuple[Tuple[str, str], _Job]:
+    """Wait until the best ready job is within both rate limits and take it (caller holds _cond)"""
+    while True:
+        now = time.monotonic()
+        while _delayed and _delayed[0][0] <= now:
+            key = heapq.heappop(_delayed)[2]
+            _ready[key[0]].append(key)
+        
+        priority = next((priority for priority in PRIORITIES if _ready[priority]), None)
+        if priority is not None:
+            # Lower classes need more tokens left over, so if the best class
+            # has to wait, everything does
+            wait = _global_bucket.wait_time(now, SEND_CLASS_RESERVE.get(priority, 0))
+            if wait <= 0:
+                key = _ready[priority].popleft()
+                job = _chat_queues[key][0]
+                bucket = _chat_bucket(key[1], now) if job.kind != 'delete' else None
+                chat_wait = bucket.wait_time(now) if bucket is not None else 0
+                if chat_wait > 0:
+                    heapq.heappush(_delayed, (now + chat_wait, next(_seq), key))
+                    continue
+                _global_bucket.take()
+                if bucket is not None:
+                    bucket.take()
+                _chat_queues[key].popleft()
+                
+                waited = now - job.queued_at
+                class_stats = _class_stats[priority]
+                class_stats['started'] += 1
+                class_stats['total_wait'] += waited
+                class_stats['max_wait'] = max(class_stats['max_wait'], waited)
+                return key, job
+        else:
+            wait = _delayed[0][0] - now if _delayed else None
+        _cond.wait(wait)
+
+def _finish(key: Tuple[str, str], outcome: str, job: _Job = None, retry_after: float = None) -> None:
+    """Reschedule a chat after one of its jobs ran, putting `job` back first when it must be retried"""
+    with _cond:
+        _counters[outcome] += 1
+        queue = _chat_queues[key]
+        if retry_after is not None:
+            now = time.monotonic()
+            queue.appendleft(job)
+            _chat_bucket(key[1], now).block(retry_after, now)
+            heapq.heappush(_delayed, (now + retry_after, next(_seq), key))
+        elif queue:
+            _ready[key[0]].append(key)
+        else:
+            del _chat_queues[key]
+        _cond.notify()
+
+def _worker_loop() -> None:
+    # Listeners hear of an outcome before the future resolves, so callbacks on
+    # the future (the outbox's) already see the chat's updated liveness
+    while True:
+        with _cond:
+            key, job = _next_job()
+        try:
+            result = job.func(**job.kwargs)
+        except RetryAfter as e:
+            if job.attempts < SEND_MAX_RETRIES:
+                job.attempts += 1
+                logger.warning(f"Flood control for chat {key[1] or '-'}, retrying in {e.retry_after}s")
+                _finish(key, 'retried', job, retry_after=float(e.retry_after))
+                continue
+            _finish(key, 'failed')
+            _report(job, e)
+            job.future.set_exception(e)
+        except Exception as e:
+            _finish(key, 'failed')
+            _report(job, e)
+            job.future.set_exception(e)
+        else:
+            _finish(key, 'sent')
+            _report(job, None, result)
+            job.future.set_result(result)
+
+def stats() -> Dict[str, Any]:
+    """Get delivery counters, plus queue depth and wait times per class"""
+    with _cond:
+        classes = {}
+        for priority in PRIORITIES:
+            class_stats = _class_stats[priority]
+            started = class_stats['started']
+            classes[priority] = {
+                'queued': sum(len(queue) for key, queue in _chat_queues.items() if key[0] == priority),
+                'started': started,
+                'avg_wait': class_stats['total_wait'] / started if started else 0.0,
+                'max_wait': class_stats['max_wait'],
+            }
+        return dict(_counters, queued=sum(c['queued'] for c in classes.values()), classes=classes)
+
+class QueuedBot(ExtBot):
+    """Bot whose sends, edits and deletions all go through the outbound queue
+    
+    Callers still block until their own call completes, so handler code is
+    unchanged; these calls are interactive. Bulk jobs use submit() with the
+    raw methods and their own class to keep many calls in flight.
+    """
+    
+    __slots__ = ()
+    
+    def send_message(self, chat_id, text, **kwargs):
+        return call(super().send_message, chat_id=chat_id, text=text, **kwargs)
+    
+    def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        return call(super().edit_message_text, 'edit', text=text, chat_id=chat_id, message_id=message_id, **kwargs)
+    
+    def delete_message(self, chat_id, message_id, **kwargs):
+        return call(super().delete_message, 'delete', chat_id=chat_id, message_id=message_id, **kwargs)
+    
+    def delete_messages(self, chat_id, message_ids, **kwargs):
+        return call(self._delete_messages, 'delete', chat_id=chat_id, message_ids=message_ids, **kwargs)
+    
+    def _delete_messages(self, chat_id, message_ids, timeout=None, api_kwargs=None):
+        """Delete up to 100 messages of a chat in one deleteMessages call, which this library predates"""
+        data = {'chat_id': chat_id, 'message_ids': list(message_ids)}
+        return self._post('deleteMessages', data, timeout=timeout, api_kwargs=api_kwargs)
+    
+    def raw(self, method: str) -> Callable:
+        """Get the unqueued API method, for passing to submit()"""
+        if method == 'delete_messages':
+            return self._delete_messages
+        return getattr(super(), method)
@@ -0,0 +1,175 @@
+import json
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Any, Tuple, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Shared connection; the flusher thread and handlers both use it
+_conn = None
+_lock = threading.Lock()
+
+# Chats hold everything except the task list as JSON. Tasks are one row each,
+# keyed by (chat_id, position) so the primary key doubles as the chat_id index,
+# with the fields we filter and aggregate on pulled out into indexed columns.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id TEXT PRIMARY KEY,
+    type TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    chat_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    active INTEGER NOT NULL DEFAULT 1,
+    due_date REAL,
+    reminder REAL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (chat_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_chats_type ON chats(type);
+CREATE INDEX IF NOT EXISTS idx_tasks_due_date ON tasks(due_date);
+CREATE INDEX IF NOT EXISTS idx_tasks_reminder ON tasks(reminder);
+CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(active, done);
+"""
+
+UPSERT_CHAT = "INSERT OR REPLACE INTO chats (chat_id, type, data) VALUES (?, ?, ?)"
+UPSERT_TASK = ("INSERT OR REPLACE INTO tasks (chat_id, position, done, active, due_date, reminder, data) "
+               "VALUES (?, ?, ?, ?, ?, ?, ?)")
+DELETE_TASKS = "DELETE FROM tasks WHERE chat_id = ?"
+
+def open_store(path: str, readonly: bool = False) -> None:
+    """Open (and create if needed) the SQLite database, or open an existing one read-only"""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            return
+        if readonly:
+            _conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False, isolation_level=None)
+            logger.info(f"Opened SQLite store {path} read-only")
+            return
+        _conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(SCHEMA)
+    logger.info(f"Opened SQLite store {path}")
+
+def is_open() -> bool:
+    """Check whether the store has been opened in this process"""
+    return _conn is not None
+
+def close_store() -> None:
+    """Close the SQLite database"""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+
+def is_empty() -> bool:
+    """Check whether the store holds no chats yet"""
+    with _lock:
+        return _conn.execute("SELECT 1 FROM chats LIMIT 1").fetchone() is None
+
+def load_all() -> Dict:
+    """Load every chat with its tasks into the in-memory layout database.py uses"""
+    data = {}
+    with _lock:
+        for chat_id, chat_json in _conn.execute("SELECT chat_id, data FROM chats"):
+            chat_data = json.loads(chat_json)
+            chat_data['tasks'] = []
+            data[chat_id] = chat_data
+        rows = _conn.execute("SELECT chat_id, data FROM tasks ORDER BY chat_id, position")
+        for chat_id, task_json in rows:
+            if chat_id in data:
+                data[chat_id]['tasks'].append(json.loads(task_json))
+    logger.info(f"Loaded data for {len(data)} chats from SQLite")
+    return data
+
+def _number(value) -> Any:
+    """Coerce a timestamp field to a float for the indexed columns"""
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _chat_row(chat_id_str: str, chat_data: Dict) -> Tuple:
+    """Build the chats row for a chat (everything except its tasks)"""
+    meta = {key: value for key, value in chat_data.items() if key != 'tasks'}
+    return (chat_id_str, chat_data.get('type'), json.dumps(meta, ensure_ascii=False))
+
+def _task_row(chat_id_str: str, position: int, task: Dict) -> Tuple:
+    """Build the tasks row for a single task"""
+    return (
+        chat_id_str,
+        position,
+        1 if task.get('done', False) else 0,
+        1 if task.get('active', True) else 0,
+        _number(task.get('due_date')),
+        _number(task.get('reminder')),
+        json.dumps(task, ensure_ascii=False),
+    )
+
+def chat_statements(chat_id_str: str, chat_data: Dict) -> List[Tuple[str, Tuple]]:
+    """Statements that rewrite a whole chat, tasks included"""
+    statements = [(DELETE_TASKS, (chat_id_str,)), (UPSERT_CHAT, _chat_row(chat_id_str, chat_data))]
+    for position, task in enumerate(chat_data.get('tasks', [])):
+        statements.append((UPSERT_TASK, _task_row(chat_id_str, position, task)))
+    return statements
+
+def meta_statement(chat_id_str: str, chat_data: Dict) -> Tuple[str, Tuple]:
+    """Statement that updates a chat's row without touching its tasks"""
+    return (UPSERT_CHAT, _chat_row(chat_id_str, chat_data))
+
+def task_statement(chat_id_str: str, position: int, task: Dict) -> Tuple[str, Tuple]:
+    """Statement that updates a single task row"""
+    return (UPSERT_TASK, _task_row(chat_id_str, position, task))
+
+def execute(statements: Iterable[Tuple[str, Tuple]]) -> None:
+    """Run prepared statements in a single transaction"""
+    with _lock:
+        _conn.execute("BEGIN")
+        try:
+            for sql, params in statements:
+                _conn.execute(sql, params)
+            _conn.execute("COMMIT")
+        except Exception:
+            _conn.execute("ROLLBACK")
+            raise
+
+def import_data(data: Dict) -> None:
+    """Bulk load chats from the JSON layout"""
+    statements = []
+    for chat_id_str, chat_data in data.items():
+        statements.extend(chat_statements(chat_id_str, chat_data))
+    execute(statements)
+    logger.info(f"Imported {len(data)} chats into SQLite")
+
+def aggregate_stats() -> Dict[str, Any]:
+    """Compute the get_stats() counters with aggregate queries"""
+    with _lock:
+        chats = _conn.execute(
+            "SELECT COUNT(*), "
+            "COALESCE(SUM(type = 'user'), 0), "
+            "COALESCE(SUM(type IN ('group', 'supergroup')), 0), "
+            "COALESCE(SUM(json_extract(data, '$.archive.tasks')), 0), "
+            "COALESCE(SUM(json_extract(data, '$.archive.completed')), 0) "
+            "FROM chats"
+        ).fetchone()
+        tasks = _conn.execute(
+            "SELECT COUNT(*), "
+            "COALESCE(SUM(active = 1 AND done = 0), 0), "
+            "COALESCE(SUM(active = 1 AND done = 1), 0) "
+            "FROM tasks"
+        ).fetchone()
+    return {
+        'total_chats': chats[0],
+        'total_users': chats[1],
+        'total_groups': chats[2],
+        # Archived tasks only survive as counters on their chat
+        'total_tasks': tasks[0] + chats[3],
+        'active_tasks': tasks[1],
+        'completed_tasks': tasks[2] + chats[4],
+    }
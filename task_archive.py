@@ -0,0 +1,44 @@
+import json
+import logging
+import os
+from typing import Dict, List
+from config import ARCHIVE_DIR
+
+logger = logging.getLogger(__name__)
+
+def archive_path(chat_id) -> str:
+    """Get the path of a chat's archive file"""
+    return os.path.join(ARCHIVE_DIR, f"{chat_id}.jsonl")
+
+def append_tasks(chat_id, tasks: List[Dict]) -> None:
+    """Append tasks to a chat's archive, one JSON object per line"""
+    if not tasks:
+        return
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    lines = [json.dumps(task, ensure_ascii=False, separators=(',', ':')) for task in tasks]
+    with open(archive_path(chat_id), 'a', encoding='utf-8') as file:
+        file.write("\n".join(lines) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+def load_tasks(chat_id) -> List[Dict]:
+    """Load every archived task of a chat, oldest first"""
+    path = archive_path(chat_id)
+    if not os.path.exists(path):
+        return []
+
+    # A task archived twice (crash between the append and the hot store write)
+    # keeps its latest copy
+    tasks = {}
+    with open(path, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                task = json.loads(line)
+            except ValueError as e:
+                logger.warning(f"Skipping unreadable line {line_number} in {path}: {e}")
+                continue
+            tasks[task.get('id') or f"line-{line_number}"] = task
+    return list(tasks.values())
@@ -0,0 +1,143 @@
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+from task_search import SearchIndex
+
+def _due_time(task: Dict) -> Optional[float]:
+    """Get a task's due date as a timestamp, or None if it has none"""
+    try:
+        due_date = task.get('due_date')
+        return float(due_date) if due_date else None
+    except (TypeError, ValueError):
+        return None
+
+class ChatIndex:
+    """Constant-time lookups over one chat's task list
+    
+    Besides ID -> task, it keeps secondary indexes that mutations refresh:
+    a sorted (due time, position) list and priority buckets over open tasks
+    (active and not done), and category buckets over every task. The full-text
+    search index over active tasks is only built on the first search.
+    """
+
+    def __init__(self, tasks: List[Dict]):
+        self.tasks = tasks
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        """Rebuild every lookup from the task list"""
+        self.by_id = {}
+        self.positions = {}
+        self.open_ids = set()
+        self.due = []  # Sorted (due time, position) of open tasks
+        self.by_priority = {}
+        self.by_category = {}
+        self.indexed = {}  # Task ID -> (open, due time, priority, category) as last indexed
+        self.search_index = None
+        for position, task in enumerate(self.tasks):
+            self._add(position, task)
+        self.size = len(self.tasks)
+
+    def _add(self, position: int, task: Dict) -> None:
+        task_id = task.get('id')
+        if task_id is None:
+            return
+        self.by_id[task_id] = task
+        self.positions[task_id] = position
+        self._index(task_id, task)
+    
+    def _index(self, task_id: str, task: Dict) -> None:
+        """Add a task to the secondary indexes according to its current fields"""
+        is_open = task.get('active', True) and not task.get('done', False)
+        due_time = _due_time(task) if is_open else None
+        priority = task.get('priority') if is_open else None
+        category = task.get('category')
+        position = self.positions[task_id]
+        
+        if is_open:
+            self.open_ids.add(task_id)
+        if due_time is not None:
+            insort(self.due, (due_time, position))
+        if priority is not None:
+            self.by_priority.setdefault(priority, set()).add(task_id)
+        if category is not None:
+            self.by_category.setdefault(category, set()).add(task_id)
+        self.indexed[task_id] = (is_open, due_time, priority, category)
+        if self.search_index is not None and task.get('active', True):
+            self.search_index.add(task_id, task)
+    
+    def _unindex(self, task_id: str) -> None:
+        """Remove a task from the secondary indexes using what was last indexed"""
+        is_open, due_time, priority, category = self.indexed.pop(task_id)
+        position = self.positions[task_id]
+        
+        self.open_ids.discard(task_id)
+        if self.search_index is not None:
+            self.search_index.remove(task_id)
+        if due_time is not None:
+            i = bisect_left(self.due, (due_time, position))
+            if i < len(self.due) and self.due[i] == (due_time, position):
+                del self.due[i]
+        for buckets, key in ((self.by_priority, priority), (self.by_category, category)):
+            if key is not None and key in buckets:
+                buckets[key].discard(task_id)
+                if not buckets[key]:
+                    del buckets[key]
+
+    def add(self, position: int, task: Dict) -> None:
+        """Index a task that was just appended to the list"""
+        self._add(position, task)
+        self.size = len(self.tasks)
+    
+    def refresh(self, task: Dict) -> None:
+        """Re-index a task after its fields changed"""
+        task_id = task.get('id')
+        if task_id not in self.indexed:
+            return
+        self._unindex(task_id)
+        self._index(task_id, task)
+
+    def is_current(self, tasks: List[Dict]) -> bool:
+        """Check whether the index still describes the given task list"""
+        return tasks is self.tasks and len(tasks) == self.size
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        """Get a task by its ID"""
+        return self.by_id.get(task_id)
+
+    def position(self, task_id: str) -> Optional[int]:
+        """Get the position of a task in the chat's task list"""
+        return self.positions.get(task_id)
+
+    def _in_list_order(self, task_ids) -> List[Dict]:
+        """Get tasks by ID in the order they appear in the task list"""
+        return [self.by_id[task_id] for task_id in sorted(task_ids, key=self.positions.__getitem__)]
+    
+    def open_count(self) -> int:
+        """Get the number of open tasks"""
+        return len(self.open_ids)
+    
+    def due_between(self, start: float, end: float) -> List[Dict]:
+        """Get open tasks due in [start, end), in list order"""
+        lo = bisect_left(self.due, (start, -1))
+        hi = bisect_left(self.due, (end, -1))
+        return [self.tasks[position] for position in sorted(position for _, position in self.due[lo:hi])]
+    
+    def with_priority(self, priority: str) -> List[Dict]:
+        """Get open tasks with the given priority, in list order"""
+        return self._in_list_order(self.by_priority.get(priority, ()))
+    
+    def search(self, query: str) -> List[Tuple[int, Dict]]:
+        """Get (score, task) for active tasks matching every query term, best first"""
+        if self.search_index is None:
+            self.search_index = SearchIndex()
+            for task_id, task in self.by_id.items():
+                if task.get('active', True):
+                    self.search_index.add(task_id, task)
+        results = self.search_index.search(query)
+        # Equal scores keep list order
+        results.sort(key=lambda item: (-item[0], self.positions[item[1]]))
+        return [(score, self.by_id[task_id]) for score, task_id in results]
+    
+    def categories(self) -> List[str]:
+        """Get the categories used by any task"""
+        return [category for category in self.by_category if category]
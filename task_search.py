@@ -0,0 +1,84 @@
+import re
+from bisect import bisect_left, insort
+from typing import Dict, List, Tuple
+
+# How much a query term matching each field counts towards a task's rank
+FIELD_WEIGHTS = {'text': 3, 'category': 2, 'notes': 1}
+EXACT_BONUS = 2  # Whole-token matches rank above prefix matches
+
+_TOKEN_RE = re.compile(r'\w+')
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens"""
+    return _TOKEN_RE.findall(str(text or '').lower())
+
+def task_terms(task: Dict) -> Dict[str, int]:
+    """Get each token of a task's searchable fields with its best field weight"""
+    terms = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(task.get(field)):
+            if weight > terms.get(token, 0):
+                terms[token] = weight
+    return terms
+
+class SearchIndex:
+    """Inverted index from tokens to task IDs with prefix lookup over a sorted vocabulary"""
+    
+    def __init__(self):
+        self.postings = {}  # Token -> set of task IDs
+        self.vocabulary = []  # Sorted tokens, for prefix ranges
+        self.terms = {}  # Task ID -> {token: weight}
+    
+    def add(self, task_id: str, task: Dict) -> None:
+        """Index a task's searchable fields"""
+        terms = task_terms(task)
+        self.terms[task_id] = terms
+        for token in terms:
+            if token not in self.postings:
+                self.postings[token] = set()
+                insort(self.vocabulary, token)
+            self.postings[token].add(task_id)
+    
+    def remove(self, task_id: str) -> None:
+        """Drop a task from the index"""
+        for token in self.terms.pop(task_id, {}):
+            task_ids = self.postings.get(token)
+            if task_ids is None:
+                continue
+            task_ids.discard(task_id)
+            if not task_ids:
+                del self.postings[token]
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+    
+    def _expand(self, prefix: str) -> List[str]:
+        """Get every indexed token starting with prefix"""
+        start = bisect_left(self.vocabulary, prefix)
+        end = start
+        while end < len(self.vocabulary) and self.vocabulary[end].startswith(prefix):
+            end += 1
+        return self.vocabulary[start:end]
+    
+    def search(self, query: str) -> List[Tuple[int, str]]:
+        """Get (score, task ID) for tasks matching every query term, in no particular order"""
+        query_terms = tokenize(query)
+        if not query_terms:
+            return []
+        
+        scores = None
+        for term in query_terms:
+            term_scores = {}
+            for token in self._expand(term):
+                bonus = EXACT_BONUS if token == term else 1
+                for task_id in self.postings[token]:
+                    score = self.terms[task_id][token] * bonus
+                    if score > term_scores.get(task_id, 0):
+                        term_scores[task_id] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                # AND: keep only tasks that matched every term so far
+                scores = {task_id: scores[task_id] + score
+                          for task_id, score in term_scores.items() if task_id in scores}
+            if not scores:
+                return []
+        return [(score, task_id) for task_id, score in scores.items()]
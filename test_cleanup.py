@@ -8,7 +8,9 @@ import os
 import logging
 import argparse
 from auto_cleanup import clean_old_messages
-from config import TELEGRAM_TOKEN
+from database import load_database_readonly
+import cleanup_planner
+from config import TELEGRAM_TOKEN, CLEANUP_CALL_RATE
 
 # Set up logging
 logging.basicConfig(
@@ -22,6 +24,39 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+def format_duration(seconds):
+    """Format an estimated duration like 1h 05m or 42s"""
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+def dry_run(default_days_old):
+    """Report per chat how many messages are due for deletion and roughly how long deleting them takes"""
+    plan = cleanup_planner.plan_cleanup(default_days_old)
+    
+    logger.info(f"Dry run with default days={default_days_old}, estimating {CLEANUP_CALL_RATE} calls per second")
+    logger.info(f"{plan['groups']} groups checked, {plan['skipped']} skipped, {len(plan['chats'])} with messages due")
+    
+    # Heaviest chats first
+    for chat_id, chat_plan in sorted(plan['chats'].items(), key=lambda item: -item[1]['messages']):
+        logger.info(
+            f"Chat {chat_id}: {chat_plan['messages']} messages in {len(chat_plan['days'])} days "
+            f"({chat_plan['days'][0]} to {chat_plan['days'][-1]}), "
+            f"{chat_plan['calls']} calls, ~{format_duration(chat_plan['seconds'])}"
+        )
+    
+    logger.info(
+        f"Total: {plan['messages']} messages, {plan['calls']} calls, ~{format_duration(plan['seconds'])} "
+        f"of deletion time"
+    )
+    slices = cleanup_planner.slices_left()
+    budget = cleanup_planner.slice_budget(plan)
+    if budget:
+        logger.info(f"Scheduled: {slices} slices left today, the next one making up to {budget} calls")
+
 def main():
     """Run a test cleanup with optional days parameter"""
     parser = argparse.ArgumentParser(description='Test the auto-cleanup functionality.')
@@ -29,6 +64,8 @@ def main():
                         help='Default number of days for chats without settings (default: 7)')
     parser.add_argument('--debug', action='store_true',
                         help='Enable debug logging')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only report what would be deleted and how long it would take')
     
     args = parser.parse_args()
     
@@ -38,6 +75,14 @@ def main():
             handler.setLevel(logging.DEBUG)
         logger.debug("Debug logging enabled")
     
+    # The cleanup reads chat settings from the database; the bot may be running
+    # and owns its files, so load them without taking over the writer's role
+    load_database_readonly()
+    
+    if args.dry_run:
+        dry_run(args.days)
+        return
+    
     # Get token from environment variable or config
     token = TELEGRAM_TOKEN
     
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+"""
+Test script for the /devstats text of TaskMaster Pro
+"""
+import re
+from handlers import format_button_stats
+
+def markup_outside_code(text):
+    """Find the Markdown (v1) entity characters outside code spans, which Telegram parses as italics or bold"""
+    outside_code = re.sub(r"`[^`]*`", "", text)
+    return [char for char in "_*" if char in outside_code]
+
+def test_button_stats_with_underscored_routes():
+    """Route patterns with underscores must not break the Markdown of the stats message"""
+    route_stats = [
+        {'pattern': 'add_task:', 'calls': 3, 'errors': 0, 'avg_time': 0.012, 'max_time': 0.02, 'total_time': 0.036},
+        {'pattern': 'confirm_delbroadcast:', 'calls': 1, 'errors': 1, 'avg_time': 0.2, 'max_time': 0.2, 'total_time': 0.2},
+    ]
+    text = format_button_stats(route_stats)
+    assert "`add_task:` 3x 12ms" in text, text
+    assert "`confirm_delbroadcast:` 1x 200ms (1 errors)" in text, text
+    assert not markup_outside_code(text), text
+
+def main():
+    """Run the tests in this file"""
+    test_button_stats_with_underscored_routes()
+    print("All devstats tests passed")
+
+if __name__ == "__main__":
+    main()
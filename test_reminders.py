@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Test script for reminder delivery in TaskMaster Pro
+"""
+import os
+import tempfile
+import time
+from telegram.error import Unauthorized
+
+class FailingBot:
+    """Stands in for the bot; every call fails as if the bot was blocked"""
+    
+    def raw(self, method):
+        def call(**kwargs):
+            raise Unauthorized("Forbidden: bot was blocked by the user")
+        return call
+
+def test_blocked_reminder_stays_unreminded():
+    """A reminder that fails with Unauthorized leaves its task unreminded for when the chat comes back"""
+    os.chdir(tempfile.mkdtemp())
+    # Imported here so their data files land in the scratch directory
+    import bot
+    import chat_registry
+    import database
+    import outbox
+    import send_queue
+    
+    database.initialize_database()
+    send_queue.set_result_listener(chat_registry.record_result)
+    outbox.register('reminder', bot.reminder_delivered)
+    outbox.init(FailingBot())
+    
+    chat_id = 4242
+    database.get_chat_data(chat_id)
+    task = database.add_task(chat_id, "Water the plants")
+    now = time.time()
+    database.set_reminder(chat_id, task['id'], now - 1)
+    
+    for due_chat_id, tasks in bot.take_due_reminders(now).items():
+        bot.send_reminders(None, due_chat_id, tasks)
+    deadline = time.time() + 5
+    while outbox.pending('reminder') and time.time() < deadline:
+        time.sleep(0.05)
+    
+    assert not outbox.pending('reminder'), "reminder was never delivered or failed"
+    assert not chat_registry.is_alive(chat_id), "blocked chat was not marked dead"
+    assert not database.get_task(chat_id, task['id']).get('reminded'), "undelivered reminder was marked reminded"
+
+def main():
+    """Run the tests in this file"""
+    test_blocked_reminder_stays_unreminded()
+    print("All reminder tests passed")
+
+if __name__ == "__main__":
+    main()
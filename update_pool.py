@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+from telegram import Update
+from telegram.ext import Dispatcher
+from config import UPDATE_WORKERS, UPDATE_DRAIN_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Incoming updates wait in a FIFO per chat and a chat is handled by at most one
+# worker at a time, so updates within a chat run strictly in order while
+# different chats run in parallel. A chat key with a queue is in _ready or
+# being handled by a worker, never both.
+_cond = threading.Condition()
+_chat_queues = {}  # Chat key -> deque of (update, monotonic time queued)
+_ready = deque()  # Chat keys whose next update may run now, round-robin
+_active = 0  # Chats being handled right now
+_workers = []
+
+_counters = {'processed': 0, 'failed': 0, 'total_latency': 0.0, 'max_latency': 0.0, 'max_depth': 0}
+
+def _chat_key(update: object) -> str:
+    """Get the ordering key of an update: its chat, else its user, else its own key"""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return str(update.effective_chat.id)
+        if update.effective_user is not None:
+            return f"user:{update.effective_user.id}"
+    return ''
+
+def _start_workers(dispatcher: Dispatcher) -> None:
+    """Start the update threads on first use (caller holds _cond)"""
+    while len(_workers) < UPDATE_WORKERS:
+        worker = threading.Thread(target=_worker_loop, args=(dispatcher,), name=f"update-worker-{len(_workers)}", daemon=True)
+        _workers.append(worker)
+        worker.start()
+
+def submit(dispatcher: Dispatcher, update: object) -> None:
+    """Queue an update to be processed after the earlier updates of its chat"""
+    key = _chat_key(update)
+    with _cond:
+        _start_workers(dispatcher)
+        queue = _chat_queues.get(key)
+        if queue is None:
+            queue = _chat_queues[key] = deque()
+            _ready.append(key)
+        queue.append((update, time.monotonic()))
+        _counters['max_depth'] = max(_counters['max_depth'], len(queue))
+        _cond.notify_all()  # drain() waits on the same condition
+
+def _worker_loop(dispatcher: Dispatcher) -> None:
+    global _active
+    while True:
+        with _cond:
+            while not _ready:
+                _cond.wait()
+            key = _ready.popleft()
+            update, queued_at = _chat_queues[key].popleft()
+            _active += 1
+        
+        failed = False
+        try:
+            Dispatcher.process_update(dispatcher, update)
+        except Exception as e:
+            # process_update reports handler errors itself; this is a last resort
+            logger.error(f"Update processing for chat {key or '-'} failed: {e}")
+            failed = True
+        latency = time.monotonic() - queued_at
+        
+        with _cond:
+            _active -= 1
+            _counters['failed' if failed else 'processed'] += 1
+            _counters['total_latency'] += latency
+            _counters['max_latency'] = max(_counters['max_latency'], latency)
+            if _chat_queues[key]:
+                _ready.append(key)
+            else:
+                del _chat_queues[key]
+            _cond.notify_all()
+
+def drain(timeout: float) -> bool:
+    """Wait up to timeout seconds for every queued update to finish, returning whether they did"""
+    deadline = time.monotonic() + timeout
+    with _cond:
+        while _chat_queues:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _cond.wait(remaining)
+    return True
+
+def stats() -> Dict[str, Any]:
+    """Get queue depth, parallelism and latency counters"""
+    with _cond:
+        handled = _counters['processed'] + _counters['failed']
+        return {
+            'queued': sum(len(queue) for queue in _chat_queues.values()),
+            'chats': len(_chat_queues),
+            'active': _active,
+            'workers': len(_workers),
+            'processed': _counters['processed'],
+            'failed': _counters['failed'],
+            'avg_latency': _counters['total_latency'] / handled if handled else 0.0,
+            'max_latency': _counters['max_latency'],
+            'max_depth': _counters['max_depth'],
+        }
+
+class PooledDispatcher(Dispatcher):
+    """Dispatcher that hands each update to the per-chat worker pool instead of handling it inline
+    
+    Handlers, error handlers and persistence work as before; they just run on
+    the pool's threads.
+    """
+    
+    __slots__ = ()
+    
+    def process_update(self, update: object) -> None:
+        submit(self, update)
+    
+    def stop(self) -> None:
+        super().stop()
+        if not drain(UPDATE_DRAIN_TIMEOUT):
+            logger.warning(f"Stopped with {stats()['queued']} updates still queued")